@@ -11,20 +11,22 @@ from scipy import stats
 from sklearn.metrics import confusion_matrix, precision_score, recall_score, f1_score
 import os
 
+from storage import PROCESSED_DIR, SYNTHETIC_DIR, read_dataset
+
 # Set style
 sns.set_style("whitegrid")
 plt.rcParams['figure.figsize'] = (12, 8)
 
 def load_data(city):
     """Load quarterly forecast-claims data"""
-    file_path = f'/Users/giulio/portfolio1-norway/data/processed/{city.lower()}_quarterly_forecasts_2014-2021.csv'
+    file_path = f'{PROCESSED_DIR}/quarterly_forecasts'
 
-    if not os.path.exists(file_path):
-        print(f"ERROR: Processed data not found: {file_path}")
+    if not os.path.exists(f'{file_path}/city={city.lower()}'):
+        print(f"ERROR: Processed data not found: {file_path}/city={city.lower()}")
         print("Run process_forecasts.py first.")
         return None
 
-    df = pd.read_csv(file_path)
+    df = read_dataset(file_path, filters=[('city', '=', city.lower())])
     print(f"✓ Loaded {city} data: {len(df)} quarters")
     return df
 
@@ -187,6 +189,91 @@ def evaluate_event_detection(df, city):
 
     return None
 
+def calculate_ensemble_correlations(claims, precip):
+    """
+    Pearson correlation of precipitation against every claims realization
+
+    claims: (n_realizations, n_quarters) array, e.g. from
+    generate_claims.aggregate_ensemble_quarterly; precip: (n_quarters,)
+    Returns an (n_realizations,) array of r values.
+    """
+    claims = np.asarray(claims, dtype=float)
+    precip = np.asarray(precip, dtype=float)
+
+    claims_dev = claims - claims.mean(axis=1, keepdims=True)
+    precip_dev = precip - precip.mean()
+
+    cov = claims_dev @ precip_dev
+    norm = np.sqrt((claims_dev ** 2).sum(axis=1) * (precip_dev ** 2).sum())
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cov / norm
+
+def evaluate_ensemble_event_detection(claims, precip_anomaly, loss_quantile=0.95, anomaly_threshold=1.0):
+    """
+    Event detection metrics (see evaluate_event_detection) for every realization
+
+    Returns a dict of (n_realizations,) arrays: precision, recall, f1, tp, fp, fn, tn
+    """
+    claims = np.asarray(claims, dtype=float)
+    forecast_high = np.asarray(precip_anomaly) > anomaly_threshold
+
+    threshold = np.quantile(claims, loss_quantile, axis=1, keepdims=True)
+    is_high_loss = claims > threshold
+
+    tp = (is_high_loss & forecast_high).sum(axis=1)
+    fp = (~is_high_loss & forecast_high).sum(axis=1)
+    fn = (is_high_loss & ~forecast_high).sum(axis=1)
+    tn = (~is_high_loss & ~forecast_high).sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'tp': tp,
+        'fp': fp,
+        'fn': fn,
+        'tn': tn
+    }
+
+def summarize_ensemble(df, city):
+    """Print sampling distributions of correlation and detection metrics over the claims ensemble"""
+    ensemble_file = f'{SYNTHETIC_DIR}/{city.lower()}_ensemble_2014-2021.npz'
+
+    if not os.path.exists(ensemble_file) or 'precip_anomaly' not in df.columns:
+        return None
+
+    print(f"\n{'='*60}")
+    print(f"ENSEMBLE SAMPLING DISTRIBUTION: {city.upper()}")
+    print(f"{'='*60}\n")
+
+    with np.load(ensemble_file) as ensemble:
+        periods = ensemble['periods']
+        claims = ensemble['quarterly_total_claims']
+
+    # Align realization columns to the processed quarters
+    column = pd.Index(periods).get_indexer(df['period'])
+    if (column < 0).any():
+        missing = df['period'][column < 0].tolist()
+        raise ValueError(f"{ensemble_file} has no realizations for periods {missing}; "
+                         f"regenerate it with generate_claims.py --ensemble")
+    claims = claims[:, column]
+
+    correlations = calculate_ensemble_correlations(claims, df['precip_anomaly'])
+    events = evaluate_ensemble_event_detection(claims, df['precip_anomaly'])
+
+    print(f"Realizations: {len(claims)}")
+    for name, values in [('Pearson r', correlations), ('Precision', events['precision']),
+                         ('Recall', events['recall']), ('F1-score', events['f1'])]:
+        p5, p50, p95 = np.nanpercentile(values, [5, 50, 95])
+        print(f"  {name:<10} median {p50:+.3f}  90% interval [{p5:+.3f}, {p95:+.3f}]")
+
+    return {'correlations': correlations, **events}
+
 def create_scatter_plots(df_bergen, df_oslo):
     """Create scatter plots of precipitation vs claims"""
     print("\nGenerating scatter plots...")
@@ -517,6 +604,10 @@ def main():
     bergen_events = evaluate_event_detection(df_bergen, 'Bergen')
     oslo_events = evaluate_event_detection(df_oslo, 'Oslo')
 
+    # Sampling distributions over the claims ensemble (generate_claims.py --ensemble)
+    summarize_ensemble(df_bergen, 'Bergen')
+    summarize_ensemble(df_oslo, 'Oslo')
+
     # Create visualizations
     print(f"\n{'='*60}")
     print("GENERATING VISUALIZATIONS")
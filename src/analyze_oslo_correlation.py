@@ -7,14 +7,17 @@ import pandas as pd
 import numpy as np
 from scipy.stats import pearsonr, spearmanr
 
+from storage import read_dataset, write_dataset
+
 print("="*60)
 print("OSLO CORRELATION ANALYSIS")
 print("Real Claims vs. Real Precipitation")
 print("="*60)
 
 # Load data
-claims = pd.read_csv('data/processed/oslo_quarterly_claims_2014-2021.csv')
-precip = pd.read_csv('data/processed/oslo_quarterly_precipitation_2014-2021.csv')
+oslo = [('city', '=', 'oslo')]
+claims = read_dataset('data/processed/nask_quarterly_claims', filters=oslo).drop(columns='city')
+precip = read_dataset('data/processed/era5_quarterly_precipitation', filters=oslo).drop(columns='city')
 
 print(f"\nLoaded data:")
 print(f"  Claims: {len(claims)} quarters")
@@ -145,10 +148,9 @@ print(f"  False Positives: {fp:2d} (false alarms)")
 print(f"  False Negatives: {fn:2d} (missed events)")
 print(f"  True Negatives:  {tn:2d} (correctly forecast low-loss)")
 
-# Save merged data
-output_file = 'data/processed/oslo_merged_claims_precip_2014-2021.csv'
-merged.to_csv(output_file, index=False)
-print(f"\n✅ Saved: {output_file}")
+# Save merged data (Parquet, partitioned by city)
+output_path = write_dataset(merged.assign(city='oslo'), 'data/processed/merged_claims_precip')
+print(f"\n✅ Saved: {output_path}/city=oslo")
 
 # Summary statistics
 print(f"\n{'='*60}")
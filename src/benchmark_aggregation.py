@@ -0,0 +1,83 @@
+"""
+Benchmark the bincount aggregation kernel against the groupby/merge approach
+Used to size aggregation for long horizons and large ensembles
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from generate_claims import (CITY_PROFILES, aggregate_ensemble_quarterly, create_quarterly_aggregations,
+                             generate_city_claims, generate_claims_ensemble)
+
+def groupby_quarterly_aggregations(df):
+    """Previous three-groupby implementation of create_quarterly_aggregations (baseline)"""
+    quarterly = df.groupby(['year', 'quarter']).agg({
+        'total_claims': 'sum',
+        'natural_perils': 'sum',
+        'rain_associated': 'sum'
+    }).reset_index()
+
+    days_with_claims = df[df['total_claims'] > 0].groupby(['year', 'quarter']).size()
+    quarterly = quarterly.merge(
+        days_with_claims.reset_index(name='days_with_claims'),
+        on=['year', 'quarter'],
+        how='left'
+    )
+    quarterly['days_with_claims'] = quarterly['days_with_claims'].fillna(0)
+
+    max_daily = df.groupby(['year', 'quarter'])['total_claims'].max()
+    quarterly = quarterly.merge(
+        max_daily.reset_index(name='max_daily_claims'),
+        on=['year', 'quarter']
+    )
+    quarterly['period'] = quarterly['year'].astype(str) + ' Q' + quarterly['quarter'].astype(str)
+    return quarterly
+
+def time_call(func, *args, repeats=5):
+    """Best wall-clock time of repeated calls (seconds)"""
+    best = np.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    """Run aggregation benchmarks"""
+    print("="*60)
+    print("AGGREGATION BENCHMARK")
+    print("="*60)
+
+    rng = np.random.default_rng(42)
+
+    print("\nSingle history, 100 years (Bergen):")
+    df = generate_city_claims(CITY_PROFILES['bergen'], 2014, 2113, rng)
+    t_groupby = time_call(groupby_quarterly_aggregations, df)
+    t_kernel = time_call(create_quarterly_aggregations, df, 'Bergen')
+    print(f"  groupby/merge: {t_groupby * 1000:8.1f} ms")
+    print(f"  bincount:      {t_kernel * 1000:8.1f} ms  ({t_groupby / t_kernel:.1f}x)")
+
+    print("\nEnsemble, 1,000 realizations × 8 years (Bergen):")
+    ensemble = generate_claims_ensemble(CITY_PROFILES['bergen'], 1000, rng=rng)
+    dates = ensemble['dates']
+
+    def groupby_ensemble():
+        for row in range(len(ensemble['total_claims'])):
+            groupby_quarterly_aggregations(pd.DataFrame({
+                'year': dates.year,
+                'quarter': dates.quarter,
+                'total_claims': ensemble['total_claims'][row],
+                'natural_perils': ensemble['natural_perils'][row],
+                'rain_associated': ensemble['rain_associated'][row]
+            }))
+
+    t_groupby = time_call(groupby_ensemble, repeats=1)
+    t_kernel = time_call(aggregate_ensemble_quarterly, ensemble)
+    print(f"  groupby/merge per realization: {t_groupby * 1000:8.1f} ms")
+    print(f"  bincount over ensemble:        {t_kernel * 1000:8.1f} ms  ({t_groupby / t_kernel:.1f}x)")
+
+    print("\n" + "="*60)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Split large SEAS5/ERA5 retrievals into right-sized chunks
+Chunks download in parallel and are merged lazily with open_mfdataset
+"""
+
+import glob
+import itertools
+import os
+from dataclasses import replace
+from math import prod
+
+import xarray as xr
+
+# Request keys that multiply the number of fields CDS has to extract
+FIELD_KEYS = ['variable', 'year', 'month', 'day', 'time', 'leadtime_month', 'leadtime_hour']
+
+# Keys to split on, in order of preference
+DEFAULT_SPLIT_KEYS = ('year', 'month', 'variable')
+
+# Fields per request that keep CDS queue times reasonable
+# (one year of quarterly SEAS5 inits x 3 leads, or one year of ERA5 monthly means)
+DEFAULT_MAX_FIELDS = 24
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+def count_fields(request):
+    """Number of fields (product of list-valued selection keys) in a CDS request"""
+    return prod(len(_as_list(request[key])) for key in FIELD_KEYS if key in request)
+
+def chunk_dir(target):
+    """Directory holding the chunk files for a target file"""
+    return f"{os.path.splitext(target)[0]}_chunks"
+
+def plan_chunks(task, split_keys=DEFAULT_SPLIT_KEYS, max_fields=DEFAULT_MAX_FIELDS):
+    """
+    Split a DownloadTask into chunk tasks of at most max_fields fields
+
+    Keys in split_keys (e.g. year, init month, variable) are split one value
+    per chunk, in order, until the chunk size fits. Returns [task] when the
+    request is already small enough.
+    """
+    request = task.request
+    split = []
+    fields = count_fields(request)
+    for key in split_keys:
+        if fields <= max_fields:
+            break
+        if key in request and len(_as_list(request[key])) > 1:
+            split.append(key)
+            fields //= len(_as_list(request[key]))
+
+    if not split:
+        return [task]
+
+    stem = os.path.basename(os.path.splitext(task.target)[0])
+    chunks = []
+    for values in itertools.product(*(_as_list(request[key]) for key in split)):
+        suffix = '_'.join(f"{key}{value}" for key, value in zip(split, values))
+        chunks.append(replace(
+            task,
+            name=f"{task.name}_{suffix}",
+            request={**request, **{key: [value] for key, value in zip(split, values)}},
+            target=os.path.join(chunk_dir(task.target), f"{stem}_{suffix}.nc")
+        ))
+    return chunks
+
+def has_data(target):
+    """True if the target file or any of its chunk files exist"""
+    return os.path.exists(target) or bool(glob.glob(os.path.join(chunk_dir(target), '*.nc')))
+
+def data_files(target):
+    """
+    Files holding the target's data: the single target file, or its chunk
+    files if they are newer (a re-download in chunks supersedes it)
+    """
+    paths = sorted(glob.glob(os.path.join(chunk_dir(target), '*.nc')))
+    if os.path.exists(target) and (not paths or
+                                   os.path.getmtime(target) >= max(os.path.getmtime(p) for p in paths)):
+        return [target]
+    if not paths:
+        raise FileNotFoundError(f"No data found: {target} or {chunk_dir(target)}")
+    return paths
+
+def open_chunked(target, chunks=None, **kwargs):
+    """
+    Open a dataset: the single target file or all of its chunk files
+    combined by coordinates (whichever is newer; nothing is rewritten)
+
+    chunks=None opens without dask (chunk files are combined in memory);
+    otherwise dask chunk sizes per dimension (-1 for a whole axis;
+    dimensions not in the data are ignored; {} keeps the file chunks), so
+    each chunk reads only its own slice of the files.
+    """
+    paths = data_files(target)
+    if chunks is None:
+        if len(paths) == 1:
+            return xr.open_dataset(paths[0], **kwargs)
+        return xr.combine_by_coords([xr.open_dataset(path, **kwargs) for path in paths])
+
+    if len(paths) == 1:
+        ds = xr.open_dataset(paths[0], chunks={}, **kwargs)
+    else:
+        ds = xr.open_mfdataset(paths, combine='by_coords', parallel=True, **kwargs)
+    chunks = {dim: size for dim, size in chunks.items() if dim in ds.dims}
+    return ds.chunk(chunks) if chunks else ds
@@ -0,0 +1,183 @@
+"""
+Concurrent CDS download scheduler
+Bounded parallelism, retries with exponential backoff, per-request timeouts
+and a persisted status file so interrupted runs resume where they stopped
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from datetime import datetime
+
+from download_cache import request_key
+
+@dataclass
+class DownloadTask:
+    """One CDS retrieval: dataset name, request dict and target file"""
+    name: str
+    dataset: str
+    request: dict
+    target: str
+
+def cds_client_factory():
+    """Default client: a cdsapi.Client (anything with retrieve(dataset, request, target) works)"""
+    import cdsapi
+    return cdsapi.Client(quiet=True)
+
+class LocalCDSClient:
+    """
+    Offline stand-in for cdsapi.Client serving fixture NetCDF files
+
+    Looks up {fixture_dir}/{dataset}.nc (or a per-task file registered in
+    fixtures) and copies it to the target. Optional delay and failures
+    (number of initial calls that raise) exercise the scheduler's
+    concurrency and retry paths.
+    """
+
+    def __init__(self, fixture_dir, fixtures=None, delay=0.0, failures=0):
+        self.fixture_dir = fixture_dir
+        self.fixtures = fixtures or {}
+        self.delay = delay
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def retrieve(self, dataset, request, target):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        time.sleep(self.delay)
+        if fail:
+            raise ConnectionError(f"Simulated CDS failure for {dataset}")
+
+        source = self.fixtures.get(dataset, os.path.join(self.fixture_dir, f"{dataset}.nc"))
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"No fixture for dataset {dataset}: {source}")
+        shutil.copyfile(source, target)
+        return target
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class DownloadScheduler:
+    """
+    Run DownloadTasks from a work queue with bounded concurrency
+
+    Each attempt downloads to a temporary file that is renamed on success
+    and deleted otherwise, so a timed-out or failed attempt never leaves a
+    partial target or stray part files. Status
+    per task (attempts, last error, request hash) is persisted to
+    status_file after every change. Tasks whose target exists and was
+    produced by the same request are skipped on the next run; a changed
+    request (e.g. a new bounding box) is downloaded again.
+    """
+
+    def __init__(self, status_file, client_factory=cds_client_factory, max_workers=4,
+                 max_retries=3, backoff_base=30.0, backoff_max=900.0, timeout=None):
+        self.status_file = status_file
+        self.client_factory = client_factory
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.status = self._load_status()
+
+    def _load_status(self):
+        if os.path.exists(self.status_file):
+            with open(self.status_file) as f:
+                return json.load(f)
+        return {}
+
+    def _update_status(self, task, **fields):
+        with self._lock:
+            entry = self.status.setdefault(task.name, {'target': task.target, 'attempts': 0})
+            entry.update(fields, updated=datetime.now().isoformat(timespec='seconds'))
+            tmp_file = f"{self.status_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.status, f, indent=2)
+            os.replace(tmp_file, self.status_file)
+
+    def is_done(self, task):
+        """
+        True if the target exists and was produced by this exact request
+        (targets only appear via an atomic rename on success)
+        """
+        entry = self.status.get(task.name, {})
+        return (os.path.exists(task.target) and
+                entry.get('request_key') == request_key(task.dataset, task.request))
+
+    def _attempt(self, task, attempt):
+        """
+        One retrieval into a temporary file, bounded by self.timeout
+
+        The part file is always removed unless renamed to the target. A
+        timed-out request cannot be interrupted, so it is marked abandoned:
+        its thread deletes whatever it wrote when it finally returns and
+        its result is never used.
+        """
+        part_file = f"{task.target}.part{attempt}"
+        client = self.client_factory()
+        abandoned = threading.Event()
+
+        def retrieve():
+            try:
+                client.retrieve(task.dataset, task.request, part_file)
+            finally:
+                if abandoned.is_set():
+                    _remove(part_file)
+
+        # Run in a helper thread so a hung request can be abandoned
+        runner = ThreadPoolExecutor(max_workers=1)
+        future = runner.submit(retrieve)
+        runner.shutdown(wait=False)
+        try:
+            future.result(timeout=self.timeout)
+            os.replace(part_file, task.target)
+        except FutureTimeoutError:
+            abandoned.set()
+            raise TimeoutError(f"Request exceeded {self.timeout}s")
+        finally:
+            _remove(part_file)
+
+    def run_task(self, task):
+        """Download one task with retries; returns True on success"""
+        if self.is_done(task):
+            print(f"  ✓ {task.name}: already downloaded ({task.target})")
+            return True
+
+        os.makedirs(os.path.dirname(task.target) or '.', exist_ok=True)
+        attempts = self.status.get(task.name, {}).get('attempts', 0)
+
+        for attempt in range(self.max_retries + 1):
+            attempts += 1
+            self._update_status(task, status='running', attempts=attempts)
+            try:
+                self._attempt(task, attempt)
+            except Exception as e:
+                self._update_status(task, status='failed', error=str(e))
+                if attempt == self.max_retries:
+                    print(f"  ✗ {task.name}: giving up after {attempt + 1} attempts ({e})")
+                    return False
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                print(f"  ⚠ {task.name}: attempt {attempt + 1} failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+            else:
+                self._update_status(task, status='done', error=None,
+                                    request_key=request_key(task.dataset, task.request))
+                print(f"  ✓ {task.name}: downloaded {task.target}")
+                return True
+
+    def run(self, tasks):
+        """Run all tasks with at most max_workers in flight; returns {name: success}"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = pool.map(self.run_task, tasks)
+            return {task.name: ok for task, ok in zip(tasks, results)}
@@ -0,0 +1,191 @@
+"""
+Persistent climatology store for precipitation anomalies
+Per-region, per-quarter, per-lead statistics built once from hindcasts
+(1993-2016 by default) and saved as a memory-mappable array
+"""
+
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import xarray as xr
+
+from ensemble_statistics import ensemble_statistics, find_member_dim, statistic_labels
+from storage import PROCESSED_DIR
+
+CLIMATOLOGY_DIR = f'{PROCESSED_DIR}/climatology'
+
+CLIMATOLOGY_START = 1993
+CLIMATOLOGY_END = 2016
+# p80/p90/p95 are also the thresholds of the forecast exceedance product
+CLIMATOLOGY_QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.80, 0.90, 0.95)
+
+# Lead label for climatologies that are not lead-resolved (e.g. ERA5, or
+# quarterly totals summed over leads 1-3)
+NO_LEAD = 0
+
+# Delta degrees of freedom of the climatological std: the years are a
+# sample, so the in-sample fallback (pandas std) and the store agree
+CLIMATOLOGY_DDOF = 1
+
+class ClimatologyStore:
+    """
+    Climatology array (region, quarter, lead, statistic) with label indexes
+
+    values.npy is opened memory-mapped, so lookups read only the entries
+    they touch; index.json holds the axis labels and the source period.
+    """
+
+    AXES = ('region', 'quarter', 'lead', 'statistic')
+
+    def __init__(self, values, labels, attrs=None):
+        self.values = values
+        self.labels = labels
+        self.attrs = attrs or {}
+        self._index = {axis: {label: i for i, label in enumerate(labels[axis])} for axis in self.AXES}
+
+    @classmethod
+    def open(cls, path=CLIMATOLOGY_DIR):
+        with open(os.path.join(path, 'index.json')) as f:
+            index = json.load(f)
+        values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        return cls(values, index['labels'], index['attrs'])
+
+    def save(self, path=CLIMATOLOGY_DIR):
+        """Write values.npy and index.json (replacing any previous store atomically)"""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'values.npy'), np.ascontiguousarray(self.values))
+        with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+            json.dump({'labels': self.labels, 'attrs': self.attrs}, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return path
+
+    def position(self, axis, label):
+        try:
+            return self._index[axis][label]
+        except KeyError:
+            raise KeyError(f"{label!r} not in climatology {axis}s: {self.labels[axis]}") from None
+
+    def lookup(self, region, quarter, statistic, lead=NO_LEAD):
+        """One climatology value"""
+        return float(self.values[self.position('region', region), self.position('quarter', quarter),
+                                 self.position('lead', lead), self.position('statistic', statistic)])
+
+    def quarterly(self, region, statistic, quarters, lead=NO_LEAD):
+        """Climatology values for an array of quarters (1-4), one fancy-indexed read"""
+        rows = self.values[self.position('region', region), :, self.position('lead', lead),
+                           self.position('statistic', statistic)]
+        return np.asarray(rows)[[self.position('quarter', int(quarter)) for quarter in quarters]]
+
+    def thresholds(self, regions, init, statistics, lead=NO_LEAD):
+        """
+        Climatology values (region, init, statistic) for forecast inits,
+        each taken from the quarter of its init date; only the requested
+        entries are read from the memory-mapped array
+        """
+        rows = [self.position('region', region) for region in regions]
+        columns = [self.position('statistic', statistic) for statistic in statistics]
+        quarters = [self.position('quarter', int(quarter)) for quarter in init.dt.quarter.values]
+        values = self.values[:, :, self.position('lead', lead)][np.ix_(rows, quarters, columns)]
+        return xr.DataArray(np.asarray(values), dims=('region', 'init', 'statistic'),
+                            coords={'region': list(regions), 'init': init.values,
+                                    'statistic': list(statistics)})
+
+    def to_dataarray(self):
+        return xr.DataArray(np.asarray(self.values), dims=self.AXES,
+                            coords={axis: self.labels[axis] for axis in self.AXES}, attrs=self.attrs)
+
+def build_climatology(totals, start_year=CLIMATOLOGY_START, end_year=CLIMATOLOGY_END,
+                      quantiles=CLIMATOLOGY_QUANTILES, lead_dim='forecastMonth'):
+    """
+    Climatology of quarterly totals per region, quarter and lead
+
+    totals: quarterly totals with year/quarter coordinates on 'period' and
+    a 'region' dimension (aggregate_to_quarterly or quarterly_forecast);
+    optional member and lead dimensions (without a lead the store holds
+    NO_LEAD). Quantiles describe single members, so they are taken over
+    all years and members pooled; mean and std describe the ensemble-mean
+    forecasts the anomalies are computed for, so they are taken over the
+    years of the ensemble means. std uses CLIMATOLOGY_DDOF.
+    """
+    totals = totals.sel(period=(totals['year'] >= start_year) & (totals['year'] <= end_year))
+    if lead_dim in totals.dims:
+        totals = totals.rename({lead_dim: 'lead'})
+    elif 'lead' not in totals.dims:
+        totals = totals.expand_dims(lead=[NO_LEAD])
+
+    by_quarter = totals.drop_vars('period').set_index(period=['year', 'quarter']).unstack('period')
+    member_dim = find_member_dim(by_quarter)
+    sample_dims = ['year'] + ([member_dim] if member_dim else [])
+    samples = by_quarter.stack(sample=sample_dims).drop_vars(['sample'] + sample_dims, errors='ignore')
+    stats = ensemble_statistics(samples, quantiles=quantiles, member_dim='sample', ddof=CLIMATOLOGY_DDOF)
+
+    if member_dim:
+        spread = ensemble_statistics(by_quarter.mean(member_dim), quantiles=(), member_dim='year',
+                                     ddof=CLIMATOLOGY_DDOF)
+        stats = xr.concat([spread, stats.sel(statistic=statistic_labels(quantiles)[2:])], dim='statistic')
+
+    stats = stats.transpose(*ClimatologyStore.AXES)
+    labels = {
+        'region': [str(region) for region in stats['region'].values],
+        'quarter': [int(quarter) for quarter in stats['quarter'].values],
+        'lead': [int(lead) for lead in stats['lead'].values],
+        'statistic': statistic_labels(quantiles)
+    }
+    attrs = {'start_year': start_year, 'end_year': end_year,
+             'years': int(np.unique(totals['year'].values).size)}
+    return ClimatologyStore(np.asarray(stats.values, dtype=np.float64), labels, attrs)
+
+def open_climatology(path=CLIMATOLOGY_DIR):
+    """The climatology store at path, or None if it has not been built"""
+    if not os.path.exists(os.path.join(path, 'index.json')):
+        return None
+    return ClimatologyStore.open(path)
+
+def main(path=CLIMATOLOGY_DIR, registry=None):
+    """
+    Build the climatology store from 1993-2016 SEAS5 hindcasts of every
+    region of registry (default: config/regions.toml)
+    """
+    from process_forecasts import build_forecast_cube, city_weights, find_precip_var, lead_forecast, quarterly_forecast
+    from region_registry import load_registry
+
+    print("="*60)
+    print(f"BUILDING CLIMATOLOGY ({CLIMATOLOGY_START}-{CLIMATOLOGY_END})")
+    print("="*60)
+
+    regions = []
+    registry = load_registry() if registry is None else registry
+    for region in registry:
+        file_path = (f'/Users/giulio/portfolio1-norway/data/raw/'
+                     f'seas5_{region.name}_{CLIMATOLOGY_START}-{CLIMATOLOGY_END}.nc')
+        if not os.path.exists(file_path):
+            print(f"  ✗ {region.name}: hindcasts not found ({file_path})")
+            continue
+
+        hindcasts = xr.open_dataset(file_path, chunks={})
+        precip = hindcasts[find_precip_var(hindcasts)] * 1000  # m -> mm
+        cube = build_forecast_cube(precip, city_weights(region.name, precip, registry))
+        # Monthly member totals at every lead, plus the quarterly totals of
+        # quarter-start inits (NO_LEAD) as the forecasts are processed
+        totals = xr.concat([quarterly_forecast(cube).expand_dims(lead=[NO_LEAD]), lead_forecast(cube)],
+                           dim='lead')
+        regions.append(totals.load())
+        print(f"  ✓ {region.name}: {totals.sizes['period']} quarters, leads {totals['lead'].values[1:].tolist()}")
+
+    if not regions:
+        print("\n✗ No hindcasts available; download them first")
+        return None
+
+    store = build_climatology(xr.concat(regions, dim='region'))
+    path = store.save(path)
+    print(f"\n✓ Saved climatology {store.values.shape} to: {path}")
+    return store
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
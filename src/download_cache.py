@@ -0,0 +1,184 @@
+"""
+Content-addressed cache for CDS downloads
+Files are keyed by a hash of (dataset, request) and tracked in a manifest
+with checksums, sizes and retrieval timestamps (one record per entry)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+CACHE_DIR = '/Users/giulio/portfolio1-norway/data/raw/cache'
+
+def _normalize(value):
+    """Request value as CDS reads it: a list of strings (a scalar is a one-element list)"""
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+def request_key(dataset, request):
+    """
+    Stable hash of a CDS request
+
+    Key order does not matter, values are compared as strings and a
+    scalar equals a one-element list (1, '1' and ['1'] are the same
+    request). List order is kept: it is significant for e.g. 'area'.
+    """
+    payload = json.dumps({'dataset': dataset, 'request': _normalize(request)}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def file_checksum(path, block_size=1 << 20):
+    """SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _copy_to(source, target):
+    """Copy source to target atomically (the cache file is never shared with the target)"""
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(source, tmp_target)
+    os.replace(tmp_target, target)
+
+def _write_json(path, data):
+    """Write JSON atomically (unique temp file, then rename)"""
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_file, path)
+
+class DownloadCache:
+    """
+    Local store of retrieved files, shared by every download script
+
+    Entries live at {cache_dir}/{key}.nc (read-only) next to {key}.json
+    recording dataset, request, checksum, size, mtime and retrieval time.
+    One metadata file per entry means caches in different scripts or
+    processes never overwrite each other's records. A lookup only
+    re-hashes a file when its size or mtime changed, and evicts it if the
+    checksum no longer matches (corrupted or partially overwritten).
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.nc")
+
+    def entry_file(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def entry(self, key):
+        """Manifest record of a key, or None"""
+        try:
+            with open(self.entry_file(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def keys(self):
+        return [name[:-len('.json')] for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+
+    def _evict(self, key):
+        for path in (self.entry_file(key), self.path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, dataset, request):
+        """Path of a valid cached file for this request, or None"""
+        key = request_key(dataset, request)
+        with self._lock:
+            entry = self.entry(key)
+            if entry is None:
+                return None
+
+            path = self.path(key)
+            if not os.path.exists(path):
+                self._evict(key)
+                return None
+
+            stat = os.stat(path)
+            if stat.st_size != entry['size'] or stat.st_mtime_ns != entry['mtime_ns']:
+                if file_checksum(path) != entry['sha256']:
+                    print(f"  ⚠ Cache entry {key[:12]} is corrupted, evicting")
+                    self._evict(key)
+                    return None
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                _write_json(self.entry_file(key), entry)
+
+            return path
+
+    def put(self, dataset, request, source):
+        """Move a freshly downloaded file into the cache (read-only); returns its cache path"""
+        key = request_key(dataset, request)
+        path = self.path(key)
+        checksum = file_checksum(source)
+        os.chmod(source, 0o444)
+        os.replace(source, path)
+        stat = os.stat(path)
+
+        with self._lock:
+            _write_json(self.entry_file(key), {
+                'dataset': dataset,
+                'request': request,
+                'sha256': checksum,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'retrieved': datetime.now().isoformat(timespec='seconds')
+            })
+        return path
+
+    def verify_all(self):
+        """Re-hash every entry; evicts and returns the keys of corrupted files"""
+        corrupted = []
+        with self._lock:
+            for key in self.keys():
+                entry = self.entry(key)
+                path = self.path(key)
+                if entry is None or not os.path.exists(path) or file_checksum(path) != entry['sha256']:
+                    corrupted.append(key)
+                    self._evict(key)
+        return corrupted
+
+class CachedClient:
+    """
+    Wrap a CDS client (retrieve(dataset, request, target)) with DownloadCache
+
+    Cache hits are copied to the target without contacting CDS; misses
+    are retrieved into the cache first, then copied.
+    """
+
+    def __init__(self, client, cache=None):
+        self.client = client
+        self.cache = cache or DownloadCache()
+
+    def retrieve(self, dataset, request, target):
+        path = self.cache.get(dataset, request)
+        if path is None:
+            download_file = os.path.join(self.cache.cache_dir,
+                                         f"{request_key(dataset, request)}.{threading.get_ident()}.part")
+            try:
+                self.client.retrieve(dataset, request, download_file)
+                path = self.cache.put(dataset, request, download_file)
+            except BaseException:
+                # Failed, timed-out or interrupted downloads leave no partial files behind
+                try:
+                    os.remove(download_file)
+                except FileNotFoundError:
+                    pass
+                raise
+        else:
+            print(f"  ✓ Served from cache: {target}")
+        _copy_to(path, target)
+        return target
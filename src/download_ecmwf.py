@@ -3,24 +3,22 @@ Download ECMWF SEAS5 seasonal forecasts and ERA5 observations
 For Norwegian climate insurance forecasting project
 """
 
-import cdsapi
 import os
 from datetime import datetime
 
-# Geographic coordinates (9km x 9km areas)
-BERGEN_COORDS = {
-    'north': 60.5,
-    'south': 60.3,
-    'east': 5.5,
-    'west': 5.1
-}
-
-OSLO_COORDS = {
-    'north': 60.0,
-    'south': 59.8,
-    'east': 10.9,
-    'west': 10.6
-}
+from cds_chunking import open_chunked, plan_chunks
+from cds_scheduler import DownloadScheduler, DownloadTask
+from download_cache import CachedClient, DownloadCache
+from region_planning import plan_union_requests, region_index_slices, subset_regions
+from region_registry import load_registry
+
+# cdsapi is imported by the functions that download, so processing (which
+# reads the stores through incremental_download) works without it
+
+# SEAS5 hindcast layout: quarterly initializations, 1-3 month leads
+SEAS5_INIT_MONTHS = ['01', '04', '07', '10']
+SEAS5_LEADTIMES = ['1', '2', '3']
+
 
 def check_credentials():
     """Check if CDS API credentials exist"""
@@ -34,6 +32,51 @@ def check_credentials():
         return False
     return True
 
+def seas5_task(city, coords, output_dir):
+    """SEAS5 hindcast retrieval (2014-2021, quarterly inits, 1-3 month leads) as a DownloadTask"""
+    return DownloadTask(
+        name=f"seas5_{city.lower()}",
+        dataset='seasonal-monthly-single-levels',
+        request={
+            'format': 'netcdf',
+            'originating_centre': 'ecmwf',
+            'system': '5',  # SEAS5
+            'variable': 'total_precipitation',
+            'year': [str(y) for y in range(2014, 2022)],
+            'month': SEAS5_INIT_MONTHS,  # Quarterly initialization
+            'leadtime_month': SEAS5_LEADTIMES,  # 3-month lead time
+            'area': [
+                coords['north'],
+                coords['west'],
+                coords['south'],
+                coords['east']
+            ],
+        },
+        target=f"{output_dir}/seas5_{city.lower()}_2014-2021.nc"
+    )
+
+def era5_task(city, coords, output_dir):
+    """ERA5 monthly precipitation retrieval (2014-2021) as a DownloadTask"""
+    return DownloadTask(
+        name=f"era5_{city.lower()}",
+        dataset='reanalysis-era5-single-levels-monthly-means',
+        request={
+            'format': 'netcdf',
+            'product_type': 'monthly_averaged_reanalysis',
+            'variable': 'total_precipitation',
+            'year': [str(y) for y in range(2014, 2022)],
+            'month': [f"{m:02d}" for m in range(1, 13)],
+            'time': '00:00',
+            'area': [
+                coords['north'],
+                coords['west'],
+                coords['south'],
+                coords['east']
+            ],
+        },
+        target=f"{output_dir}/era5_{city.lower()}_2014-2021.nc"
+    )
+
 def download_seas5_hindcasts(city, coords, output_dir):
     """
     Download SEAS5 seasonal hindcasts (retrospective forecasts)
@@ -45,54 +88,23 @@ def download_seas5_hindcasts(city, coords, output_dir):
     - All 51 ensemble members
     - Variable: Total precipitation
     """
-    c = cdsapi.Client()
+    import cdsapi
+
+    c = CachedClient(cdsapi.Client())
 
     print(f"\n{'='*60}")
     print(f"Downloading SEAS5 hindcasts for {city.upper()}")
     print(f"{'='*60}")
 
-    # Quarterly initialization months
-    quarters = {
-        'Q1': '01',  # January initialization
-        'Q2': '04',  # April initialization
-        'Q3': '07',  # July initialization
-        'Q4': '10'   # October initialization
-    }
-
-    years = [str(y) for y in range(2014, 2022)]
-
-    output_file = f"{output_dir}/seas5_{city.lower()}_2014-2021.nc"
-
-    # Check if file already exists
-    if os.path.exists(output_file):
-        print(f"✓ File already exists: {output_file}")
-        print("  Skipping download. Delete file to re-download.")
-        return output_file
+    task = seas5_task(city, coords, output_dir)
+    output_file = task.target
 
     print(f"\nDownloading to: {output_file}")
-    print("This may take 30-60 minutes...")
+    print("This may take 30-60 minutes (identical requests are served from the cache)...")
     print("Dataset: seasonal-monthly-single-levels (SEAS5)")
 
     try:
-        c.retrieve(
-            'seasonal-monthly-single-levels',
-            {
-                'format': 'netcdf',
-                'originating_centre': 'ecmwf',
-                'system': '5',  # SEAS5
-                'variable': 'total_precipitation',
-                'year': years,
-                'month': list(quarters.values()),
-                'leadtime_month': ['1', '2', '3'],  # 3-month lead time
-                'area': [
-                    coords['north'],
-                    coords['west'],
-                    coords['south'],
-                    coords['east']
-                ],
-            },
-            output_file
-        )
+        c.retrieve(task.dataset, task.request, output_file)
         print(f"✓ Successfully downloaded: {output_file}")
         return output_file
 
@@ -113,46 +125,23 @@ def download_era5_observations(city, coords, output_dir):
     - Years: 2014-2021
     - Variable: Total precipitation
     """
-    c = cdsapi.Client()
+    import cdsapi
+
+    c = CachedClient(cdsapi.Client())
 
     print(f"\n{'='*60}")
     print(f"Downloading ERA5 observations for {city.upper()}")
     print(f"{'='*60}")
 
-    output_file = f"{output_dir}/era5_{city.lower()}_2014-2021.nc"
-
-    # Check if file already exists
-    if os.path.exists(output_file):
-        print(f"✓ File already exists: {output_file}")
-        print("  Skipping download. Delete file to re-download.")
-        return output_file
+    task = era5_task(city, coords, output_dir)
+    output_file = task.target
 
     print(f"\nDownloading to: {output_file}")
-    print("This may take 10-20 minutes...")
+    print("This may take 10-20 minutes (identical requests are served from the cache)...")
     print("Dataset: reanalysis-era5-single-levels-monthly-means")
 
-    years = [str(y) for y in range(2014, 2022)]
-    months = [f"{m:02d}" for m in range(1, 13)]
-
     try:
-        c.retrieve(
-            'reanalysis-era5-single-levels-monthly-means',
-            {
-                'format': 'netcdf',
-                'product_type': 'monthly_averaged_reanalysis',
-                'variable': 'total_precipitation',
-                'year': years,
-                'month': months,
-                'time': '00:00',
-                'area': [
-                    coords['north'],
-                    coords['west'],
-                    coords['south'],
-                    coords['east']
-                ],
-            },
-            output_file
-        )
+        c.retrieve(task.dataset, task.request, output_file)
         print(f"✓ Successfully downloaded: {output_file}")
         return output_file
 
@@ -164,12 +153,52 @@ def download_era5_observations(city, coords, output_dir):
         print("3. Check CDS system status: https://cds.climate.copernicus.eu/live/status")
         return None
 
-def download_all():
-    """Download all required datasets"""
+def cached_client_factory(cache=None):
+    """Client factory for the scheduler: cdsapi.Client behind the shared download cache"""
+    import cdsapi
+
+    cache = cache or DownloadCache()
+    return lambda: CachedClient(cdsapi.Client(), cache)
+
+def subset_union_downloads(groups, tasks, output_dir):
+    """
+    Split each downloaded union file into per-region files
+
+    Index slices are computed once per union grid and reused for all of its
+    regions; single-region groups were downloaded under the region's own
+    name and need no subsetting.
+    """
+    for group in groups:
+        if len(group.members) == 1:
+            continue
+        for task in tasks[group.name]:
+            product = task.name.split('_')[0]
+            ds = open_chunked(task.target, chunks={})
+            slices = region_index_slices(group, ds['latitude'].values, ds['longitude'].values)
+            for region, subset in subset_regions(ds, slices).items():
+                output_file = f"{output_dir}/{product}_{region}_2014-2021.nc"
+                subset.to_netcdf(output_file)
+                print(f"  ✓ {region}: {output_file} ({subset.sizes['latitude']}x{subset.sizes['longitude']} cells)")
+            ds.close()
+
+def download_all(regions=None, max_workers=4, max_retries=3, timeout=3 * 3600, client_factory=None):
+    """
+    Download all required datasets through the concurrent scheduler
+
+    regions: {name: bbox} to download (default: every region in the
+    registry). Runs unattended; nothing is asked on the console.
+
+    Each request is split into per-year chunks (plan_chunks), queued on CDS
+    in parallel (max_workers at a time), retried with exponential backoff
+    and tracked in data/raw/download_status.json, so re-running after an
+    interruption only fetches the missing chunks. Nearby regions share one
+    union bounding-box request and are subset locally afterwards.
+    """
     output_dir = '/Users/giulio/portfolio1-norway/data/raw'
+    regions = load_registry().bboxes() if regions is None else regions
 
     # Check credentials first
-    if not check_credentials():
+    if client_factory is None and not check_credentials():
         return False
 
     print("\n" + "="*60)
@@ -177,48 +206,51 @@ def download_all():
     print("Portfolio 1: Norway Historical Insurance Claims")
     print("="*60)
 
-    print("\nDatasets to download:")
-    print("1. SEAS5 seasonal hindcasts (Bergen)")
-    print("2. SEAS5 seasonal hindcasts (Oslo)")
-    print("3. ERA5 observations (Bergen)")
-    print("4. ERA5 observations (Oslo)")
-    print("\nEstimated total download time: 1-2 hours")
-    print("Estimated total size: ~1.5 GB")
-
-    response = input("\nProceed with download? (yes/no): ")
-    if response.lower() not in ['yes', 'y']:
-        print("Download cancelled.")
-        return False
-
-    # Download SEAS5 for Bergen
-    seas5_bergen = download_seas5_hindcasts('bergen', BERGEN_COORDS, output_dir)
-
-    # Download SEAS5 for Oslo
-    seas5_oslo = download_seas5_hindcasts('oslo', OSLO_COORDS, output_dir)
+    groups = plan_union_requests(regions)
 
-    # Download ERA5 for Bergen
-    era5_bergen = download_era5_observations('bergen', BERGEN_COORDS, output_dir)
-
-    # Download ERA5 for Oslo
-    era5_oslo = download_era5_observations('oslo', OSLO_COORDS, output_dir)
+    print(f"\nRegions: {len(regions)} in {len(groups)} union requests")
+    print("\nDatasets to download:")
+    for group in groups:
+        print(f"  SEAS5 seasonal hindcasts + ERA5 observations ({group.name}: {', '.join(group.members)})")
+    print(f"\nRunning up to {max_workers} requests in parallel ({max_retries} retries each)")
+    print(f"Estimated total size: ~{0.75 * len(groups):.1f} GB")
+
+    group_tasks = {
+        group.name: [seas5_task(group.name, group.bbox, output_dir),
+                     era5_task(group.name, group.bbox, output_dir)]
+        for group in groups
+    }
+    tasks = [task for group in groups for task in group_tasks[group.name]]
+    chunks = {task.name: plan_chunks(task) for task in tasks}
+    scheduler = DownloadScheduler(
+        f"{output_dir}/download_status.json",
+        client_factory=client_factory or cached_client_factory(),
+        max_workers=max_workers,
+        max_retries=max_retries,
+        timeout=timeout
+    )
+    chunk_results = scheduler.run([chunk for task in tasks for chunk in chunks[task.name]])
+    results = {task.name: all(chunk_results[chunk.name] for chunk in chunks[task.name]) for task in tasks}
 
     # Summary
     print("\n" + "="*60)
     print("DOWNLOAD SUMMARY")
     print("="*60)
 
-    success = all([seas5_bergen, seas5_oslo, era5_bergen, era5_oslo])
+    success = all(results.values())
 
     if success:
+        subset_union_downloads(groups, group_tasks, output_dir)
         print("\n✓ All datasets downloaded successfully!")
         print("\nFiles created:")
-        print(f"  - {seas5_bergen}")
-        print(f"  - {seas5_oslo}")
-        print(f"  - {era5_bergen}")
-        print(f"  - {era5_oslo}")
+        for task in tasks:
+            print(f"  - {os.path.dirname(chunks[task.name][0].target)} ({len(chunks[task.name])} chunks)")
         print("\n✓ PHASE 2 COMPLETE: ECMWF data downloaded")
     else:
         print("\n✗ Some downloads failed. Check errors above.")
+        for name, ok in chunk_results.items():
+            if not ok:
+                print(f"  ✗ {name}: {scheduler.status[name].get('error')}")
         print("\nYou can re-run this script to retry failed downloads.")
         print("Successfully downloaded files will be skipped.")
 
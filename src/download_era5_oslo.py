@@ -8,21 +8,22 @@ import xarray as xr
 import pandas as pd
 import numpy as np
 
-# Oslo coordinates (9km x 9km grid per thesis)
-oslo_area = {
-    'north': 60.0,
-    'south': 59.8,
-    'east': 10.9,
-    'west': 10.6
-}
+from download_cache import CachedClient
+from region_registry import load_registry
+from region_weights import grid_weights, regional_mean
+from storage import write_dataset
+
+# Oslo coordinates (9km x 9km grid per thesis, from config/regions.toml)
+oslo_region = load_registry()['oslo']
+oslo_area = oslo_region.bbox
 
 print("="*60)
 print("DOWNLOADING ERA5 FOR OSLO (2014-2021)")
 print("Monthly precipitation data")
 print("="*60)
 
-# Initialize CDS API
-c = cdsapi.Client()
+# Initialize CDS API (identical requests are served from the local download cache)
+c = CachedClient(cdsapi.Client())
 
 output_file = 'data/raw/era5_oslo_monthly_2014-2021.nc'
 
@@ -72,8 +73,9 @@ print(f"  Variables: {list(ds.data_vars)}")
 # Convert precipitation from meters to millimeters
 ds['tp'] = ds['tp'] * 1000
 
-# Spatial average (over Oslo area)
-precip_mean = ds['tp'].mean(dim=['latitude', 'longitude'])
+# Area-weighted spatial average (over Oslo area, cached weights)
+weights = grid_weights(ds, [oslo_region])
+precip_mean = regional_mean(ds['tp'], weights).sel(region='oslo', drop=True)
 
 # Convert to pandas DataFrame
 df = precip_mean.to_dataframe().reset_index()
@@ -130,10 +132,9 @@ print(f"Std dev: {std_precip:.1f}mm")
 print(f"Min: {quarterly['total_precip_mm'].min():.1f}mm")
 print(f"Max: {quarterly['total_precip_mm'].max():.1f}mm")
 
-# Save
-output_csv = 'data/processed/oslo_quarterly_precipitation_2014-2021.csv'
-quarterly.to_csv(output_csv, index=False)
-print(f"\n✅ Saved: {output_csv}")
+# Save to Parquet (partitioned by city)
+output_path = write_dataset(quarterly.assign(city='oslo'), 'data/processed/era5_quarterly_precipitation')
+print(f"\n✅ Saved: {output_path}/city=oslo")
 
 # Show high precipitation quarters
 print("\n=== HIGH PRECIPITATION QUARTERS ===")
@@ -10,6 +10,8 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
 
+from storage import SYNTHETIC_DIR, read_dataset
+
 def load_era5_data(filepath):
     """Load ERA5 precipitation data"""
     print(f"\nLoading ERA5 data from: {filepath}")
@@ -51,7 +53,7 @@ def merge_with_claims(era5_quarterly, claims_file, city):
     print(f"\nMerging ERA5 data with {city} claims...")
 
     # Load claims
-    claims = pd.read_csv(claims_file)
+    claims = read_dataset(claims_file, filters=[('city', '=', city.lower())])
 
     # Merge on year and quarter
     merged = era5_quarterly.merge(
@@ -132,7 +134,7 @@ def main():
     print(era5_quarterly)
 
     # Merge with Bergen claims
-    bergen_claims = '/Users/giulio/portfolio1-norway/data/synthetic/bergen_quarterly_2014-2021.csv'
+    bergen_claims = f'{SYNTHETIC_DIR}/quarterly_claims'
     bergen_merged = merge_with_claims(era5_quarterly, bergen_claims, 'Bergen')
 
     print("\nMerged Bergen Data:")
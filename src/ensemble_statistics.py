@@ -0,0 +1,127 @@
+"""
+Single-pass ensemble statistics for SEAS5 forecasts
+The member axis is sorted once; quantiles, mean, standard deviation and
+exceedance fractions are all read from the sorted members
+"""
+
+import numpy as np
+import xarray as xr
+
+# Quantiles reported by default (p50 is the ensemble median)
+DEFAULT_QUANTILES = (0.10, 0.25, 0.50, 0.75, 0.90, 0.95, 0.99)
+
+# Ensemble dimension names used by the CDS converters and our own cubes
+MEMBER_DIMS = ('number', 'member', 'ensemble')
+
+def find_member_dim(da):
+    """Name of the ensemble member dimension, or None"""
+    return next((dim for dim in MEMBER_DIMS if dim in da.dims), None)
+
+def quantile_label(q):
+    """Label of a quantile on the statistic axis (0.9 -> 'p90')"""
+    return f"p{q * 100:g}"
+
+def statistic_labels(quantiles=DEFAULT_QUANTILES, thresholds=()):
+    """Labels of the stacked statistic axis: mean, std, p<q>, exceed_<threshold>"""
+    return (['mean', 'std'] +
+            [quantile_label(q) for q in quantiles] +
+            [f"exceed_{threshold:g}" for threshold in thresholds])
+
+def _statistics_kernel(values, quantiles, thresholds, ddof=0):
+    """
+    Statistics over the last axis of values, stacked on a new last axis
+
+    Missing members (NaN, e.g. 25-member hindcasts padded to 51) are
+    ignored; quantiles use linear interpolation between order statistics,
+    as numpy/xarray do by default; std divides by n - ddof.
+    """
+    members = np.sort(values, axis=-1)  # NaNs sort to the end
+    valid = ~np.isnan(members)
+    n = valid.sum(axis=-1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = np.where(valid, members, 0.0).sum(axis=-1)
+        mean = total / n
+        deviation = np.where(valid, members - mean[..., None], 0.0)
+        std = np.sqrt((deviation ** 2).sum(axis=-1) / (n - ddof))
+
+        # Interpolate between order statistics of the valid members
+        last = np.maximum(n - 1, 0)[..., None]
+        position = np.asarray(quantiles) * last
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, last)
+        weight = position - lower
+        low_values = np.take_along_axis(members, lower, axis=-1)
+        high_values = np.take_along_axis(members, upper, axis=-1)
+        quantile_values = low_values + (high_values - low_values) * weight
+
+        exceedance = [(members > threshold).sum(axis=-1) / n for threshold in thresholds]
+
+    stats = np.concatenate([mean[..., None], std[..., None], quantile_values] +
+                           [fraction[..., None] for fraction in exceedance], axis=-1)
+    stats[n == 0] = np.nan
+    return stats
+
+def ensemble_statistics(da, quantiles=DEFAULT_QUANTILES, thresholds=(), member_dim=None, ddof=0):
+    """
+    All requested ensemble statistics in one pass over the member axis
+
+    da: DataArray with an ensemble member dimension (found automatically
+    unless member_dim is given); thresholds: values (in da's units) for
+    the fraction of members exceeding them. Returns one DataArray with the
+    member dimension replaced by a 'statistic' dimension labelled mean,
+    std, p10, ..., exceed_<threshold>. ddof: delta degrees of freedom of
+    std (0 for the spread of the ensemble itself, 1 when the samples
+    estimate a climatology). Dask-backed input stays lazy.
+    """
+    member_dim = member_dim or find_member_dim(da)
+    if member_dim is None:
+        raise ValueError(f"No ensemble dimension {MEMBER_DIMS} in {dict(da.sizes)}")
+
+    labels = statistic_labels(quantiles, thresholds)
+    if da.chunks:
+        # On-disk chunking may split the members; the kernel needs them all
+        da = da.chunk({member_dim: -1})
+    stats = xr.apply_ufunc(
+        _statistics_kernel, da,
+        input_core_dims=[[member_dim]],
+        output_core_dims=[['statistic']],
+        kwargs={'quantiles': tuple(quantiles), 'thresholds': tuple(thresholds), 'ddof': ddof},
+        dask='parallelized',
+        dask_gufunc_kwargs={'output_sizes': {'statistic': len(labels)}},
+        output_dtypes=[np.float64]
+    )
+    return stats.assign_coords(statistic=labels).rename(da.name)
+
+def _exceedance_kernel(values, thresholds):
+    """Fraction of valid members (last axis of values) above each threshold (last axis of thresholds)"""
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=-1)[..., None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        probability = (values[..., None, :] > thresholds[..., :, None]).sum(axis=-1) / n
+    return np.where(np.isnan(thresholds) | (n == 0), np.nan, probability)
+
+def exceedance_probability(da, thresholds, member_dim=None, threshold_dim='threshold'):
+    """
+    Probability of exceeding a tensor of thresholds, in one comparison
+
+    da: ensemble DataArray; thresholds: DataArray with a threshold_dim and
+    any of da's other dimensions (e.g. region x init x lead x threshold
+    climatological quantiles). Every member is compared against every
+    threshold at once and the exceeding fraction taken over the members.
+    """
+    member_dim = member_dim or find_member_dim(da)
+    if member_dim is None:
+        raise ValueError(f"No ensemble dimension {MEMBER_DIMS} in {dict(da.sizes)}")
+
+    if da.chunks:
+        da = da.chunk({member_dim: -1})
+    if thresholds.chunks:
+        thresholds = thresholds.chunk({threshold_dim: -1})
+    return xr.apply_ufunc(
+        _exceedance_kernel, da, thresholds,
+        input_core_dims=[[member_dim], [threshold_dim]],
+        output_core_dims=[[threshold_dim]],
+        dask='parallelized',
+        output_dtypes=[np.float64]
+    )
@@ -0,0 +1,272 @@
+"""
+Streaming reduction of hourly ERA5 precipitation to daily tables
+Hourly files are read block by block and reduced online to daily totals,
+maximum hourly intensity and multi-day accumulations per region, so memory
+depends on the block size and not on the length of the record
+"""
+
+import glob
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from cds_chunking import chunk_dir, plan_chunks
+from cds_scheduler import DownloadTask
+from region_registry import load_registry
+from region_weights import grid_weights, regional_mean
+from storage import PROCESSED_DIR, write_dataset
+
+RAW_DIR = '/Users/giulio/portfolio1-norway/data/raw'
+ERA5_DAILY_DIR = f'{PROCESSED_DIR}/era5_daily'
+
+# Hours read per block (one month of hourly fields)
+BLOCK_HOURS = 24 * 31
+
+# Windows (days) of the rolling multi-day accumulations
+ACCUMULATION_DAYS = (3, 5)
+
+# ERA5 hourly precipitation at a validity time is the total of the hour
+# ending then, so 00:00 belongs to the previous day
+ACCUMULATION_PERIOD = np.timedelta64(1, 'h')
+
+def hourly_target(city, output_dir=RAW_DIR, start_year=2014, end_year=2021):
+    return f"{output_dir}/era5_{city.lower()}_hourly_{start_year}-{end_year}.nc"
+
+def era5_hourly_task(city, coords, output_dir=RAW_DIR, start_year=2014, end_year=2021):
+    """ERA5 hourly precipitation retrieval as a DownloadTask (chunk it with hourly_chunks)"""
+    return DownloadTask(
+        name=f"era5_{city.lower()}_hourly",
+        dataset='reanalysis-era5-single-levels',
+        request={
+            'format': 'netcdf',
+            'product_type': 'reanalysis',
+            'variable': 'total_precipitation',
+            'year': [str(y) for y in range(start_year, end_year + 1)],
+            'month': [f"{m:02d}" for m in range(1, 13)],
+            'day': [f"{d:02d}" for d in range(1, 32)],
+            'time': [f"{h:02d}:00" for h in range(24)],
+            'area': [
+                coords['north'],
+                coords['west'],
+                coords['south'],
+                coords['east']
+            ],
+        },
+        target=hourly_target(city, output_dir, start_year, end_year)
+    )
+
+def hourly_chunks(task):
+    """One chunk per year and month (a month of hourly fields is one CDS request)"""
+    return plan_chunks(task, split_keys=('year', 'month'))
+
+def download_hourly(regions, output_dir=RAW_DIR, max_workers=4, max_retries=3, client_factory=None):
+    """Download monthly chunks of hourly ERA5 for each region; True if all succeeded"""
+    from cds_scheduler import DownloadScheduler
+    from download_ecmwf import cached_client_factory
+
+    tasks = [chunk for city, coords in regions.items()
+             for chunk in hourly_chunks(era5_hourly_task(city, coords, output_dir))]
+    scheduler = DownloadScheduler(
+        f"{output_dir}/era5_hourly_status.json",
+        client_factory=client_factory or cached_client_factory(),
+        max_workers=max_workers,
+        max_retries=max_retries
+    )
+    return all(scheduler.run(tasks).values())
+
+def hourly_files(target):
+    """The target file, or its chunk files, ordered by their first time step"""
+    if os.path.exists(target):
+        return [target]
+    paths = glob.glob(os.path.join(chunk_dir(target), '*.nc'))
+    if not paths:
+        raise FileNotFoundError(f"No hourly data found: {target} or {chunk_dir(target)}")
+
+    def first_time(path):
+        with xr.open_dataset(path) as ds:
+            return ds[time_dim(ds)].values.min()
+    return sorted(paths, key=first_time)
+
+def time_dim(ds):
+    return 'valid_time' if 'valid_time' in ds.dims else 'time'
+
+class DailyReducer:
+    """
+    Online hourly -> daily reduction for a fixed set of regions
+
+    update() takes consecutive blocks of hourly values (time, region) in
+    time order; a day is emitted once a later day has started, so a day
+    split across blocks or files is combined. Only the day still
+    receiving hours and the last max(windows) - 1 daily totals (for the
+    rolling accumulations) are carried between blocks.
+    """
+
+    def __init__(self, regions, windows=ACCUMULATION_DAYS):
+        self.regions = list(regions)
+        self.windows = tuple(windows)
+        self._open = None  # (day, total, peak, hours) of the day still receiving hours
+        self._history_days = np.empty(0, dtype=np.int64)
+        self._history = np.empty((0, len(self.regions)))
+        self._tables = []
+
+    def update(self, times, values):
+        """Add hourly values (time, region) in mm valid at times"""
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.regions))
+        if not len(times):
+            return
+        days = (np.asarray(times, dtype='datetime64[ns]') - ACCUMULATION_PERIOD).astype('datetime64[D]').astype(np.int64)
+        if np.any(np.diff(days) < 0) or (self._open is not None and days[0] < self._open[0]):
+            raise ValueError("Hourly values must be added in time order")
+
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        valid = ~np.isnan(values)
+        total = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+        peak = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+        hours = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        block_days = days[starts]
+
+        if self._open is not None:
+            open_day, open_total, open_peak, open_hours = self._open
+            if open_day == block_days[0]:
+                total[0] += open_total
+                peak[0] = np.maximum(peak[0], open_peak)
+                hours[0] += open_hours
+            else:
+                self._emit(np.array([open_day]), open_total[None], open_peak[None], open_hours[None])
+
+        self._emit(block_days[:-1], total[:-1], peak[:-1], hours[:-1])
+        self._open = (block_days[-1], total[-1], peak[-1], hours[-1])
+
+    def _emit(self, days, total, peak, hours):
+        """Record complete days, with rolling accumulations over consecutive days"""
+        if not len(days):
+            return
+        empty = hours == 0
+        total = np.where(empty, np.nan, total)
+        peak = np.where(empty, np.nan, peak)
+
+        all_days = np.concatenate([self._history_days, days])
+        all_totals = np.concatenate([self._history, total])
+        offset = len(self._history_days)
+        missing = np.cumsum(np.r_[np.zeros((1, len(self.regions))), np.isnan(all_totals)], axis=0)
+        sums = np.cumsum(np.r_[np.zeros((1, len(self.regions))), np.nan_to_num(all_totals)], axis=0)
+
+        table = {'day': days, 'precip_mm': total, 'max_hourly_mm': peak, 'hours': hours}
+        end = np.arange(offset, len(all_days)) + 1
+        for window in self.windows:
+            start = end - window
+            accumulation = np.full_like(total, np.nan)
+            ok = start >= 0
+            start_ok, end_ok = start[ok], end[ok]
+            # Only windows of consecutive days without missing totals
+            consecutive = all_days[end_ok - 1] - all_days[start_ok] == window - 1
+            window_sums = sums[end_ok] - sums[start_ok]
+            complete = (missing[end_ok] - missing[start_ok] == 0) & consecutive[:, None]
+            accumulation[ok] = np.where(complete, window_sums, np.nan)
+            table[f'precip_{window}d_mm'] = accumulation
+        self._tables.append(table)
+
+        keep = max(self.windows, default=1) - 1
+        self._history_days = all_days[-keep:] if keep else all_days[:0]
+        self._history = all_totals[-keep:] if keep else all_totals[:0]
+
+    def finish(self):
+        """Emit the last day and return the daily table (one row per region and day)"""
+        if self._open is not None:
+            day, total, peak, hours = self._open
+            self._emit(np.array([day]), total[None], peak[None], hours[None])
+            self._open = None
+
+        columns = ['precip_mm', 'max_hourly_mm', 'hours'] + [f'precip_{w}d_mm' for w in self.windows]
+        if not self._tables:
+            return pd.DataFrame(columns=['region', 'date'] + columns)
+        days = np.concatenate([table['day'] for table in self._tables])
+        n_regions = len(self.regions)
+        daily = pd.DataFrame({
+            'region': np.tile(self.regions, len(days)),
+            'date': np.repeat(days.astype('datetime64[D]'), n_regions).astype('datetime64[ns]'),
+            **{column: np.concatenate([table[column] for table in self._tables]).ravel()
+               for column in columns}
+        })
+        return daily.sort_values(['region', 'date'], kind='stable', ignore_index=True)
+
+def reduce_hourly(paths, regions, block_hours=BLOCK_HOURS, windows=ACCUMULATION_DAYS):
+    """
+    Daily table of area-weighted precipitation (mm) for regions from hourly files
+
+    paths: hourly ERA5 NetCDF files in time order (see hourly_files);
+    regions: registry Regions. Each file is read block_hours time steps
+    at a time.
+    """
+    reducer = DailyReducer([region.name for region in regions], windows)
+    for path in paths:
+        with xr.open_dataset(path) as ds:
+            var = next(v for v in ['tp', 'total_precipitation'] if v in ds.data_vars)
+            dim = time_dim(ds)
+            precip = ds[var]
+            extra = [d for d in precip.dims if d not in (dim, 'latitude', 'longitude')]
+            if any(precip.sizes[d] > 1 for d in extra):
+                raise ValueError(f"Unexpected dimensions {extra} in {path}")
+            precip = precip.isel({d: 0 for d in extra}, drop=True)
+
+            weights = grid_weights(ds, regions)
+            for start in range(0, precip.sizes[dim], block_hours):
+                block = precip.isel({dim: slice(start, start + block_hours)}).load() * 1000  # m -> mm
+                means = regional_mean(block, weights).transpose(dim, 'region')
+                reducer.update(block[dim].values, means.values)
+    return reducer.finish()
+
+def quarterly_from_daily(daily):
+    """Quarterly totals and extremes (max daily, max hourly, max multi-day) per region"""
+    accumulations = [c for c in daily.columns if c.startswith('precip_') and c.endswith('d_mm')]
+    grouped = daily.assign(year=daily['date'].dt.year, quarter=daily['date'].dt.quarter).groupby(
+        ['region', 'year', 'quarter'])
+    quarterly = grouped.agg(
+        total_precip_mm=('precip_mm', 'sum'),
+        max_daily_mm=('precip_mm', 'max'),
+        max_hourly_mm=('max_hourly_mm', 'max'),
+        days=('precip_mm', 'count'),
+        **{f"max_{column[len('precip_'):]}": (column, 'max') for column in accumulations}
+    ).reset_index()
+    quarterly['period'] = quarterly['year'].astype(str) + ' Q' + quarterly['quarter'].astype(str)
+    return quarterly
+
+def process_region(region, output_dir=RAW_DIR):
+    """Reduce one region's hourly files and save its daily table"""
+    try:
+        paths = hourly_files(hourly_target(region.name, output_dir))
+    except FileNotFoundError as e:
+        print(f"  ✗ {region.name}: {e}")
+        return None
+
+    daily = reduce_hourly(paths, [region])
+    write_dataset(daily.rename(columns={'region': 'city'}), ERA5_DAILY_DIR)
+    print(f"  ✓ {region.name}: {len(daily)} days from {len(paths)} files -> {ERA5_DAILY_DIR}/city={region.name}")
+    return daily
+
+def main():
+    """Reduce hourly ERA5 of every registry region (python era5_daily.py --download to fetch it first)"""
+    registry = load_registry()
+
+    print("="*60)
+    print("HOURLY ERA5 -> DAILY PRECIPITATION")
+    print("="*60)
+
+    if '--download' in sys.argv[1:] and not download_hourly(registry.bboxes()):
+        print("\n✗ Some hourly downloads failed, re-run to retry")
+        return None
+
+    results = {region.name: process_region(region) for region in registry}
+    for name, daily in results.items():
+        if daily is None:
+            continue
+        quarterly = quarterly_from_daily(daily)
+        print(f"\n=== {name.upper()} QUARTERLY EXTREMES ===")
+        print(quarterly[['period', 'total_precip_mm', 'max_daily_mm', 'max_hourly_mm']].to_string(index=False))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,12 @@ Generate synthetic Norwegian insurance claims data (2014-2021)
 Based on: Gorji & Rødal (2021) - Norwegian School of Economics
 """
 
+import calendar
+import os
+import shutil
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -10,301 +16,733 @@ from scipy import stats
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-# Set random seed for reproducibility
-np.random.seed(42)
+from storage import SYNTHETIC_DIR, write_dataset
+
+# Random seed for reproducibility
+SEED = 42
+
+# City profiles matching thesis statistics (Gorji & Rødal, 2021)
+# Day shares are fractions of all days; the remainder are 2+ claim days.
+# high_claim_days_per_year reserves days with 10+ claims (8 days over 2014-2021).
+# validation_ranges are the accepted percentage ranges used by validate_claims_ensemble.
+CITY_PROFILES = {
+    'bergen': {
+        'name': 'Bergen',
+        'zero_day_share': 0.805,
+        'one_day_share': 0.154,
+        'two_plus_values': [2, 3, 4, 5],
+        'two_plus_probs': [0.6, 0.25, 0.10, 0.05],
+        'high_claim_days_per_year': 1.0,
+        'high_claim_range': (10, 30),
+        'natural_peril_share': 0.55,
+        'rain_share_natural': 0.80,
+        'rain_share_other': 0.10,
+        'extreme_events': {
+            '2015-01-10': 291,  # Storm Nina
+            '2019-09-19': 29,   # Flood
+            '2016-01-29': 25    # Hurricane Tor
+        },
+        'extreme_natural_perils': {},
+        'validation_ranges': {
+            'zero_day_pct': (79, 82),
+            'one_day_pct': (14, 17),
+            'two_plus_day_pct': (3, 6),
+            'natural_peril_pct': (50, 60)
+        }
+    },
+    'oslo': {
+        'name': 'Oslo',
+        'zero_day_share': 0.762,
+        'one_day_share': 0.178,
+        'two_plus_values': [2, 3, 4, 5, 6],
+        'two_plus_probs': [0.5, 0.25, 0.15, 0.05, 0.05],
+        'high_claim_days_per_year': 1.0,
+        'high_claim_range': (10, 45),
+        'natural_peril_share': 0.14,
+        'rain_share_natural': 0.85,
+        'rain_share_other': 0.08,
+        'extreme_events': {
+            '2016-08-06': 220,  # "200-year rain" Asker
+            '2015-09-03': 45,   # Flooding period
+            '2015-09-04': 40,
+            '2015-09-05': 40
+        },
+        'extreme_natural_perils': {
+            '2016-08-06': 36,
+            '2015-09-03': 4,
+            '2015-09-04': 4,
+            '2015-09-05': 4
+        },
+        'validation_ranges': {
+            'zero_day_pct': (75, 78),
+            'one_day_pct': (16, 19),
+            'two_plus_day_pct': (5, 7),
+            'natural_peril_pct': (10, 18)
+        }
+    }
+}
+
+CLAIM_COLUMNS = ['total_claims', 'natural_perils', 'rain_associated']
 
-def create_date_range():
-    """Create daily date range for 2014-2021 (2920 days)"""
-    start_date = datetime(2014, 1, 1)
-    end_date = datetime(2021, 12, 31)
+# Significance level of the goodness-of-fit tests in validate_claims_ensemble:
+# a realization fails when chi-square or KS rejects the targets at this level
+GOF_SIGNIFICANCE = 0.05
+
+def create_date_range(start_year=2014, end_year=2021):
+    """Create daily date range for start_year-end_year (2922 days for 2014-2021)"""
+    start_date = datetime(start_year, 1, 1)
+    end_date = datetime(end_year, 12, 31)
     dates = pd.date_range(start=start_date, end=end_date, freq='D')
     return dates
 
-def generate_bergen_claims():
+def _event_indices(dates, events):
+    """Map {date string: value} overrides to day indices, dropping dates outside the range"""
+    if not events:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.int64)
+    idx = dates.get_indexer(pd.to_datetime(list(events.keys())))
+    values = np.fromiter(events.values(), dtype=np.int64, count=len(events))
+    in_range = idx >= 0
+    return idx[in_range], values[in_range]
+
+def _draw_daily_claims(profile, dates, n_realizations, rng):
     """
-    Generate synthetic Bergen claims matching thesis statistics:
-    - 80.5% zero-claim days
-    - 15.4% one-claim days
-    - 4.1% two+ claim days
-    - Natural perils: 55% of all claims
-    - Known extreme events
+    Draw (total, natural perils, rain-associated) claim arrays of shape
+    (n_realizations, n_days); each row is an independent realization
     """
-    dates = create_date_range()
     n_days = len(dates)
 
-    # Initialize daily claims array
-    daily_claims = np.zeros(n_days, dtype=int)
-
-    # Distribute days according to thesis statistics (adjusted for 2922 days)
-    zero_claim_days = int(n_days * 0.805)
-    one_claim_days = int(n_days * 0.154)
+    # Distribute days according to thesis statistics
+    zero_claim_days = int(n_days * profile['zero_day_share'])
+    one_claim_days = int(n_days * profile['one_day_share'])
     two_plus_claim_days = n_days - zero_claim_days - one_claim_days
+    high_claim_days = min(two_plus_claim_days,
+                          int(round(n_days / 365.25 * profile['high_claim_days_per_year'])))
+    n_regular = two_plus_claim_days - high_claim_days
+
+    # Fill each row in category order, then shuffle every row independently
+    daily_claims = np.zeros((n_realizations, n_days), dtype=np.int64)
+    daily_claims[:, :one_claim_days] = 1
+
+    # Most 2+ days get 2-3 claims, a reserved few get 10+ (power law tail)
+    regular = slice(one_claim_days, one_claim_days + n_regular)
+    daily_claims[:, regular] = rng.choice(
+        profile['two_plus_values'], size=(n_realizations, n_regular), p=profile['two_plus_probs']
+    )
+    low, high = profile['high_claim_range']
+    extreme = slice(regular.stop, regular.stop + high_claim_days)
+    daily_claims[:, extreme] = rng.integers(low, high, size=(n_realizations, high_claim_days))
 
-    # Create indices for each category
-    all_indices = np.arange(n_days)
-    np.random.shuffle(all_indices)
-
-    one_claim_indices = all_indices[:one_claim_days]
-    two_plus_indices = all_indices[one_claim_days:one_claim_days + two_plus_claim_days]
-
-    # Assign one claim to designated days
-    daily_claims[one_claim_indices] = 1
-
-    # For 2+ claim days, use power law distribution (typical for extreme events)
-    # Most days get 2-3 claims, few get many more
-    two_plus_claims = np.random.choice([2, 3, 4, 5], size=two_plus_claim_days-8, p=[0.6, 0.25, 0.10, 0.05])
+    rng.permuted(daily_claims, axis=1, out=daily_claims)
 
-    # Reserve 8 days for 10+ claims (from thesis)
-    high_claim_days = np.random.choice(range(10, 30), size=8)
+    # Insert known extreme events at specific dates
+    event_idx, event_claims = _event_indices(dates, profile['extreme_events'])
+    daily_claims[:, event_idx] = event_claims
+
+    # Each claim has natural_peril_share chance of being a natural peril
+    natural_perils = rng.binomial(daily_claims, profile['natural_peril_share'])
+    event_idx, event_perils = _event_indices(dates, profile['extreme_natural_perils'])
+    natural_perils[:, event_idx] = event_perils
+
+    # Rain-associated claims (share of natural perils + share of other claims)
+    rain_associated = np.minimum(
+        daily_claims,
+        rng.binomial(natural_perils, profile['rain_share_natural']) +
+        rng.binomial(daily_claims - natural_perils, profile['rain_share_other'])
+    )
 
-    daily_claims[two_plus_indices[:len(two_plus_claims)]] = two_plus_claims
-    daily_claims[two_plus_indices[len(two_plus_claims):]] = high_claim_days
+    return daily_claims, natural_perils, rain_associated
 
-    # Insert known extreme events at specific dates
-    extreme_events = {
-        '2015-01-10': 291,  # Storm Nina
-        '2019-09-19': 29,   # Flood
-        '2016-01-29': 25    # Hurricane Tor
-    }
+def generate_city_claims(profile, start_year=2014, end_year=2021, rng=None):
+    """
+    Generate synthetic daily claims for one city profile (see CITY_PROFILES)
+
+    Every draw is a single batched call over the whole day array:
+    - Zero/one/2+ claim days assigned by one random permutation
+    - 2+ claim counts from the profile's discrete distribution
+    - High-claim days (10+) scaled with the horizon length
+    - Known extreme events overridden by date
+    - Natural perils and rain-associated claims as array binomials
+    """
+    if rng is None:
+        rng = np.random.default_rng(SEED)
 
-    for date_str, claims in extreme_events.items():
-        idx = dates.get_loc(pd.Timestamp(date_str))
-        daily_claims[idx] = claims
+    dates = create_date_range(start_year, end_year)
+    daily_claims, natural_perils, rain_associated = _draw_daily_claims(profile, dates, 1, rng)
 
-    # Create DataFrame
     df = pd.DataFrame({
         'date': dates,
-        'total_claims': daily_claims
+        'total_claims': daily_claims[0],
+        'natural_perils': natural_perils[0],
+        'rain_associated': rain_associated[0]
     })
 
-    # Calculate natural perils (55% of all claims)
-    # Higher probability on high-claim days
-    natural_perils = []
-    for claims in daily_claims:
-        if claims == 0:
-            nat_perils = 0
-        else:
-            # Binomial distribution: each claim has 55% chance of being natural peril
-            nat_perils = np.random.binomial(claims, 0.55)
-        natural_perils.append(nat_perils)
-
-    df['natural_perils'] = natural_perils
-
-    # Rain-associated claims (subset of natural perils + some non-natural)
-    # Assume 80% of natural perils are rain-associated, plus 10% of other claims
-    df['rain_associated'] = df.apply(
-        lambda row: min(
-            row['total_claims'],
-            np.random.binomial(row['natural_perils'], 0.80) +
-            np.random.binomial(row['total_claims'] - row['natural_perils'], 0.10)
-        ),
-        axis=1
-    )
-
     # Add time features
-    df['year'] = df['date'].dt.year
-    df['month'] = df['date'].dt.month
-    df['quarter'] = df['date'].dt.quarter
+    df['year'] = dates.year
+    df['month'] = dates.month
+    df['quarter'] = dates.quarter
 
     return df
 
-def generate_oslo_claims():
+def generate_claims_ensemble(profile, n_realizations=10000, start_year=2014, end_year=2021,
+                             rng=None, block_size=1000):
     """
-    Generate synthetic Oslo claims matching thesis statistics:
-    - 76.2% zero-claim days
-    - 17.8% one-claim days
-    - 6.0% two+ claim days
-    - Natural perils: 14% of all claims
-    - Known extreme events
+    Generate a Monte Carlo ensemble of synthetic claim histories
+
+    Returns a dict with 'dates' and uint16 arrays of shape
+    (n_realizations, n_days) for total_claims, natural_perils and
+    rain_associated. Realizations are drawn in blocks of block_size rows
+    to bound the int64 temporaries used by the binomial draws.
     """
-    dates = create_date_range()
-    n_days = len(dates)
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+
+    dates = create_date_range(start_year, end_year)
+    shape = (n_realizations, len(dates))
+    ensemble = {
+        'dates': dates,
+        'total_claims': np.empty(shape, dtype=np.uint16),
+        'natural_perils': np.empty(shape, dtype=np.uint16),
+        'rain_associated': np.empty(shape, dtype=np.uint16)
+    }
 
-    # Initialize daily claims array
-    daily_claims = np.zeros(n_days, dtype=int)
+    for start in range(0, n_realizations, block_size):
+        rows = slice(start, min(start + block_size, n_realizations))
+        draws = _draw_daily_claims(profile, dates, rows.stop - rows.start, rng)
+        for column, values in zip(CLAIM_COLUMNS, draws):
+            ensemble[column][rows] = values
 
-    # Distribute days according to thesis statistics (adjusted for 2922 days)
-    zero_claim_days = int(n_days * 0.762)
-    one_claim_days = int(n_days * 0.178)
-    two_plus_claim_days = n_days - zero_claim_days - one_claim_days
+    return ensemble
 
-    # Create indices for each category
-    all_indices = np.arange(n_days)
-    np.random.shuffle(all_indices)
+def period_index(dates, freq='quarter'):
+    """
+    Map each day to an integer period code
 
-    one_claim_indices = all_indices[:one_claim_days]
-    two_plus_indices = all_indices[one_claim_days:one_claim_days + two_plus_claim_days]
+    freq: 'month', 'quarter', 'season' (DJF/MAM/JJA/SON, December counted
+    in the following year's DJF) or an array of per-day labels for custom
+    periods. Returns (codes, index) where codes[i] is the period of day i
+    and index is a DataFrame with one row per period, in sorted order.
+    """
+    dates = pd.DatetimeIndex(dates)
+    year = np.asarray(dates.year)
+    month = np.asarray(dates.month)
+
+    if not isinstance(freq, str):
+        codes, labels = pd.factorize(np.asarray(freq), sort=True)
+        return codes, pd.DataFrame({'period': labels})
+
+    if freq == 'month':
+        keys = year * 12 + month - 1
+    elif freq == 'quarter':
+        keys = year * 4 + (month - 1) // 3
+    elif freq == 'season':
+        keys = (year + (month == 12)) * 4 + (month % 12) // 3
+    else:
+        raise ValueError(f"Unknown period frequency: {freq}")
 
-    # Assign one claim to designated days
-    daily_claims[one_claim_indices] = 1
+    unique_keys, codes = np.unique(keys, return_inverse=True)
 
-    # For 2+ claim days, use power law distribution
-    two_plus_claims = np.random.choice([2, 3, 4, 5, 6], size=two_plus_claim_days-8, p=[0.5, 0.25, 0.15, 0.05, 0.05])
+    if freq == 'month':
+        index = pd.DataFrame({'year': unique_keys // 12, 'month': unique_keys % 12 + 1})
+        index.insert(0, 'period', index['year'].astype(str) + '-' + index['month'].map('{:02d}'.format))
+    elif freq == 'quarter':
+        index = pd.DataFrame({'year': unique_keys // 4, 'quarter': unique_keys % 4 + 1})
+        index.insert(0, 'period', index['year'].astype(str) + ' Q' + index['quarter'].astype(str))
+    else:
+        index = pd.DataFrame({'year': unique_keys // 4,
+                              'season': np.array(['DJF', 'MAM', 'JJA', 'SON'])[unique_keys % 4]})
+        index.insert(0, 'period', index['year'].astype(str) + ' ' + index['season'])
 
-    # Reserve 8 days for 10+ claims
-    high_claim_days = np.random.choice(range(10, 45), size=8)
+    return codes, index
 
-    daily_claims[two_plus_indices[:len(two_plus_claims)]] = two_plus_claims
-    daily_claims[two_plus_indices[len(two_plus_claims):]] = high_claim_days
+def aggregate_by_period(values, codes, n_periods):
+    """
+    Per-period sums, nonzero-day counts and maxima in one vectorized pass
 
-    # Insert known extreme events at specific dates
-    extreme_events = {
-        '2016-08-06': 220,  # "200-year rain" Asker
-        '2015-09-03': 45,   # Flooding period
-        '2015-09-04': 40,
-        '2015-09-05': 40
-    }
+    values: non-negative integer array of shape (..., n_days), e.g. stacked
+    claim columns (n_columns, n_days) or an ensemble (n_columns,
+    n_realizations, n_days). The leading axes are flattened into a single
+    np.bincount / np.maximum.at over (row, period) bins.
+    Returns (sums, nonzero, maxima), each of shape (..., n_periods).
+    """
+    values = np.asarray(values)
+    lead_shape = values.shape[:-1]
+    n_rows = int(np.prod(lead_shape))
+    n_bins = n_rows * n_periods
+
+    flat_values = values.reshape(n_rows, -1)
+    bins = (np.asarray(codes)[None, :] + (np.arange(n_rows) * n_periods)[:, None]).ravel()
+    flat_values = flat_values.ravel()
+
+    sums = np.bincount(bins, weights=flat_values, minlength=n_bins).astype(np.int64)
+    nonzero = np.bincount(bins[flat_values > 0], minlength=n_bins)
+    maxima = np.zeros(n_bins, dtype=values.dtype)
+    np.maximum.at(maxima, bins, flat_values)
+
+    out_shape = lead_shape + (n_periods,)
+    return sums.reshape(out_shape), nonzero.reshape(out_shape), maxima.reshape(out_shape)
+
+def aggregate_ensemble_quarterly(ensemble, freq='quarter', block_size=1000):
+    """
+    Aggregate an ensemble (see generate_claims_ensemble) to period values
+
+    Realizations are reduced block_size rows at a time with
+    aggregate_by_period. Returns a DataFrame 'index' of periods plus
+    (n_realizations, n_periods) arrays.
+    """
+    codes, index = period_index(ensemble['dates'], freq)
+    n_realizations = len(ensemble['total_claims'])
+    n_periods = len(index)
+
+    quarterly = {'index': index}
+    for column in CLAIM_COLUMNS:
+        quarterly[column] = np.empty((n_realizations, n_periods), dtype=np.int64)
+    quarterly['days_with_claims'] = np.empty((n_realizations, n_periods), dtype=np.int64)
+    quarterly['max_daily_claims'] = np.empty((n_realizations, n_periods), dtype=np.uint16)
+
+    for start in range(0, n_realizations, block_size):
+        rows = slice(start, start + block_size)
+        stacked = np.stack([ensemble[column][rows] for column in CLAIM_COLUMNS])
+        sums, nonzero, maxima = aggregate_by_period(stacked, codes, n_periods)
+
+        for i, column in enumerate(CLAIM_COLUMNS):
+            quarterly[column][rows] = sums[i]
+        quarterly['days_with_claims'][rows] = nonzero[0]
+        quarterly['max_daily_claims'][rows] = maxima[0]
 
-    for date_str, claims in extreme_events.items():
-        idx = dates.get_loc(pd.Timestamp(date_str))
-        daily_claims[idx] = claims
+    return quarterly
+
+def city_seed_sequence(city, seed=SEED):
+    """
+    Root SeedSequence for one city, keyed on the city name so a city's
+    stream does not depend on which other cities are generated or in which order
+    """
+    return np.random.SeedSequence(seed, spawn_key=(zlib.crc32(city.encode()),))
+
+def _generate_ensemble_block(task):
+    """Process-pool worker: generate one block of realizations from its own child seed"""
+    profile, n_rows, start_year, end_year, seed_sequence = task
+    ensemble = generate_claims_ensemble(profile, n_rows, start_year, end_year,
+                                        rng=np.random.default_rng(seed_sequence), block_size=n_rows)
+    return [ensemble[column] for column in CLAIM_COLUMNS]
+
+def generate_ensembles_parallel(profiles, n_realizations=10000, start_year=2014, end_year=2021,
+                                n_workers=None, seed=SEED, block_size=1000):
+    """
+    Generate claim ensembles for many cities on a process pool
+
+    Each city's realizations are split into fixed blocks of block_size rows,
+    and every block draws from its own SeedSequence.spawn child. Blocks do
+    not depend on the number of workers, so output is bit-identical for any
+    n_workers (None uses all cores, 1 runs in-process).
+
+    Returns {city: ensemble} in the generate_claims_ensemble format.
+    """
+    dates = create_date_range(start_year, end_year)
+    n_blocks = -(-n_realizations // block_size)
+
+    tasks = []
+    for city, profile in profiles.items():
+        block_seeds = city_seed_sequence(city, seed).spawn(n_blocks)
+        for block, block_seed in enumerate(block_seeds):
+            n_rows = min(block_size, n_realizations - block * block_size)
+            tasks.append((profile, n_rows, start_year, end_year, block_seed))
+
+    if n_workers == 1:
+        blocks = list(map(_generate_ensemble_block, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            blocks = list(pool.map(_generate_ensemble_block, tasks))
+
+    ensembles = {}
+    for i, city in enumerate(profiles):
+        city_blocks = blocks[i * n_blocks:(i + 1) * n_blocks]
+        ensembles[city] = {'dates': dates}
+        for j, column in enumerate(CLAIM_COLUMNS):
+            ensembles[city][column] = np.concatenate([block[j] for block in city_blocks])
+
+    return ensembles
+
+def run_ensemble(n_realizations=10000, n_workers=None):
+    """Generate and save Monte Carlo claim ensembles for Bergen and Oslo"""
+    print("="*60)
+    print(f"GENERATING CLAIMS ENSEMBLE ({n_realizations} realizations)")
+    print("="*60)
+
+    print(f"\nGenerating {', '.join(p['name'] for p in CITY_PROFILES.values())} ensembles "
+          f"on {n_workers or os.cpu_count()} workers...")
+    ensembles = generate_ensembles_parallel(CITY_PROFILES, n_realizations, n_workers=n_workers)
+
+    for city, ensemble in ensembles.items():
+        print(f"\n{CITY_PROFILES[city]['name']}:")
+        quarterly = aggregate_ensemble_quarterly(ensemble)
+
+        output_file = f'/Users/giulio/portfolio1-norway/data/synthetic/{city}_ensemble_2014-2021.npz'
+        np.savez_compressed(
+            output_file,
+            dates=ensemble['dates'].values,
+            periods=quarterly['index']['period'].values.astype(str),
+            **{column: ensemble[column] for column in CLAIM_COLUMNS},
+            **{f'quarterly_{column}': quarterly[column] for column in CLAIM_COLUMNS}
+        )
+        print(f"  ✓ {city}_ensemble_2014-2021.npz")
+
+        totals = quarterly['total_claims'].sum(axis=1)
+        print(f"  Total claims per realization: median {np.median(totals):.0f}, "
+              f"5-95% [{np.percentile(totals, 5):.0f}, {np.percentile(totals, 95):.0f}]")
+
+        validation = validate_claims_ensemble(ensemble, CITY_PROFILES[city])
+        print(f"  Validation: {validation['passed'].mean():.1%} of realizations pass thesis ranges")
+
+# Lazy generation: every day consumes a fixed block of Philox output, so the
+# counter for (realization, day) is known without generating earlier days
+UNIFORMS_PER_DAY = 8      # Philox emits 4 x 64-bit words per counter step
+COUNTER_STEPS_PER_DAY = UNIFORMS_PER_DAY // 4
+DAY_ORIGIN = np.datetime64('0001-01-01', 'D')
+
+def _philox_key(city, seed=SEED):
+    """128-bit Philox key for a city (see city_seed_sequence)"""
+    return city_seed_sequence(city, seed).generate_state(2, dtype=np.uint64)
+
+def _day_uniforms(city, realization, first_day, n_days, seed=SEED):
+    """
+    Uniforms in (0, 1] of shape (n_days, UNIFORMS_PER_DAY) for consecutive days
+
+    first_day counts days from DAY_ORIGIN. The Philox counter is
+    (day * COUNTER_STEPS_PER_DAY, realization, 0, 0) and the key is derived
+    from the city, so any slice reproduces the same values as a full run.
+    """
+    counter = [first_day * COUNTER_STEPS_PER_DAY, realization, 0, 0]
+    rng = np.random.Generator(np.random.Philox(key=_philox_key(city, seed), counter=counter))
+    return 1.0 - rng.random((n_days, UNIFORMS_PER_DAY))
+
+def generate_claims_slice(profile, city, start_date, end_date, realization=0, seed=SEED):
+    """
+    Generate any date slice of a city's catalog lazily and reproducibly
+
+    Unlike generate_city_claims (which fixes the share of each day type over
+    the whole horizon), days are drawn independently with the profile's
+    zero/one/2+/high-claim probabilities, from uniforms keyed on
+    (city, realization, day). Generating year 9,000 costs the same as
+    year 1 and matches the same days taken from a longer slice.
+    Returns the same columns as generate_city_claims.
+    """
+    day_numbers = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    dates = pd.DatetimeIndex(day_numbers)
+    first_day = int((day_numbers[0] - DAY_ORIGIN).astype(np.int64))
+    u = _day_uniforms(city, realization, first_day, len(day_numbers), seed)
+
+    # Day categories: one claim, regular 2+, high (10+), otherwise zero
+    p_one = profile['one_day_share']
+    p_high = profile['high_claim_days_per_year'] / 365.25
+    p_regular = 1.0 - profile['zero_day_share'] - p_one - p_high
+    category = np.searchsorted(np.cumsum([p_one, p_regular, p_high]), u[:, 0], side='right')
+
+    cdf = np.cumsum(profile['two_plus_probs'])
+    regular_claims = np.asarray(profile['two_plus_values'])[
+        np.minimum(np.searchsorted(cdf, u[:, 1] * cdf[-1]), len(cdf) - 1)
+    ]
+    low, high = profile['high_claim_range']
+    high_claims = np.minimum(low + ((1.0 - u[:, 1]) * (high - low)).astype(np.int64), high - 1)
+
+    daily_claims = np.select([category == 0, category == 1, category == 2],
+                             [1, regular_claims, high_claims], default=0).astype(np.int64)
+
+    event_idx, event_claims = _event_indices(dates, profile['extreme_events'])
+    daily_claims[event_idx] = event_claims
+
+    # Binomial draws by inverse CDF so each day uses a fixed number of uniforms
+    natural_perils = stats.binom.ppf(u[:, 2], daily_claims, profile['natural_peril_share']).astype(np.int64)
+    event_idx, event_perils = _event_indices(dates, profile['extreme_natural_perils'])
+    natural_perils[event_idx] = event_perils
+
+    rain_associated = np.minimum(
+        daily_claims,
+        stats.binom.ppf(u[:, 3], natural_perils, profile['rain_share_natural']).astype(np.int64) +
+        stats.binom.ppf(u[:, 4], daily_claims - natural_perils, profile['rain_share_other']).astype(np.int64)
+    )
 
-    # Create DataFrame
     df = pd.DataFrame({
         'date': dates,
-        'total_claims': daily_claims
+        'total_claims': daily_claims,
+        'natural_perils': natural_perils,
+        'rain_associated': rain_associated
     })
 
-    # Calculate natural perils (14% of all claims)
-    natural_perils = []
-    for claims in daily_claims:
-        if claims == 0:
-            nat_perils = 0
-        else:
-            nat_perils = np.random.binomial(claims, 0.14)
-        natural_perils.append(nat_perils)
-
-    df['natural_perils'] = natural_perils
-
-    # For Oslo extreme events, set natural perils from thesis
-    df.loc[df['date'] == '2016-08-06', 'natural_perils'] = 36
-    df.loc[df['date'] == '2015-09-03', 'natural_perils'] = 4
-    df.loc[df['date'] == '2015-09-04', 'natural_perils'] = 4
-    df.loc[df['date'] == '2015-09-05', 'natural_perils'] = 4
-
-    # Rain-associated claims
-    df['rain_associated'] = df.apply(
-        lambda row: min(
-            row['total_claims'],
-            np.random.binomial(row['natural_perils'], 0.85) +
-            np.random.binomial(row['total_claims'] - row['natural_perils'], 0.08)
-        ),
-        axis=1
-    )
-
     # Add time features
-    df['year'] = df['date'].dt.year
-    df['month'] = df['date'].dt.month
-    df['quarter'] = df['date'].dt.quarter
+    df['year'] = dates.year
+    df['month'] = dates.month
+    df['quarter'] = dates.quarter
 
     return df
 
-def create_quarterly_aggregations(df, city):
-    """Aggregate daily claims to quarterly totals"""
-    quarterly = df.groupby(['year', 'quarter']).agg({
-        'total_claims': 'sum',
-        'natural_perils': 'sum',
-        'rain_associated': 'sum',
-        'date': 'count'  # Days in quarter
-    }).reset_index()
-
-    # Add days with claims
-    days_with_claims = df[df['total_claims'] > 0].groupby(['year', 'quarter']).size()
-    quarterly = quarterly.merge(
-        days_with_claims.reset_index(name='days_with_claims'),
-        on=['year', 'quarter'],
-        how='left'
-    )
-    quarterly['days_with_claims'].fillna(0, inplace=True)
+def iter_claims_catalog(profile, n_years, city, seed=SEED):
+    """
+    Yield (sim_year, daily DataFrame) for a stochastic catalog, one year at a time
 
-    # Add max daily claims per quarter
-    max_daily = df.groupby(['year', 'quarter'])['total_claims'].max()
-    quarterly = quarterly.merge(
-        max_daily.reset_index(name='max_daily_claims'),
-        on=['year', 'quarter']
+    Simulation years are numbered 1..n_years and drawn on a 365/366-day
+    calendar (leap years follow the Gregorian rule on sim_year). Historical
+    extreme events are pinned to real dates, so they are not applied here.
+    Only one year is held in memory, whatever n_years is.
+    """
+    stochastic_profile = {**profile, 'extreme_events': {}, 'extreme_natural_perils': {}}
+    calendars = {leap: create_date_range(year, year) for leap, year in [(False, 2001), (True, 2004)]}
+    root = city_seed_sequence(city, seed)
+
+    for sim_year in range(1, n_years + 1):
+        dates = calendars[calendar.isleap(sim_year)]
+        rng = np.random.default_rng(root.spawn(1)[0])
+        daily_claims, natural_perils, rain_associated = _draw_daily_claims(stochastic_profile, dates, 1, rng)
+
+        yield sim_year, pd.DataFrame({
+            'sim_year': np.full(len(dates), sim_year, dtype=np.int32),
+            'day_of_year': dates.dayofyear.astype(np.int16),
+            'month': dates.month.astype(np.int8),
+            'quarter': dates.quarter.astype(np.int8),
+            'total_claims': daily_claims[0].astype(np.uint16),
+            'natural_perils': natural_perils[0].astype(np.uint16),
+            'rain_associated': rain_associated[0].astype(np.uint16)
+        })
+
+def _aggregate_catalog_quarterly(daily):
+    """Quarterly totals for a chunk of catalog years"""
+    return daily.assign(
+        has_claims=daily['total_claims'] > 0
+    ).groupby(['sim_year', 'quarter'], as_index=False).agg(
+        total_claims=('total_claims', 'sum'),
+        natural_perils=('natural_perils', 'sum'),
+        rain_associated=('rain_associated', 'sum'),
+        days_with_claims=('has_claims', 'sum'),
+        max_daily_claims=('total_claims', 'max')
     )
 
-    # Rename and create period column
-    quarterly.rename(columns={'date': 'days_in_quarter'}, inplace=True)
-    quarterly['period'] = quarterly['year'].astype(str) + ' Q' + quarterly['quarter'].astype(str)
+def write_claims_catalog(city, n_years, output_dir, years_per_file=100, seed=SEED):
+    """
+    Stream a stochastic claims catalog to partitioned Parquet datasets
+
+    Years from iter_claims_catalog are buffered years_per_file at a time and
+    written as one file per block, so peak memory depends on years_per_file
+    and not on n_years:
+      {output_dir}/daily/city={city}/block={n}/part-0.parquet
+      {output_dir}/quarterly/city={city}/block={n}/part-0.parquet
+    Any previous catalog of the city is removed first, so blocks of a
+    longer earlier run are not read back with this one.
+    """
+    profile = CITY_PROFILES[city]
+    buffer = []
+    n_files = 0
+
+    for table in ('daily', 'quarterly'):
+        shutil.rmtree(os.path.join(output_dir, table, f'city={city}'), ignore_errors=True)
 
-    # Reorder columns
-    quarterly = quarterly[['period', 'year', 'quarter', 'total_claims', 'natural_perils',
-                          'rain_associated', 'days_with_claims', 'max_daily_claims']]
+    for sim_year, daily in iter_claims_catalog(profile, n_years, city, seed):
+        buffer.append(daily)
+        if len(buffer) < years_per_file and sim_year < n_years:
+            continue
+
+        chunk = pd.concat(buffer, ignore_index=True)
+        buffer.clear()
+        block = (sim_year - 1) // years_per_file
+
+        for table, frame in [('daily', chunk), ('quarterly', _aggregate_catalog_quarterly(chunk))]:
+            write_dataset(frame.assign(city=city, block=f'{block:05d}'), os.path.join(output_dir, table),
+                          partition_cols=('city', 'block'))
+        n_files += 1
+
+    return n_files
+
+def run_catalog(n_years=1000, years_per_file=100):
+    """Stream stochastic claims catalogs for Bergen and Oslo to Parquet"""
+    print("="*60)
+    print(f"STREAMING CLAIMS CATALOG ({n_years} simulated years)")
+    print("="*60)
+
+    output_dir = '/Users/giulio/portfolio1-norway/data/synthetic/catalog'
+
+    for city, profile in CITY_PROFILES.items():
+        print(f"\nWriting {profile['name']} catalog...")
+        n_files = write_claims_catalog(city, n_years, output_dir, years_per_file)
+        print(f"  ✓ {n_files} blocks of {years_per_file} years in {output_dir}")
+
+def generate_bergen_claims(rng=None):
+    """
+    Generate synthetic Bergen claims matching thesis statistics:
+    - 80.5% zero-claim days
+    - 15.4% one-claim days
+    - 4.1% two+ claim days
+    - Natural perils: 55% of all claims
+    - Known extreme events
+    """
+    return generate_city_claims(CITY_PROFILES['bergen'], rng=rng)
+
+def generate_oslo_claims(rng=None):
+    """
+    Generate synthetic Oslo claims matching thesis statistics:
+    - 76.2% zero-claim days
+    - 17.8% one-claim days
+    - 6.0% two+ claim days
+    - Natural perils: 14% of all claims
+    - Known extreme events
+    """
+    return generate_city_claims(CITY_PROFILES['oslo'], rng=rng)
+
+def create_quarterly_aggregations(df, city, freq='quarter'):
+    """Aggregate daily claims to quarterly totals (or other periods, see period_index)"""
+    codes, quarterly = period_index(df['date'], freq)
+    stacked = np.stack([df[column].to_numpy() for column in CLAIM_COLUMNS])
+    sums, nonzero, maxima = aggregate_by_period(stacked, codes, len(quarterly))
+
+    for i, column in enumerate(CLAIM_COLUMNS):
+        quarterly[column] = sums[i]
+    quarterly['days_with_claims'] = nonzero[0]
+    quarterly['max_daily_claims'] = maxima[0]
 
     return quarterly
 
+def target_count_distribution(profile):
+    """
+    Target probability of each daily claim count 0..max under a profile
+
+    2+ days split into regular values and the uniform high-claim range;
+    known extreme events are ignored (counts above the range are clipped).
+    """
+    low, high = profile['high_claim_range']
+    p_two_plus = 1.0 - profile['zero_day_share'] - profile['one_day_share']
+    p_high = profile['high_claim_days_per_year'] / 365.25
+
+    probs = np.zeros(high)
+    probs[0] = profile['zero_day_share']
+    probs[1] = profile['one_day_share']
+    np.add.at(probs, profile['two_plus_values'], (p_two_plus - p_high) * np.asarray(profile['two_plus_probs']))
+    probs[low:high] += p_high / (high - low)
+    return probs
+
+def validate_claims_ensemble(ensemble, profile, block_size=1000, significance=GOF_SIGNIFICANCE):
+    """
+    Validate every realization against a profile's thesis targets at once
+
+    ensemble: dict with total_claims and natural_perils arrays of shape
+    (n_realizations, n_days) (1-D arrays are treated as one realization).
+    Computes day-type shares, natural-peril share, a chi-square test of
+    zero/one/2+ day counts and a KS distance between the empirical and
+    target daily count distributions (asymptotic p-value, conservative for
+    discrete counts). Returns one row per realization
+    with the statistics, a pass flag per check (the percentage ranges,
+    and chi2_ok/ks_ok for p >= significance) and an overall 'passed'.
+    """
+    total = np.atleast_2d(ensemble['total_claims'])
+    natural = np.atleast_2d(ensemble['natural_perils'])
+    n_realizations, n_days = total.shape
+
+    target = target_count_distribution(profile)
+    n_values = len(target)
+    target_cdf = np.cumsum(target)
+
+    # Empirical count histograms (clipped to the target range), in row blocks
+    histogram = np.empty((n_realizations, n_values), dtype=np.int64)
+    for start in range(0, n_realizations, block_size):
+        block = np.minimum(total[start:start + block_size], n_values - 1).astype(np.int64)
+        bins = block + (np.arange(len(block)) * n_values)[:, None]
+        histogram[start:start + block_size] = np.bincount(
+            bins.ravel(), minlength=len(block) * n_values
+        ).reshape(len(block), n_values)
+
+    observed = np.column_stack([histogram[:, 0], histogram[:, 1], histogram[:, 2:].sum(axis=1)])
+    expected = n_days * np.array([target[0], target[1], target[2:].sum()])
+    chi2 = ((observed - expected) ** 2 / expected).sum(axis=1)
+
+    ks_stat = np.abs(np.cumsum(histogram, axis=1) / n_days - target_cdf).max(axis=1)
+
+    claim_sums = total.sum(axis=1, dtype=np.int64)
+    natural_sums = natural.sum(axis=1, dtype=np.int64)
+
+    results = pd.DataFrame({
+        'zero_day_pct': observed[:, 0] / n_days * 100,
+        'one_day_pct': observed[:, 1] / n_days * 100,
+        'two_plus_day_pct': observed[:, 2] / n_days * 100,
+        'natural_peril_pct': np.divide(natural_sums * 100, claim_sums,
+                                       out=np.zeros(n_realizations), where=claim_sums > 0),
+        'chi2': chi2,
+        'chi2_p': stats.chi2.sf(chi2, df=2),
+        'ks_stat': ks_stat,
+        'ks_p': stats.kstwobign.sf(ks_stat * np.sqrt(n_days))
+    })
+    results.index.name = 'realization'
+
+    checks = []
+    for metric, (low, high) in profile['validation_ranges'].items():
+        results[f'{metric}_ok'] = results[metric].between(low, high)
+        checks.append(f'{metric}_ok')
+    for test in ('chi2', 'ks'):
+        results[f'{test}_ok'] = results[f'{test}_p'] >= significance
+        checks.append(f'{test}_ok')
+    results['passed'] = results[checks].all(axis=1)
+
+    return results
+
 def validate_data(df, city, quarterly):
     """Validate synthetic data against thesis specifications"""
     print(f"\n{'='*60}")
     print(f"VALIDATION REPORT: {city.upper()}")
     print(f"{'='*60}\n")
 
+    profile = CITY_PROFILES[city.lower()]
+    result = validate_claims_ensemble(
+        {column: df[column].to_numpy() for column in CLAIM_COLUMNS}, profile
+    ).iloc[0]
+    failures = [name[:-3] for name in result.index if name.endswith('_ok') and not result[name]]
+
     # Check total days (2014-2021 inclusive is 2922 days due to leap years)
     print(f"Total days: {len(df)} (expected: 2922)")
-    assert len(df) == 2922, "Incorrect number of days"
-
-    # Check distribution of claim days
-    zero_claims = (df['total_claims'] == 0).sum()
-    one_claim = (df['total_claims'] == 1).sum()
-    two_plus = (df['total_claims'] >= 2).sum()
-
-    total_days = zero_claims + one_claim + two_plus
+    if len(df) != 2922:
+        failures.append('n_days')
 
+    total_days = len(df)
     print(f"\nDaily Claim Distribution:")
-    print(f"  Zero-claim days: {zero_claims} ({zero_claims/total_days*100:.1f}%)")
-    print(f"  One-claim days: {one_claim} ({one_claim/total_days*100:.1f}%)")
-    print(f"  2+ claim days: {two_plus} ({two_plus/total_days*100:.1f}%)")
-
-    if city == 'Bergen':
-        assert 79 <= zero_claims/total_days*100 <= 82, "Bergen zero-claim days mismatch"
-        assert 14 <= one_claim/total_days*100 <= 17, "Bergen one-claim days mismatch"
-        assert 3 <= two_plus/total_days*100 <= 6, "Bergen 2+ claim days mismatch"
-    else:
-        assert 75 <= zero_claims/total_days*100 <= 78, "Oslo zero-claim days mismatch"
-        assert 16 <= one_claim/total_days*100 <= 19, "Oslo one-claim days mismatch"
-        assert 5 <= two_plus/total_days*100 <= 7, "Oslo 2+ claim days mismatch"
+    print(f"  Zero-claim days: {(df['total_claims'] == 0).sum()} ({result['zero_day_pct']:.1f}%)")
+    print(f"  One-claim days: {(df['total_claims'] == 1).sum()} ({result['one_day_pct']:.1f}%)")
+    print(f"  2+ claim days: {(df['total_claims'] >= 2).sum()} ({result['two_plus_day_pct']:.1f}%)")
+    print(f"  Chi-square vs targets: {result['chi2']:.2f} (p = {result['chi2_p']:.3f}, "
+          f"alpha = {GOF_SIGNIFICANCE})")
+    print(f"  KS distance vs targets: {result['ks_stat']:.3f} (p = {result['ks_p']:.3f}, "
+          f"alpha = {GOF_SIGNIFICANCE})")
 
     # Check natural perils percentage
     total_claims = df['total_claims'].sum()
-    total_nat_perils = df['natural_perils'].sum()
-    nat_peril_pct = (total_nat_perils / total_claims * 100) if total_claims > 0 else 0
-
     print(f"\nNatural Perils:")
     print(f"  Total claims: {total_claims}")
-    print(f"  Natural peril claims: {total_nat_perils} ({nat_peril_pct:.1f}%)")
-
-    if city == 'Bergen':
-        assert 50 <= nat_peril_pct <= 60, f"Bergen natural perils should be ~55%, got {nat_peril_pct:.1f}%"
-    else:
-        assert 10 <= nat_peril_pct <= 18, f"Oslo natural perils should be ~14%, got {nat_peril_pct:.1f}%"
+    print(f"  Natural peril claims: {df['natural_perils'].sum()} ({result['natural_peril_pct']:.1f}%)")
 
     # Check extreme events
     print(f"\nExtreme Events:")
     high_claim_days = df[df['total_claims'] >= 10].sort_values('total_claims', ascending=False)
     print(f"  Days with 10+ claims: {len(high_claim_days)}")
     print(f"\n  Top 5 claim days:")
-    for _, row in high_claim_days.head(5).iterrows():
-        print(f"    {row['date'].strftime('%Y-%m-%d')}: {row['total_claims']} claims ({row['natural_perils']} natural perils)")
+    print(high_claim_days.head(5)[['date', 'total_claims', 'natural_perils']].to_string(index=False))
 
     # Check weekly average
-    weeks = len(df) / 7
+    weeks = total_days / 7
     avg_per_week = total_claims / weeks
     print(f"\nAverage claims per week: {avg_per_week:.1f} (expected: ~3)")
 
     # Check quarterly data
     print(f"\nQuarterly Aggregations:")
     print(f"  Total quarters: {len(quarterly)} (expected: 32)")
-    assert len(quarterly) == 32, "Should have 32 quarters (8 years × 4)"
+    if len(quarterly) != 32:
+        failures.append('n_quarters')
 
     print(f"\n  Top 5 loss quarters:")
     top_quarters = quarterly.nlargest(5, 'total_claims')[['period', 'total_claims', 'natural_perils', 'max_daily_claims']]
     print(top_quarters.to_string(index=False))
 
     print(f"\n{'='*60}")
-    print(f"✓ {city} validation PASSED")
+    if failures:
+        print(f"✗ {city} validation FAILED: {', '.join(failures)}")
+    else:
+        print(f"✓ {city} validation PASSED")
     print(f"{'='*60}\n")
 
+    return not failures
+
 def create_validation_plots(df_bergen, df_oslo, quarterly_bergen, quarterly_oslo):
     """Create validation visualizations"""
     fig, axes = plt.subplots(2, 3, figsize=(18, 10))
@@ -372,7 +810,7 @@ def create_validation_plots(df_bergen, df_oslo, quarterly_bergen, quarterly_oslo
     print(f"\n✓ Validation plots saved to outputs/figures/synthetic_data_validation.png")
 
 def main():
-    """Main execution function"""
+    """Main execution function; returns exit status 1 if validation failed"""
     print("="*60)
     print("GENERATING SYNTHETIC NORWEGIAN INSURANCE CLAIMS DATA")
     print("Based on: Gorji & Rødal (2021)")
@@ -380,40 +818,49 @@ def main():
 
     # Generate Bergen data
     print("\nGenerating Bergen claims data...")
-    df_bergen = generate_bergen_claims()
+    df_bergen = generate_bergen_claims(np.random.default_rng(city_seed_sequence('bergen')))
 
     # Generate Oslo data
     print("Generating Oslo claims data...")
-    df_oslo = generate_oslo_claims()
+    df_oslo = generate_oslo_claims(np.random.default_rng(city_seed_sequence('oslo')))
 
     # Create quarterly aggregations
     print("\nCreating quarterly aggregations...")
     quarterly_bergen = create_quarterly_aggregations(df_bergen, 'Bergen')
     quarterly_oslo = create_quarterly_aggregations(df_oslo, 'Oslo')
 
-    # Save to CSV
+    # Save to Parquet (daily partitioned by city/year, quarterly by city)
     print("\nSaving data files...")
-    df_bergen.to_csv('/Users/giulio/portfolio1-norway/data/synthetic/bergen_daily_claims_2014-2021.csv', index=False)
-    df_oslo.to_csv('/Users/giulio/portfolio1-norway/data/synthetic/oslo_daily_claims_2014-2021.csv', index=False)
-    quarterly_bergen.to_csv('/Users/giulio/portfolio1-norway/data/synthetic/bergen_quarterly_2014-2021.csv', index=False)
-    quarterly_oslo.to_csv('/Users/giulio/portfolio1-norway/data/synthetic/oslo_quarterly_2014-2021.csv', index=False)
+    write_dataset(pd.concat([df_bergen.assign(city='bergen'), df_oslo.assign(city='oslo')]),
+                  f'{SYNTHETIC_DIR}/daily_claims', partition_cols=('city', 'year'))
+    write_dataset(pd.concat([quarterly_bergen.assign(city='bergen'), quarterly_oslo.assign(city='oslo')]),
+                  f'{SYNTHETIC_DIR}/quarterly_claims', partition_cols=('city',))
 
-    print("  ✓ bergen_daily_claims_2014-2021.csv")
-    print("  ✓ oslo_daily_claims_2014-2021.csv")
-    print("  ✓ bergen_quarterly_2014-2021.csv")
-    print("  ✓ oslo_quarterly_2014-2021.csv")
+    print("  ✓ daily_claims/city={bergen,oslo}/year=2014..2021")
+    print("  ✓ quarterly_claims/city={bergen,oslo}")
 
     # Validate data
-    validate_data(df_bergen, 'Bergen', quarterly_bergen)
-    validate_data(df_oslo, 'Oslo', quarterly_oslo)
+    valid = {city: validate_data(df, city, quarterly) for city, df, quarterly in
+             [('Bergen', df_bergen, quarterly_bergen), ('Oslo', df_oslo, quarterly_oslo)]}
 
     # Create validation plots
     print("\nGenerating validation plots...")
     create_validation_plots(df_bergen, df_oslo, quarterly_bergen, quarterly_oslo)
 
     print("\n" + "="*60)
+    failed = [city for city, ok in valid.items() if not ok]
+    if failed:
+        print(f"✗ PHASE 1 FAILED: {', '.join(failed)} synthetic claims failed validation")
+        print("="*60)
+        return 1
     print("✓ PHASE 1 COMPLETE: Synthetic claims data generated")
     print("="*60)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == '--ensemble':
+        run_ensemble(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    elif len(sys.argv) > 1 and sys.argv[1] == '--catalog':
+        run_catalog(int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+    else:
+        sys.exit(main())
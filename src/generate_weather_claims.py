@@ -0,0 +1,118 @@
+"""
+Generate weather-driven synthetic claims over daily precipitation
+Claim rates depend on ERA5 precipitation in every grid cell (or region) and day
+"""
+
+import os
+import numpy as np
+import xarray as xr
+
+from era5_daily import ERA5_DAILY_DIR
+from generate_claims import city_seed_sequence
+from storage import SYNTHETIC_DIR, read_dataset, write_dataset
+
+WEATHER_CLAIMS_DIR = f'{SYNTHETIC_DIR}/weather_claims'
+
+# Claim rate model per policy-day:
+#   background rate (all perils, independent of weather)
+#   + rain-driven rate growing exponentially above a precipitation threshold
+WEATHER_RATE_PARAMS = {
+    'base_rate': 2e-5,              # claims per policy-day on dry days
+    'rain_rate': 1e-5,              # extra claims per policy-day at the threshold
+    'precip_threshold_mm': 10.0,    # daily precipitation where rain claims start
+    'precip_sensitivity': 0.08,     # growth of rain rate per mm above threshold
+    'max_excess_mm': 150.0,         # cap on excess precipitation (keeps rates finite)
+    'natural_peril_share': 0.14,    # share of background claims that are natural perils
+    'dispersion': 2.0               # negative binomial shape k (None for Poisson)
+}
+
+def claim_rates(precip_mm, exposure, params=WEATHER_RATE_PARAMS):
+    """
+    Background and rain-driven claim rates for every cell and day
+
+    precip_mm: array (time, ...) of daily precipitation; exposure: policies
+    per cell, broadcastable to precip_mm. Returns (base, rain) rate arrays.
+    """
+    excess = np.clip(precip_mm - params['precip_threshold_mm'], 0, params['max_excess_mm'])
+    base = exposure * params['base_rate'] * np.ones_like(precip_mm)
+    rain = np.where(
+        precip_mm > params['precip_threshold_mm'],
+        exposure * params['rain_rate'] * np.exp(params['precip_sensitivity'] * excess),
+        0.0
+    )
+    return base, rain
+
+def draw_counts(rate, rng, dispersion=None):
+    """Poisson counts, or negative binomial (shape dispersion) with the same mean"""
+    if dispersion is None:
+        return rng.poisson(rate)
+    # Gamma-Poisson mixture: mean rate, variance rate + rate**2 / dispersion
+    return rng.poisson(rng.gamma(dispersion, rate / dispersion))
+
+def generate_weather_claims(precip, exposure=1000, params=WEATHER_RATE_PARAMS, rng=None):
+    """
+    Draw daily claim counts for every grid cell and day in one batched call
+
+    precip: DataArray of daily precipitation in mm with a 'time' dimension
+    (e.g. time x latitude x longitude); exposure: policies per cell (scalar
+    or DataArray over the spatial dimensions). Rain-driven claims are
+    rain-associated natural perils; a share of background claims are also
+    natural perils. Returns a Dataset with total_claims, natural_perils
+    and rain_associated on the same grid as precip.
+    """
+    if rng is None:
+        rng = np.random.default_rng(city_seed_sequence('norway'))
+
+    exposure = xr.DataArray(exposure).broadcast_like(precip).transpose(*precip.dims)
+    precip_mm = np.nan_to_num(precip.values, nan=0.0)
+    base_rate, rain_rate = claim_rates(precip_mm, exposure.values, params)
+
+    background = draw_counts(base_rate, rng, params['dispersion'])
+    rain_associated = draw_counts(rain_rate, rng, params['dispersion'])
+    natural_perils = rain_associated + rng.binomial(background, params['natural_peril_share'])
+
+    return xr.Dataset(
+        {
+            'total_claims': (precip.dims, (background + rain_associated).astype(np.int32)),
+            'natural_perils': (precip.dims, natural_perils.astype(np.int32)),
+            'rain_associated': (precip.dims, rain_associated.astype(np.int32))
+        },
+        coords=precip.coords
+    )
+
+def load_daily_precipitation(path=ERA5_DAILY_DIR):
+    """Daily precipitation (time x region, mm) from the era5_daily table of every region"""
+    daily = read_dataset(path, columns=['city', 'date', 'precip_mm'])
+    table = daily.assign(city=daily['city'].astype(str)).pivot(index='date', columns='city', values='precip_mm')
+    return xr.DataArray(table.values, dims=('time', 'region'),
+                        coords={'time': table.index.values, 'region': table.columns.values})
+
+def main():
+    """Generate a weather-driven synthetic portfolio from the ERA5 daily precipitation of every region"""
+    print("="*60)
+    print("GENERATING WEATHER-DRIVEN CLAIMS")
+    print("="*60)
+
+    if not os.path.exists(ERA5_DAILY_DIR):
+        print(f"ERROR: ERA5 daily precipitation not found: {ERA5_DAILY_DIR}")
+        print("Run era5_daily.py --download first to build the daily tables.")
+        return None
+
+    precip = load_daily_precipitation()
+    print(f"\nPrecipitation: {dict(precip.sizes)}")
+    claims = generate_weather_claims(precip)
+
+    national = claims.sum(dim='region')
+    r = np.corrcoef(precip.mean(dim='region').values, national['total_claims'].values)[0, 1]
+
+    print(f"  ✓ Total claims: {int(national['total_claims'].sum())}")
+    print(f"  Rain-associated: {int(national['rain_associated'].sum())}")
+    print(f"  Daily correlation (mean precip vs claims): r = {r:.3f}")
+
+    table = claims.to_dataframe().reset_index().rename(columns={'time': 'date', 'region': 'city'})
+    write_dataset(table, WEATHER_CLAIMS_DIR)
+    print(f"\n✓ Saved to: {WEATHER_CLAIMS_DIR}")
+    return claims
+
+if __name__ == "__main__":
+    main()
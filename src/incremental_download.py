@@ -0,0 +1,254 @@
+"""
+Incremental SEAS5/ERA5 updates into chunked Zarr stores
+Only the (year, month) and (init, lead) slots missing from the local store
+are retrieved, then appended along the time dimension
+"""
+
+import os
+import sys
+from dataclasses import replace
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from cds_chunking import has_data, open_chunked
+from cds_scheduler import DownloadScheduler
+from download_ecmwf import (SEAS5_INIT_MONTHS, SEAS5_LEADTIMES, cached_client_factory, check_credentials,
+                            era5_task, seas5_task)
+from region_registry import load_registry
+
+# Full-archive downloads (download_ecmwf.py) the stores are seeded from
+ARCHIVE_DIR = '/Users/giulio/portfolio1-norway/data/raw'
+ZARR_DIR = f'{ARCHIVE_DIR}/zarr'
+
+START_YEAR = 2014
+
+# Time dimension names used by the CDS NetCDF converters (new, then legacy)
+TIME_DIMS = {
+    'era5': ('valid_time', 'time'),
+    'seas5': ('forecast_reference_time', 'time')
+}
+LEAD_DIM = 'forecastMonth'
+
+# Time steps per Zarr chunk (one year of monthly fields / quarterly inits)
+TIME_CHUNKS = {
+    'era5': 12,
+    'seas5': 4
+}
+
+TASK_BUILDERS = {
+    'era5': era5_task,
+    'seas5': seas5_task
+}
+
+def store_path(product, city):
+    """Zarr store for one product and region"""
+    return f"{ZARR_DIR}/{product}_{city.lower()}.zarr"
+
+def time_dim(ds, product):
+    """Name of the time (ERA5) or initialization (SEAS5) dimension in ds"""
+    for dim in TIME_DIMS[product]:
+        if dim in ds.dims:
+            return dim
+    raise ValueError(f"No time dimension {TIME_DIMS[product]} in dataset: {dict(ds.sizes)}")
+
+def has_store(product, city):
+    return os.path.exists(store_path(product, city))
+
+def open_store(product, city, chunks=None):
+    """
+    Open a Zarr store sorted in time (delta appends may fill gaps out of
+    order); chunks=None opens without dask, otherwise dask chunk sizes per
+    dimension as in open_chunked ({} keeps the store chunks)
+    """
+    ds = xr.open_zarr(store_path(product, city), consolidated=False, chunks=None if chunks is None else {})
+    if chunks:
+        ds = ds.chunk({dim: size for dim, size in chunks.items() if dim in ds.dims})
+    return ds.sortby(time_dim(ds, product))
+
+def expected_slots(product, end=None, start_year=START_YEAR):
+    """
+    Slots that should exist up to end (default: today)
+
+    ERA5: (year, month) for every complete month before end.
+    SEAS5: (year, init month, lead) for quarterly inits on or before end.
+    """
+    end = pd.Timestamp(end or date.today())
+    if product == 'era5':
+        months = pd.period_range(f"{start_year}-01", end.to_period('M') - 1, freq='M')
+        return {(m.year, m.month) for m in months}
+
+    return {
+        (year, int(month), int(lead))
+        for year in range(start_year, end.year + 1)
+        for month in SEAS5_INIT_MONTHS if pd.Timestamp(year, int(month), 1) <= end
+        for lead in SEAS5_LEADTIMES
+    }
+
+def stored_slots(product, city):
+    """Slots already present in the store (empty set if it does not exist)"""
+    path = store_path(product, city)
+    if not os.path.exists(path):
+        return set()
+
+    ds = xr.open_zarr(path, consolidated=False)
+    times = pd.DatetimeIndex(ds[time_dim(ds, product)].values)
+    if product == 'era5':
+        return set(zip(times.year, times.month))
+
+    leads = ds[LEAD_DIM].values.astype(int) if LEAD_DIM in ds.dims else SEAS5_LEADTIMES
+    return {(t.year, t.month, int(lead)) for t in times for lead in leads}
+
+def missing_slots(product, city, end=None):
+    """Expected slots not yet in the store, sorted"""
+    return sorted(expected_slots(product, end) - stored_slots(product, city))
+
+def delta_tasks(product, city, coords, missing, output_dir):
+    """
+    DownloadTasks for the missing slots, one per year
+
+    Each task reuses the full-archive request with year and month
+    narrowed to the missing values, so CDS only extracts those fields.
+    Leads are a fixed dimension of the SEAS5 store, so a missing init is
+    always fetched with all of its leads.
+    """
+    template = TASK_BUILDERS[product](city, coords, output_dir)
+    by_year = {}
+    for slot in missing:
+        by_year.setdefault(slot[0], []).append(slot)
+
+    tasks = []
+    for year, slots in sorted(by_year.items()):
+        request = {**template.request,
+                   'year': [str(year)],
+                   'month': sorted({f"{slot[1]:02d}" for slot in slots})}
+        tasks.append(replace(
+            template,
+            name=f"{template.name}_delta{year}",
+            request=request,
+            target=f"{output_dir}/{template.name}_delta{year}.nc"
+        ))
+    return tasks
+
+def append_to_store(ds, product, city):
+    """
+    Append new time steps to the store (created on first call)
+
+    Time steps already in the store are dropped, so re-running a delta is
+    a no-op. Deltas are small and written from memory.
+    """
+    path = store_path(product, city)
+    dim = time_dim(ds, product)
+    ds = ds.sortby(dim)
+
+    if os.path.exists(path):
+        existing = xr.open_zarr(path, consolidated=False)[dim].values
+        ds = ds.sel({dim: ~np.isin(ds[dim].values, existing)})
+        if ds.sizes[dim] == 0:
+            return 0
+        ds.load().to_zarr(path, append_dim=dim, consolidated=False)
+    else:
+        os.makedirs(ZARR_DIR, exist_ok=True)
+        ds = ds.load()
+        encoding = {var: {'chunks': tuple(TIME_CHUNKS[product] if d == dim else ds.sizes[d]
+                                          for d in ds[var].dims)}
+                    for var in ds.data_vars}
+        ds.to_zarr(path, mode='w', encoding=encoding, consolidated=False)
+    return ds.sizes[dim]
+
+def seed_store(product, city, coords, archive_dir=ARCHIVE_DIR):
+    """
+    Create the store from the full-archive NetCDF (single file or chunks)
+    if there is no store yet; returns the time steps written
+    """
+    archive = TASK_BUILDERS[product](city, coords, archive_dir).target
+    if has_store(product, city) or not has_data(archive):
+        return 0
+    with open_chunked(archive) as ds:
+        n = append_to_store(ds, product, city)
+    print(f"  ✓ {product}_{city}: seeded {n} time steps from {archive}")
+    return n
+
+def update_store(product, city, coords, end=None, output_dir=None, client_factory=None,
+                 max_workers=4, max_retries=3):
+    """
+    Fetch the missing slots for one product/region and append them (the
+    store is seeded from the existing archive first); returns the slots added
+    """
+    output_dir = output_dir or f"{ZARR_DIR}/deltas"
+    seed_store(product, city, coords)
+    missing = missing_slots(product, city, end)
+    if not missing:
+        print(f"  ✓ {product}_{city}: up to date")
+        return []
+
+    stored = {slot[:2] for slot in stored_slots(product, city)}
+    if any(slot[:2] in stored for slot in missing):
+        raise ValueError(f"{store_path(product, city)} has inits with missing leads; "
+                         f"the lead layout changed, rebuild the store")
+
+    print(f"  {product}_{city}: {len(missing)} missing slots ({missing[0]} .. {missing[-1]})")
+    tasks = delta_tasks(product, city, coords, missing, output_dir)
+    scheduler = DownloadScheduler(
+        f"{ZARR_DIR}/delta_status.json",
+        client_factory=client_factory or cached_client_factory(),
+        max_workers=max_workers,
+        max_retries=max_retries
+    )
+    results = scheduler.run(tasks)
+
+    for task in tasks:
+        if not results[task.name]:
+            continue
+        with xr.open_dataset(task.target) as delta:
+            size_kb = os.path.getsize(task.target) / 1024
+            n = append_to_store(delta, product, city)
+        os.remove(task.target)
+        print(f"  ✓ {task.name}: appended {n} time steps ({size_kb:.0f} KB)")
+
+    return sorted(set(missing) - set(missing_slots(product, city, end)))
+
+def update_all(end=None, client_factory=None, regions=None):
+    """
+    Bring the SEAS5 and ERA5 stores of every region (default: whole
+    registry) up to date; True if all of them are complete
+
+    A store that cannot be updated (e.g. its grid or lead layout no longer
+    matches the deltas) is reported and skipped, the others still run.
+    """
+    if client_factory is None and not check_credentials():
+        return False
+
+    print("\n" + "="*60)
+    print("INCREMENTAL ECMWF UPDATE")
+    print("="*60)
+
+    complete = True
+    failed = []
+    for city, coords in (load_registry().bboxes() if regions is None else regions).items():
+        for product in ('seas5', 'era5'):
+            try:
+                update_store(product, city, coords, end, client_factory=client_factory)
+            except ValueError as e:
+                print(f"  ✗ {product}_{city}: {e}")
+                failed.append(f"{product}_{city}")
+                continue
+            complete &= not missing_slots(product, city, end)
+
+    if failed:
+        print(f"\n✗ Stores not updated (see errors above): {', '.join(failed)}")
+    elif complete:
+        print("\n✓ All stores up to date")
+    else:
+        print("\n✗ Some slots still missing, re-run to retry")
+    print("="*60)
+    return complete and not failed
+
+def main():
+    """Main execution (optional end date: python incremental_download.py 2024-06-30)"""
+    update_all(sys.argv[1] if len(sys.argv) > 1 else None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,389 @@
+"""
+Stage-level pipeline runner
+Each stage declares its inputs, outputs and parameters; stages whose input
+hashes are unchanged and whose outputs exist are skipped, and independent
+stages (per region) run in parallel
+
+Usage:
+    python src/pipeline.py                      # run everything that is out of date
+    python src/pipeline.py analyze oslo_figures # run these targets and their upstream stages
+    python src/pipeline.py --dry-run            # show what would run
+    python src/pipeline.py --force process_oslo --workers 4
+    python src/pipeline.py --hourly             # also download hourly ERA5 and build daily tables
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import runpy
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from cds_chunking import chunk_dir
+from download_cache import file_checksum
+from incremental_download import store_path
+from climatology import CLIMATOLOGY_DIR, CLIMATOLOGY_END, CLIMATOLOGY_START
+from region_registry import REGISTRY_FILE, load_registry
+from storage import PROCESSED_DIR, SYNTHETIC_DIR
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+RAW_DIR = '/Users/giulio/portfolio1-norway/data/raw'
+FIGURES_DIR = '/Users/giulio/portfolio1-norway/outputs/figures'
+STATE_FILE = f'{PROCESSED_DIR}/pipeline_state.json'
+
+@dataclass
+class Stage:
+    """
+    One pipeline step: func(**params) in a worker process
+
+    inputs/outputs are files or directories (relative paths are taken
+    from the repository root); code names the src/ modules implementing
+    the stage (the modules they import are hashed with them); deps are
+    upstream stage names. func returns False (or raises) on failure.
+    """
+    name: str
+    func: callable
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    deps: list = field(default_factory=list)
+    code: list = field(default_factory=list)
+
+def resolve(path):
+    return path if os.path.isabs(path) else os.path.join(REPO_DIR, path)
+
+def _existing(path):
+    """The path itself, or its chunk directory for chunked downloads, or None"""
+    path = resolve(path)
+    if os.path.exists(path):
+        return path
+    return chunk_dir(path) if os.path.exists(chunk_dir(path)) else None
+
+def module_sources(modules):
+    """Source files of src/ modules and of the src/ modules they import, transitively"""
+    seen, queue = set(), list(modules)
+    while queue:
+        name = queue.pop()
+        path = os.path.join(SRC_DIR, f"{name}.py")
+        if name in seen or not os.path.exists(path):
+            continue
+        seen.add(name)
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                queue.extend(alias.name.split('.')[0] for alias in node.names)
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                queue.append(node.module.split('.')[0])
+    return sorted(os.path.join(SRC_DIR, f"{name}.py") for name in seen)
+
+# Stage functions (module level so worker processes can import them)
+
+def run_script(script):
+    """Run a script from src/ as __main__ with the repository root as working directory"""
+    os.chdir(REPO_DIR)
+    runpy.run_path(os.path.join(SRC_DIR, script), run_name='__main__')
+
+def generate_claims_stage():
+    from generate_claims import main
+    return main() == 0
+
+def download_stage(regions):
+    from download_ecmwf import download_all
+    return download_all(regions)
+
+def climatology_stage():
+    from climatology import main
+    return main() is not None
+
+def process_region_stage(region, bbox):
+    # bbox is passed so a change to this region's geometry reruns only this stage
+    from process_forecasts import process_city_data
+    return process_city_data(region.title()) is not None
+
+def era5_hourly_stage(regions):
+    from era5_daily import download_hourly
+    return download_hourly(regions)
+
+def era5_daily_stage(region, bbox):
+    from era5_daily import process_region
+    return process_region(load_registry()[region]) is not None
+
+def analyze_stage():
+    from analyze_correlation import main
+    main()
+
+def build_pipeline(registry=None, hourly=False):
+    """
+    Stages of the ECMWF/claims workflow and the Oslo validation chain
+
+    Daily ERA5 stages are included for regions whose hourly files are on
+    disk; hourly=True includes them for every region, downloading the
+    hourly files first.
+    """
+    registry = load_registry() if registry is None else registry
+    regions = registry.bboxes()
+    raw_files = {name: [f'{RAW_DIR}/seas5_{name}_2014-2021.nc', f'{RAW_DIR}/era5_{name}_2014-2021.nc']
+                 for name in regions}
+
+    hindcast_files = [f'{RAW_DIR}/seas5_{name}_{CLIMATOLOGY_START}-{CLIMATOLOGY_END}.nc' for name in regions]
+    # Nothing here downloads hindcasts: without them there is no climatology
+    # stage and processing falls back to in-sample anomaly statistics
+    climatology = ['climatology'] if any(_existing(path) for path in hindcast_files) else []
+
+    stages = [
+        Stage('claims', generate_claims_stage,
+              outputs=[f'{SYNTHETIC_DIR}/daily_claims', f'{SYNTHETIC_DIR}/quarterly_claims'],
+              code=['generate_claims']),
+        Stage('download', download_stage, params={'regions': regions},
+              outputs=[path for files in raw_files.values() for path in files],
+              code=['download_ecmwf'])
+    ]
+    if climatology:
+        stages.append(Stage('climatology', climatology_stage,
+                            inputs=hindcast_files + [REGISTRY_FILE],
+                            outputs=[CLIMATOLOGY_DIR],
+                            code=['climatology']))
+    for name, bbox in regions.items():
+        stages.append(Stage(
+            f'process_{name}', process_region_stage,
+            # Processing reads the incremental Zarr stores before the raw downloads; the
+            # stores and the climatology are optional (a missing path hashes as 'missing')
+            inputs=raw_files[name] + [store_path('seas5', name), store_path('era5', name),
+                                      f'{SYNTHETIC_DIR}/quarterly_claims/city={name}', CLIMATOLOGY_DIR],
+            outputs=[f'{PROCESSED_DIR}/quarterly_forecasts/city={name}',
+                     f'{PROCESSED_DIR}/forecast_cube/{name}.zarr'],
+            params={'region': name, 'bbox': bbox},
+            deps=['claims', 'download'] + climatology,
+            code=['process_forecasts']
+        ))
+    hourly_files = {name: f'{RAW_DIR}/era5_{name}_hourly_2014-2021.nc' for name in regions}
+    if hourly:
+        stages.append(Stage('era5_hourly', era5_hourly_stage, params={'regions': regions},
+                            outputs=list(hourly_files.values()),
+                            code=['era5_daily']))
+    for name, bbox in regions.items():
+        if not hourly and not _existing(hourly_files[name]):
+            continue
+        stages.append(Stage(
+            f'era5_daily_{name}', era5_daily_stage,
+            inputs=[hourly_files[name]],
+            outputs=[f'{PROCESSED_DIR}/era5_daily/city={name}'],
+            params={'region': name, 'bbox': bbox},
+            deps=['era5_hourly'] if hourly else [],
+            code=['era5_daily']
+        ))
+    analyzed = [name for name in ('bergen', 'oslo') if name in regions]
+    stages.append(Stage(
+        'analyze', analyze_stage,
+        inputs=[f'{PROCESSED_DIR}/quarterly_forecasts/city={name}' for name in analyzed] +
+               [f'{SYNTHETIC_DIR}/{name}_ensemble_2014-2021.npz' for name in analyzed],
+        outputs=['/Users/giulio/portfolio1-norway/outputs/reports/correlation_analysis.md',
+                 f'{FIGURES_DIR}/scatter_precip_vs_claims.png',
+                 f'{FIGURES_DIR}/quarterly_forecast_skill.png',
+                 f'{FIGURES_DIR}/event_detection_confusion_matrix.png'],
+        deps=[f'process_{name}' for name in analyzed],
+        code=['analyze_correlation']
+    ))
+
+    # Oslo validation chain (scripts with repository-relative paths)
+    stages += [
+        Stage('oslo_precip', run_script, params={'script': 'download_era5_oslo.py'},
+              inputs=[REGISTRY_FILE], code=['download_era5_oslo'],
+              outputs=['data/raw/era5_oslo_monthly_2014-2021.nc',
+                       'data/processed/era5_quarterly_precipitation/city=oslo']),
+        Stage('oslo_claims', run_script, params={'script': 'process_nask_oslo.py'},
+              inputs=['data/raw/nask_oslo_quarterly_2014-2021.csv'], code=['process_nask_oslo'],
+              outputs=['data/processed/nask_quarterly_claims/city=oslo']),
+        Stage('oslo_merge', run_script, params={'script': 'analyze_oslo_correlation.py'},
+              code=['analyze_oslo_correlation'],
+              inputs=['data/processed/nask_quarterly_claims/city=oslo',
+                      'data/processed/era5_quarterly_precipitation/city=oslo'],
+              outputs=['data/processed/merged_claims_precip'],
+              deps=['oslo_precip', 'oslo_claims']),
+        Stage('oslo_figures', run_script, params={'script': 'visualize_oslo_validation.py'},
+              inputs=['data/processed/merged_claims_precip'], code=['visualize_oslo_validation'],
+              outputs=['outputs/figures/oslo_scatter_precip_vs_claims.png',
+                       'outputs/figures/oslo_timeseries_claims_precip.png',
+                       'outputs/figures/oslo_event_detection_scorecard.png'],
+              deps=['oslo_merge'])
+    ]
+    return {stage.name: stage for stage in stages}
+
+class PipelineRunner:
+    """
+    Run stages in dependency order with at most max_workers in parallel
+
+    A stage's key hashes its parameters, the source of its code modules
+    (and the src/ modules they import) and the contents of its inputs (file hashes are reused while
+    size and mtime are unchanged). A stage is current when its key matches
+    the one recorded in state_file and all outputs exist; a rerun upstream
+    changes downstream inputs, so only affected stages run again.
+    """
+
+    def __init__(self, stages, state_file=STATE_FILE, max_workers=None):
+        self.stages = stages
+        self.state_file = state_file
+        self.max_workers = max_workers
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file) as f:
+                return json.load(f)
+        return {'stages': {}, 'files': {}}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        cached = self.state['files'].get(path)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+        checksum = file_checksum(path)
+        self.state['files'][path] = [stat.st_size, stat.st_mtime_ns, checksum]
+        return checksum
+
+    def _path_hash(self, path):
+        """Hash of a file or a directory tree; 'missing' if it does not exist"""
+        path = _existing(path)
+        if path is None:
+            return 'missing'
+        if os.path.isfile(path):
+            return self._file_hash(path)
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode())
+                digest.update(self._file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    def stage_key(self, stage):
+        payload = json.dumps({
+            'params': stage.params,
+            'code': {os.path.basename(path): self._file_hash(path) for path in module_sources(stage.code)},
+            'inputs': {path: self._path_hash(path) for path in stage.inputs}
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def is_current(self, stage, key=None):
+        entry = self.state['stages'].get(stage.name, {})
+        return (entry.get('key') == (key or self.stage_key(stage)) and
+                all(_existing(path) for path in stage.outputs))
+
+    def upstream(self, targets):
+        """Targets plus all stages they depend on, in declaration order"""
+        selected, queue = set(), list(targets)
+        while queue:
+            name = queue.pop()
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            if name not in selected:
+                selected.add(name)
+                queue.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in selected]
+
+    def run(self, targets=None, force=(), dry_run=False):
+        """Run out-of-date stages; returns {stage: 'skipped' | 'done' | 'would run' | 'failed' | 'blocked'}"""
+        names = self.upstream(targets) if targets else list(self.stages)
+        results = {}
+        pending = {name: set(self.stages[name].deps) & set(names) for name in names}
+        running = {}
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, deps in list(pending.items()):
+                    if any(results.get(dep) in ('failed', 'blocked') for dep in deps):
+                        results[name] = 'blocked'
+                        del pending[name]
+                        print(f"  ✗ {name}: blocked by failed upstream stage")
+                    elif all(dep in results for dep in deps):
+                        del pending[name]
+                        stage = self.stages[name]
+                        key = self.stage_key(stage)
+                        # In a dry run, stages downstream of one that would run are stale too
+                        upstream_runs = any(results[dep] == 'would run' for dep in deps)
+                        if name not in force and not upstream_runs and self.is_current(stage, key):
+                            results[name] = 'skipped'
+                            print(f"  ✓ {name}: up to date")
+                        elif dry_run:
+                            results[name] = 'would run'
+                            print(f"  → {name}: would run")
+                        else:
+                            print(f"  → {name}: running")
+                            running[pool.submit(stage.func, **stage.params)] = (name, key)
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name, key = running.pop(future)
+                    try:
+                        ok = future.result() is not False
+                        error = None if ok else 'stage reported failure'
+                    except Exception as e:
+                        ok, error = False, str(e)
+
+                    stage = self.stages[name]
+                    if ok and not all(_existing(path) for path in stage.outputs):
+                        ok, error = False, 'outputs missing after run'
+                    results[name] = 'done' if ok else 'failed'
+                    if ok:
+                        # Recompute: outputs of this stage may be inputs of itself
+                        self.state['stages'][name] = {
+                            'key': self.stage_key(stage),
+                            'completed': datetime.now().isoformat(timespec='seconds')
+                        }
+                    print(f"  {'✓' if ok else '✗'} {name}: {results[name]}" + (f" ({error})" if error else ""))
+                    self._save_state()
+
+        self._save_state()
+        return results
+
+def main(argv=None):
+    """Run the pipeline; exit status 1 if any stage failed"""
+    parser = argparse.ArgumentParser(description="Run out-of-date pipeline stages")
+    parser.add_argument('targets', nargs='*', help="stages to bring up to date (default: all)")
+    parser.add_argument('--force', nargs='+', default=[], help="rerun these stages even if current")
+    parser.add_argument('--workers', type=int, default=None, help="parallel stages")
+    parser.add_argument('--dry-run', action='store_true', help="only show what would run")
+    parser.add_argument('--list', action='store_true', help="list stages and their status")
+    parser.add_argument('--hourly', action='store_true',
+                        help="download hourly ERA5 and build daily tables for every region")
+    args = parser.parse_args(argv)
+
+    # Naming an ERA5 stage as a target requests the hourly chain too
+    hourly = args.hourly or any(target.startswith('era5_') for target in args.targets)
+    runner = PipelineRunner(build_pipeline(hourly=hourly), max_workers=args.workers)
+    if args.list:
+        for name, stage in runner.stages.items():
+            status = 'current' if runner.is_current(stage) else 'out of date'
+            print(f"  {name:20s} {status:12s} <- {', '.join(stage.deps) or '-'}")
+        return 0
+
+    print("="*60)
+    print("PIPELINE")
+    print("="*60)
+    results = runner.run(args.targets or None, force=set(args.force), dry_run=args.dry_run)
+
+    print("\n" + "="*60)
+    counts = {status: sum(1 for r in results.values() if r == status)
+              for status in ('done', 'would run', 'skipped', 'failed', 'blocked')}
+    print("  " + ", ".join(f"{n} {status}" for status, n in counts.items()))
+    print("="*60)
+    return 1 if counts['failed'] or counts['blocked'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
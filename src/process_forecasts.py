@@ -3,175 +3,271 @@ Process ECMWF SEAS5 forecasts and ERA5 observations
 Create quarterly forecast-actuals pairs for correlation analysis
 """
 
+import dask
+
 import xarray as xr
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import os
 
-def load_seas5_data(city):
-    """Load SEAS5 hindcast data"""
-    file_path = f'/Users/giulio/portfolio1-norway/data/raw/seas5_{city.lower()}_2014-2021.nc'
+from cds_chunking import has_data, open_chunked
+from climatology import CLIMATOLOGY_DDOF, NO_LEAD, open_climatology
+from ensemble_statistics import (DEFAULT_QUANTILES, ensemble_statistics, exceedance_probability,
+                                 find_member_dim, quantile_label)
+from region_registry import load_registry
+from region_weights import grid_weights, regional_mean
+from storage import PROCESSED_DIR, SYNTHETIC_DIR, read_dataset, write_dataset
+
+# Dask chunks for out-of-core processing: every chunk holds the whole member
+# axis (ensemble statistics need all members) and a slice of time and grid,
+# so peak memory per worker is fixed by these sizes, not by the domain
+LAZY_CHUNKS = {
+    'number': -1, 'member': -1, 'ensemble': -1,
+    'time': 12, 'valid_time': 12, 'forecast_reference_time': 4,
+    'latitude': 64, 'longitude': 64
+}
+
+# Precipitation variable names used by SEAS5/ERA5 downloads
+PRECIP_VARS = ['tp', 'tprate', 'total_precipitation']
+
+# Forecast cube: one Zarr store per region under this directory
+FORECAST_CUBE_DIR = f'{PROCESSED_DIR}/forecast_cube'
+INIT_DIMS = ['forecast_reference_time', 'time']
+LEAD_DIMS = ['forecastMonth', 'leadtime_month']
+
+# Leads summed into the forecast of an init's own quarter (lead 1 = init
+# month), for inits at the start of a quarter
+QUARTER_LEADS = (1, 2, 3)
+QUARTER_START_MONTHS = (1, 4, 7, 10)
+
+# Time axis names, in order of preference (ERA5 valid time, old/new SEAS5 init)
+TIME_DIMS = ['valid_time', 'time', 'forecast_reference_time']
+
+# Climatological quantiles used as underwriting trigger thresholds
+EXCEEDANCE_LEVELS = (0.80, 0.90, 0.95)
+
+def find_precip_var(ds):
+    """Name of the precipitation variable in ds, or None"""
+    return next((var for var in PRECIP_VARS if var in ds.data_vars), None)
+
+def open_source(product, city, chunks=None):
+    """
+    Open a product for a region: the incremental Zarr store if there is one
+    (seeded from the downloads and kept up to date by incremental_download),
+    otherwise the downloaded 2014-2021 NetCDF (single file or chunks).
+    Returns (dataset, source) or (None, missing path).
+    """
+    from incremental_download import has_store, open_store, store_path
 
-    if not os.path.exists(file_path):
-        print(f"ERROR: SEAS5 data not found: {file_path}")
-        print("Run download_ecmwf.py first to download the data.")
-        return None
+    if has_store(product, city.lower()):
+        return open_store(product, city.lower(), chunks), store_path(product, city.lower())
+    file_path = f'/Users/giulio/portfolio1-norway/data/raw/{product}_{city.lower()}_2014-2021.nc'
+    if not has_data(file_path):
+        return None, file_path
+    return open_chunked(file_path, chunks=chunks), file_path
 
+def load_seas5_data(city, chunks=None):
+    """Load SEAS5 hindcast data (Zarr store or downloaded NetCDF, with optional dask chunks)"""
     print(f"\nLoading SEAS5 data for {city}...")
     try:
-        ds = xr.open_dataset(file_path)
-        print(f"  ✓ Loaded {file_path}")
-        print(f"  Variables: {list(ds.data_vars)}")
-        print(f"  Dimensions: {dict(ds.dims)}")
-        return ds
+        ds, source = open_source('seas5', city, chunks)
     except Exception as e:
         print(f"  ✗ Error loading SEAS5 data: {e}")
         return None
-
-def load_era5_data(city):
-    """Load ERA5 observation data"""
-    file_path = f'/Users/giulio/portfolio1-norway/data/raw/era5_{city.lower()}_2014-2021.nc'
-
-    if not os.path.exists(file_path):
-        print(f"ERROR: ERA5 data not found: {file_path}")
+    if ds is None:
+        print(f"ERROR: SEAS5 data not found: {source}")
         print("Run download_ecmwf.py first to download the data.")
         return None
 
+    print(f"  ✓ Loaded {source}")
+    print(f"  Variables: {list(ds.data_vars)}")
+    print(f"  Dimensions: {dict(ds.sizes)}")
+    return ds
+
+def load_era5_data(city, chunks=None):
+    """Load ERA5 observation data (Zarr store or downloaded NetCDF, with optional dask chunks)"""
     print(f"\nLoading ERA5 data for {city}...")
     try:
-        ds = xr.open_dataset(file_path)
-        print(f"  ✓ Loaded {file_path}")
-        print(f"  Variables: {list(ds.data_vars)}")
-        print(f"  Dimensions: {dict(ds.dims)}")
-        return ds
+        ds, source = open_source('era5', city, chunks)
     except Exception as e:
         print(f"  ✗ Error loading ERA5 data: {e}")
         return None
-
-def calculate_ensemble_statistics(seas5_data):
-    """
-    Calculate ensemble statistics from SEAS5 hindcasts
-    Returns: mean, median, 90th percentile (best predictors from thesis)
-    """
-    print("\n  Calculating ensemble statistics...")
-
-    # Assuming ensemble dimension exists in SEAS5 data
-    # Variable name might be 'tp', 'tprate', or 'total_precipitation'
-    precip_var = None
-    for var in ['tp', 'tprate', 'total_precipitation']:
-        if var in seas5_data.data_vars:
-            precip_var = var
-            break
-
-    if precip_var is None:
-        print(f"  ✗ Could not find precipitation variable in SEAS5 data")
-        print(f"  Available variables: {list(seas5_data.data_vars)}")
+    if ds is None:
+        print(f"ERROR: ERA5 data not found: {source}")
+        print("Run download_ecmwf.py first to download the data.")
         return None
 
-    precip = seas5_data[precip_var]
+    print(f"  ✓ Loaded {source}")
+    print(f"  Variables: {list(ds.data_vars)}")
+    print(f"  Dimensions: {dict(ds.sizes)}")
+    return ds
 
-    # Convert from meters to mm (ECMWF uses meters)
-    precip = precip * 1000
+def quarter_codes(times, start_year):
+    """Quarter number since start_year (0 = Q1 of start_year) for every time step"""
+    times = pd.DatetimeIndex(times)
+    return (times.year.values - start_year) * 4 + (times.month.values - 1) // 3
 
-    # Calculate statistics across ensemble members
-    # The ensemble dimension might be called 'number', 'member', or 'ensemble'
-    ensemble_dim = None
-    for dim in ['number', 'member', 'ensemble']:
-        if dim in precip.dims:
-            ensemble_dim = dim
-            break
+def registry_weights(data, registry=None, include=()):
+    """
+    Cached area weights of every registry region overlapping the grid of
+    data (plus the regions named in include), built in one batch (None
+    without a grid)
+    """
+    if not {'latitude', 'longitude'} <= set(data.dims):
+        return None
+    registry = load_registry() if registry is None else registry
+    lats, lons = data['latitude'].values, data['longitude'].values
+    extent = {'north': lats.max(), 'south': lats.min(), 'east': lons.max(), 'west': lons.min()}
+    names = registry.intersecting(extent)
+    names += [registry[name].name for name in include if registry[name].name not in names]
+    return grid_weights(data, [registry[name] for name in names])
+
+def city_weights(city, data, registry=None):
+    """
+    Area weights of one registry region on the grid of data (a row of
+    registry_weights); registry defaults to config/regions.toml
+    """
+    registry = load_registry() if registry is None else registry
+    weights = registry_weights(data, registry, include=[city])
+    return None if weights is None else weights.subset([registry[city].name])
 
-    if ensemble_dim:
-        ensemble_mean = precip.mean(dim=ensemble_dim)
-        ensemble_median = precip.median(dim=ensemble_dim)
-        ensemble_90th = precip.quantile(0.90, dim=ensemble_dim)
-    else:
-        # If no ensemble dimension, data might already be ensemble mean
-        print(f"  Warning: No ensemble dimension found. Using raw data.")
-        ensemble_mean = precip
-        ensemble_median = precip
-        ensemble_90th = precip
-
-    return {
-        'mean': ensemble_mean,
-        'median': ensemble_median,
-        'p90': ensemble_90th
-    }
-
-def aggregate_to_quarterly(data, start_year=2014, end_year=2021):
-    """Aggregate precipitation data to quarterly totals"""
+def spatial_average(data, weights=None):
+    """
+    Area-weighted spatial mean: per region with precomputed weights
+    (adds a 'region' dimension), otherwise cos(latitude)-weighted over
+    the whole grid
+    """
+    if weights is not None:
+        return regional_mean(data, weights)
+
+    lat_dim = next((d for d in ['latitude', 'lat'] if d in data.dims), None)
+    spatial_dims = [d for d in ['latitude', 'longitude', 'lat', 'lon'] if d in data.dims]
+    if lat_dim is None:
+        return data.mean(dim=spatial_dims) if spatial_dims else data
+    return data.weighted(np.cos(np.deg2rad(data[lat_dim]))).mean(dim=spatial_dims)
+
+def find_time_dim(data):
+    """Name of the time dimension of data"""
+    time_dim = next((d for d in TIME_DIMS if d in data.dims), None)
+    if time_dim is None:
+        raise ValueError(f"No time dimension {TIME_DIMS} in {dict(data.sizes)}")
+    return time_dim
+
+def aggregate_to_quarterly(data, start_year=2014, end_year=2021, time_dim=None, spatial_mean=True,
+                           weights=None, lead=None):
+    """
+    Aggregate precipitation data to quarterly totals
+
+    data: DataArray or Dataset (e.g. one variable per ensemble statistic);
+    every variable is reduced in one grouped sum over a quarter index built
+    once from the time axis (found automatically unless time_dim is given).
+    Lead-resolved data needs an explicit lead to select, since summing over
+    inits mixes leads; quarterly SEAS5 forecasts come from the forecast
+    cube (quarterly_forecast). Other dimensions (member, and the grid
+    unless spatial_mean averages it first) are kept. Returns the same type
+    with a 'period' dimension ("2014 Q1") and year/quarter coords; quarters
+    without data are left out. With region weights the grid is reduced to
+    a 'region' dimension.
+    """
     print("\n  Aggregating to quarterly totals...")
 
-    quarterly_data = []
-
-    for year in range(start_year, end_year + 1):
-        for quarter in range(1, 5):
-            # Determine months for this quarter
-            if quarter == 1:
-                months = [1, 2, 3]
-            elif quarter == 2:
-                months = [4, 5, 6]
-            elif quarter == 3:
-                months = [7, 8, 9]
-            else:
-                months = [10, 11, 12]
-
-            # Select data for these months
-            quarter_data = data.sel(time=data.time.dt.year == year)
-            quarter_data = quarter_data.sel(time=quarter_data.time.dt.month.isin(months))
-
-            # Sum over time (and spatial dimensions if present)
-            if len(quarter_data.time) > 0:
-                # Average over spatial dimensions if present
-                spatial_dims = [d for d in ['latitude', 'longitude', 'lat', 'lon'] if d in quarter_data.dims]
-                if spatial_dims:
-                    quarter_total = quarter_data.mean(dim=spatial_dims).sum(dim='time')
-                else:
-                    quarter_total = quarter_data.sum(dim='time')
-
-                quarterly_data.append({
-                    'year': year,
-                    'quarter': quarter,
-                    'period': f"{year} Q{quarter}",
-                    'precip_mm': float(quarter_total.values)
-                })
-
-    return pd.DataFrame(quarterly_data)
-
-def calculate_precipitation_anomalies(df, climatology_start=1993, climatology_end=2016):
+    lead_dim = next((d for d in LEAD_DIMS if d in data.dims), None)
+    if lead_dim is not None:
+        if lead is None:
+            raise ValueError(f"Lead-resolved data ({lead_dim}): select a lead or use quarterly_forecast")
+        data = data.sel({lead_dim: lead}, drop=True)
+    time_dim = time_dim or find_time_dim(data)
+
+    if spatial_mean:
+        data = spatial_average(data, weights)
+
+    codes = quarter_codes(data[time_dim].values, start_year)
+    in_range = np.flatnonzero((codes >= 0) & (codes < (end_year - start_year + 1) * 4))
+    data = data.isel({time_dim: in_range}).assign_coords(quarter_code=(time_dim, codes[in_range]))
+
+    totals = data.groupby('quarter_code').sum(dim=time_dim).rename(quarter_code='period')
+    codes = totals['period'].values
+    years = start_year + codes // 4
+    quarters = codes % 4 + 1
+    return totals.assign_coords(
+        period=[f"{year} Q{quarter}" for year, quarter in zip(years, quarters)],
+        year=('period', years),
+        quarter=('period', quarters)
+    )
+
+def quarterly_frame(totals, name='precip_mm'):
+    """
+    One row per quarter (year, quarter, period) from scalar-per-period
+    quarterly totals; raises ValueError if any other dimension is left
+    """
+    if 'region' in totals.dims and totals.sizes['region'] == 1:
+        totals = totals.isel(region=0)
+    extra = [d for d in totals.dims if d != 'period']
+    if extra:
+        raise ValueError(f"Quarterly totals must have one value per quarter; reduce {extra} first")
+    if isinstance(totals, xr.DataArray):
+        totals = totals.to_dataset(name=name)
+    scalar_coords = [c for c in totals.coords if c not in ('period', 'year', 'quarter')]
+    df = totals.drop_vars(scalar_coords).to_dataframe().reset_index()
+    if not df['period'].is_unique:
+        raise ValueError("Quarterly totals have duplicate periods")
+    return df[['year', 'quarter', 'period'] + list(totals.data_vars)]
+
+def calculate_precipitation_anomalies(df, climatology_start=1993, climatology_end=2016, column='precip_mm',
+                                      climatology=None, region=None, lead=NO_LEAD):
     """
     Calculate precipitation anomalies
     Anomaly = (Value - Historical Mean) / Historical Std
 
-    For this demo with limited data, we'll use the 2014-2021 period itself
-    In production, you would use ECMWF climatology from 1993-2016
+    With a climatology store (climatology.py, ECMWF 1993-2016 hindcasts)
+    the per-quarter mean and std of the region at the given lead are
+    looked up (NO_LEAD: quarterly totals of quarter-start inits); if the
+    store has no such entry, or there is no store, the 2014-2021 period
+    itself is used as the climatology
     """
     print("\n  Calculating precipitation anomalies...")
 
-    # Calculate seasonal climatology (mean and std for each quarter)
-    climatology = df.groupby('quarter')['precip_mm'].agg(['mean', 'std']).reset_index()
-    climatology.columns = ['quarter', 'clim_mean', 'clim_std']
+    stored = None
+    if climatology is not None:
+        try:
+            stored = {statistic: climatology.quarterly(region, statistic, df['quarter'], lead)
+                      for statistic in ('mean', 'std')}
+        except KeyError as e:
+            print(f"  Warning: {e.args[0]}; using in-sample climatology")
+
+    if stored is not None:
+        print(f"  Using {climatology.attrs['start_year']}-{climatology.attrs['end_year']} climatology store")
+        df = df.assign(clim_mean=stored['mean'], clim_std=stored['std'])
+    else:
+        # Calculate seasonal climatology (mean and std for each quarter)
+        climatology = df.groupby('quarter')[column].agg(
+            clim_mean='mean', clim_std=lambda values: values.std(ddof=CLIMATOLOGY_DDOF)
+        ).reset_index()
 
-    # Merge climatology with data
-    df = df.merge(climatology, on='quarter')
+        # Merge climatology with data
+        df = df.merge(climatology, on='quarter')
 
     # Calculate anomaly
-    df['precip_anomaly'] = (df['precip_mm'] - df['clim_mean']) / df['clim_std']
+    df['precip_anomaly'] = (df[column] - df['clim_mean']) / df['clim_std']
 
     return df
 
 def merge_with_claims(forecast_df, city):
     """Merge forecast data with claims data"""
-    claims_file = f'/Users/giulio/portfolio1-norway/data/synthetic/{city.lower()}_quarterly_2014-2021.csv'
+    claims_path = f'{SYNTHETIC_DIR}/quarterly_claims'
 
-    if not os.path.exists(claims_file):
-        print(f"ERROR: Claims data not found: {claims_file}")
+    if not os.path.exists(f'{claims_path}/city={city.lower()}'):
+        print(f"ERROR: Claims data not found: {claims_path}/city={city.lower()}")
         print("Run generate_claims.py first to generate synthetic claims data.")
         return None
 
-    print(f"\n  Loading claims data from {claims_file}...")
-    claims_df = pd.read_csv(claims_file)
+    print(f"\n  Loading claims data from {claims_path}...")
+    claims_df = read_dataset(
+        claims_path,
+        columns=['year', 'quarter', 'total_claims', 'natural_perils', 'rain_associated'],
+        filters=[('city', '=', city.lower())]
+    )
 
     # Merge on year and quarter
     merged = forecast_df.merge(
@@ -184,53 +280,242 @@ def merge_with_claims(forecast_df, city):
 
     return merged
 
-def process_city_data(city):
-    """Process all data for a single city"""
+def canonical_seas5(precip):
+    """
+    SEAS5 data in the canonical forecast layout: dimensions renamed to
+    member, init and lead (a single-lead file keeps its lead as a length-1
+    axis). Raises ValueError if an ensemble, init or lead axis is missing.
+    """
+    member_dim = find_member_dim(precip)
+    init_dim = next((d for d in INIT_DIMS if d in precip.dims), None)
+    lead_dim = next((d for d in LEAD_DIMS if d in precip.coords), None)
+    if None in (member_dim, init_dim, lead_dim):
+        raise ValueError(f"SEAS5 data needs ensemble, init ({INIT_DIMS}) and lead ({LEAD_DIMS}) "
+                         f"dimensions, got {dict(precip.sizes)}")
+    if lead_dim not in precip.dims:
+        precip = precip.expand_dims(lead_dim)
+    return precip.rename({member_dim: 'member', init_dim: 'init', lead_dim: 'lead'})
+
+def build_forecast_cube(precip, weights, quantiles=DEFAULT_QUANTILES, thresholds=()):
+    """
+    Lead-time-resolved forecast cube of one or more regions
+
+    precip: SEAS5 precipitation (mm) with member, init and lead dimensions
+    on a lat/lon grid (see canonical_seas5). Returns a Dataset with
+    'members' (region x init x lead x member), 'statistics' (region x init
+    x lead x statistic) and, when leads 1-3 are present, 'quarterly'
+    (region x init x member: the members' total over the init's own
+    quarter, for quarter-start inits), plus init_month and valid_month
+    coordinates for seasonal slicing.
+    """
+    precip = canonical_seas5(precip)
+    members = regional_mean(precip, weights).transpose('region', 'init', 'lead', 'member')
+    statistics = ensemble_statistics(members, quantiles, thresholds, member_dim='member')
+
+    init_month = members['init'].dt.month
+    cube = xr.Dataset({'members': members, 'statistics': statistics})
+    if set(QUARTER_LEADS) <= set(members['lead'].values.tolist()):
+        quarterly = members.sel(lead=list(QUARTER_LEADS)).sum('lead', skipna=False)
+        cube['quarterly'] = quarterly.where(init_month.isin(QUARTER_START_MONTHS))
+    return cube.assign_coords(
+        init_month=init_month,
+        valid_month=(init_month + members['lead'] - 2) % 12 + 1  # lead 1 = init month
+    )
+
+def _quarter_start_periods(data, start_year=None, end_year=None):
+    """Quarter-start inits of data (optionally in [start_year, end_year]) as periods"""
+    init = data['init'].dt
+    selected = init.month.isin(QUARTER_START_MONTHS)
+    if start_year is not None:
+        selected &= init.year >= start_year
+    if end_year is not None:
+        selected &= init.year <= end_year
+    data = data.sel(init=selected.values)
+    years, quarters = data['init'].dt.year.values, data['init'].dt.quarter.values
+    data = data.drop_vars(['init_month', 'valid_month'], errors='ignore').rename(init='period')
+    return data.assign_coords(
+        period=[f"{year} Q{quarter}" for year, quarter in zip(years, quarters)],
+        year=('period', years),
+        quarter=('period', quarters)
+    )
+
+def quarterly_forecast(cube, start_year=None, end_year=None):
+    """
+    Quarterly forecast totals (region x period x member) from the cube,
+    with year/quarter coordinates like aggregate_to_quarterly; optionally
+    only inits in [start_year, end_year]
+    """
+    if 'quarterly' not in cube:
+        raise ValueError(f"Cube has no quarterly totals: leads {QUARTER_LEADS} are required")
+    return _quarter_start_periods(cube['quarterly'], start_year, end_year)
+
+def lead_forecast(cube, start_year=None, end_year=None):
+    """
+    Monthly member totals at every lead (region x period x lead x member)
+    of the quarter-start inits, with the same period coordinates as
+    quarterly_forecast
+    """
+    return _quarter_start_periods(cube['members'], start_year, end_year)
+
+def exceedance_thresholds(cube, climatology=None, levels=EXCEEDANCE_LEVELS):
+    """
+    Threshold tensor (region, init, threshold) in mm
+
+    Climatological quantiles of the quarterly total for the quarter of
+    each init, from the climatology store when it covers the cube's
+    regions, otherwise from the cube itself (the quarterly totals of all
+    inits in the same quarter and all members pooled)
+    """
+    labels = [quantile_label(q) for q in levels]
+    regions = [str(region) for region in cube['region'].values]
+    if climatology is not None:
+        try:
+            thresholds = climatology.thresholds(regions, cube['init'], labels, lead=NO_LEAD)
+            return thresholds.rename(statistic='threshold').assign_coords(region=cube['region'].values)
+        except KeyError as e:
+            print(f"  Warning: {e.args[0]}; using in-sample thresholds")
+
+    quarterly = cube['quarterly']
+    quarter = quarterly['init'].dt.quarter
+    quantiles = quarterly.groupby(quarter).quantile(list(levels), dim=['init', 'member'])
+    thresholds = quantiles.sel(quarter=quarter).drop_vars('quarter')
+    return thresholds.rename(quantile='threshold').assign_coords(threshold=labels)
+
+def add_exceedance(cube, climatology=None, levels=EXCEEDANCE_LEVELS):
+    """
+    Cube with P(quarterly precipitation > climatological quantile) per
+    region, init and threshold ('exceedance') and the thresholds used
+    ('threshold_mm'); every member's quarterly total is compared against
+    the whole threshold tensor at once
+    """
+    if 'quarterly' not in cube:
+        raise ValueError(f"Cube has no quarterly totals: leads {QUARTER_LEADS} are required")
+    thresholds = exceedance_thresholds(cube, climatology, levels).transpose('region', 'init', 'threshold')
+    exceedance = exceedance_probability(cube['quarterly'], thresholds, member_dim='member')
+    return cube.assign(exceedance=exceedance.transpose('region', 'init', 'threshold'),
+                       threshold_mm=thresholds)
+
+def exceedance_table(cube):
+    """Probability table: one row per region, quarter-start init and threshold"""
+    table = xr.Dataset({'probability': cube['exceedance'], 'threshold_mm': cube['threshold_mm']})
+    table = table.sel(init=table['init'].dt.month.isin(QUARTER_START_MONTHS).values)
+    df = (table.drop_vars('init_month', errors='ignore')
+          .to_dataframe(dim_order=['region', 'init', 'threshold']).reset_index())
+    return df.assign(year=df['init'].dt.year, quarter=df['init'].dt.quarter)
+
+def save_forecast_cube(cube, cube_dir=FORECAST_CUBE_DIR):
+    """Persist each region of the cube to {cube_dir}/{region}.zarr"""
+    os.makedirs(cube_dir, exist_ok=True)
+    # Variable-length labels (fixed-width unicode has no stable Zarr encoding)
+    cube = cube.assign_coords({label: cube[label].values.astype(object)
+                               for label in ['region', 'statistic', 'threshold'] if label in cube.coords})
+    for region in cube['region'].values:
+        path = f"{cube_dir}/{region}.zarr"
+        cube.sel(region=[region]).to_zarr(path, mode='w', consolidated=False)
+    return cube_dir
+
+def open_forecast_cube(regions=None, cube_dir=FORECAST_CUBE_DIR):
+    """Open the persisted cube lazily (all regions, or the given ones)"""
+    if regions is None:
+        regions = sorted(name[:-len('.zarr')] for name in os.listdir(cube_dir) if name.endswith('.zarr'))
+    return xr.concat([xr.open_zarr(f"{cube_dir}/{region}.zarr", consolidated=False) for region in regions],
+                     dim='region')
+
+def forecast_view(cube, statistic='mean', lead=None, init_months=None, valid_months=None):
+    """
+    Slice of the cube for one statistic (or 'members'), optionally by lead,
+    init months and valid months (e.g. [6, 7, 8] for summer)
+    """
+    view = cube['members'] if statistic == 'members' else cube['statistics'].sel(statistic=statistic)
+    if lead is not None:
+        view = view.sel(lead=lead)
+    if init_months is not None:
+        view = view.sel(init=view['init'].dt.month.isin(init_months).values)
+    if valid_months is not None:
+        view = view.where(view['valid_month'].isin(valid_months))
+    return view
+
+def compute_out_of_core(*objects, n_workers=None, scheduler='processes'):
+    """
+    Evaluate lazy results on a local dask scheduler, one chunk per task
+
+    'processes' (default) sidesteps the GIL for the Python-heavy parts;
+    'threads' avoids shipping chunk results between processes and is
+    faster when the work is dominated by numpy (sorting members).
+    """
+    with dask.config.set(scheduler=scheduler, num_workers=n_workers):
+        return dask.compute(*objects)
+
+def process_city_data(city, lazy=False, n_workers=None, registry=None):
+    """
+    Process all data for a single city
+
+    lazy: open the data in LAZY_CHUNKS chunks so unit conversion, ensemble
+    statistics and quarterly aggregation only build a task graph, then run
+    it out of core on n_workers processes (for daily or large-domain cubes)
+    registry: RegionRegistry holding the city (default: config/regions.toml)
+    """
     print(f"\n{'='*60}")
     print(f"PROCESSING DATA FOR {city.upper()}")
     print(f"{'='*60}")
 
     # Load SEAS5 and ERA5 data
-    seas5_data = load_seas5_data(city)
-    era5_data = load_era5_data(city)
+    chunks = LAZY_CHUNKS if lazy else None
+    seas5_data = load_seas5_data(city, chunks)
+    era5_data = load_era5_data(city, chunks)
 
     if seas5_data is None or era5_data is None:
         print(f"\n✗ Cannot process {city} - missing input data")
         return None
 
-    # Calculate ensemble statistics for SEAS5
-    ensemble_stats = calculate_ensemble_statistics(seas5_data)
-
-    if ensemble_stats is None:
-        print(f"\n✗ Cannot process {city} - error calculating ensemble statistics")
+    # Persist the lead-time-resolved cube (region x init x lead x member/statistic);
+    # it is the canonical SEAS5 layout, the quarterly forecasts are derived from it
+    seas5_precip = seas5_data[find_precip_var(seas5_data)] * 1000  # Convert to mm
+    try:
+        cube = build_forecast_cube(seas5_precip, city_weights(city, seas5_precip, registry))
+        if lazy:
+            cube, = compute_out_of_core(cube, n_workers=n_workers)
+        cube = add_exceedance(cube, open_climatology())
+        quarterly = quarterly_forecast(cube, 2014, 2021)
+    except ValueError as e:
+        print(f"\n✗ Cannot process {city} - {e}")
         return None
+    print(f"\n  ✓ Forecast cube {dict(cube['statistics'].sizes)} saved to: {save_forecast_cube(cube)}")
+    print(f"  ✓ Exceedance probabilities {dict(cube['exceedance'].sizes)} stored with the cube")
 
-    # Aggregate SEAS5 to quarterly (using ensemble mean)
-    seas5_quarterly = aggregate_to_quarterly(ensemble_stats['mean'])
-    seas5_quarterly.rename(columns={'precip_mm': 'forecast_mean_precip'}, inplace=True)
-
-    # Aggregate SEAS5 90th percentile to quarterly
-    seas5_90th_quarterly = aggregate_to_quarterly(ensemble_stats['p90'])
-    seas5_quarterly['forecast_90th_precip'] = seas5_90th_quarterly['precip_mm']
+    # Ensemble mean and 90th percentile of the quarterly member totals
+    quarterly_stats = ensemble_statistics(quarterly, member_dim='member')
+    seas5_totals = xr.Dataset({
+        'forecast_mean_precip': quarterly_stats.sel(statistic='mean', drop=True),
+        'forecast_90th_precip': quarterly_stats.sel(statistic='p90', drop=True)
+    })
 
     # Aggregate ERA5 to quarterly (observed)
     # Find precipitation variable in ERA5
-    precip_var = None
-    for var in ['tp', 'tprate', 'total_precipitation']:
-        if var in era5_data.data_vars:
-            precip_var = var
-            break
+    precip_var = find_precip_var(era5_data)
 
+    era5_totals = None
     if precip_var:
         era5_precip = era5_data[precip_var] * 1000  # Convert to mm
-        era5_quarterly = aggregate_to_quarterly(era5_precip)
-        seas5_quarterly['observed_precip'] = era5_quarterly['precip_mm']
+        era5_totals = aggregate_to_quarterly(era5_precip, weights=city_weights(city, era5_precip, registry))
+
+    if lazy and era5_totals is not None:
+        print(f"\n  Computing out of core ({n_workers or 'all'} worker processes)...")
+        era5_totals, = compute_out_of_core(era5_totals, n_workers=n_workers)
+
+    seas5_quarterly = quarterly_frame(seas5_totals)
+    if era5_totals is not None:
+        era5_quarterly = quarterly_frame(era5_totals, name='observed_precip')
+        seas5_quarterly = seas5_quarterly.merge(
+            era5_quarterly[['year', 'quarter', 'observed_precip']], on=['year', 'quarter'], how='left'
+        )
     else:
         print(f"  Warning: Could not find precipitation in ERA5, using NaN")
         seas5_quarterly['observed_precip'] = np.nan
 
-    # Calculate anomalies
-    seas5_quarterly = calculate_precipitation_anomalies(seas5_quarterly)
+    # Calculate anomalies (of the ensemble-mean forecast)
+    seas5_quarterly = calculate_precipitation_anomalies(seas5_quarterly, column='forecast_mean_precip',
+                                                        climatology=open_climatology(), region=city.lower())
 
     # Merge with claims data
     final_df = merge_with_claims(seas5_quarterly, city)
@@ -238,10 +523,9 @@ def process_city_data(city):
     if final_df is None:
         return None
 
-    # Save to CSV
-    output_file = f'/Users/giulio/portfolio1-norway/data/processed/{city.lower()}_quarterly_forecasts_2014-2021.csv'
-    final_df.to_csv(output_file, index=False)
-    print(f"\n  ✓ Saved to: {output_file}")
+    # Save to Parquet (partitioned by city)
+    output_path = write_dataset(final_df.assign(city=city.lower()), f'{PROCESSED_DIR}/quarterly_forecasts')
+    print(f"\n  ✓ Saved to: {output_path}/city={city.lower()}")
 
     # Display summary
     print(f"\n  Summary statistics:")
@@ -253,8 +537,12 @@ def process_city_data(city):
 
     return final_df
 
-def main():
-    """Main execution"""
+def process_regions(regions, lazy=False, n_workers=None, registry=None):
+    """Process every region in turn; returns {region: DataFrame or None}"""
+    return {region: process_city_data(region.title(), lazy, n_workers, registry) for region in regions}
+
+def main(regions=None, lazy=False, n_workers=None, registry=None):
+    """Main execution (default: every region of registry, itself defaulting to config/regions.toml)"""
     print("="*60)
     print("PROCESSING ECMWF FORECASTS TO QUARTERLY DATA")
     print("="*60)
@@ -262,26 +550,27 @@ def main():
     print("\nNOTE: This script requires downloaded SEAS5 and ERA5 data.")
     print("If data is not available, it will create placeholder processed files.")
 
-    # Process Bergen
-    bergen_df = process_city_data('Bergen')
-
-    # Process Oslo
-    oslo_df = process_city_data('Oslo')
+    registry = load_registry() if registry is None else registry
+    if regions is None:
+        regions = [region.name for region in registry]
+    results = process_regions(regions, lazy, n_workers, registry)
 
     # Summary
     print("\n" + "="*60)
-    if bergen_df is not None and oslo_df is not None:
+    if all(df is not None for df in results.values()):
         print("✓ PHASE 3 COMPLETE: Forecasts processed to quarterly data")
         print("\nOutput files:")
-        print("  - data/processed/bergen_quarterly_forecasts_2014-2021.csv")
-        print("  - data/processed/oslo_quarterly_forecasts_2014-2021.csv")
+        for region in results:
+            print(f"  - data/processed/quarterly_forecasts/city={region}")
     else:
         print("✗ Processing incomplete - check errors above")
+        print(f"  Failed: {', '.join(region for region, df in results.items() if df is None)}")
         print("\nIf ECMWF data is not available yet, you can still proceed")
         print("with Phase 1 (synthetic claims generation) and Phase 4-5")
         print("(analysis using placeholder forecast data).")
 
     print("="*60)
+    return results
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+"""
+Plan CDS retrievals for many regions with union bounding boxes
+Nearby regions share one covering request and are subset locally afterwards
+"""
+
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+
+@dataclass
+class RegionGroup:
+    """One covering request: union bounding box and the regions inside it"""
+    name: str
+    bbox: dict
+    members: dict = field(default_factory=dict)
+
+def bbox_area(bbox):
+    """Area of a bounding box in square degrees"""
+    return (bbox['north'] - bbox['south']) * (bbox['east'] - bbox['west'])
+
+def snap_bbox(bbox, grid=0.25):
+    """Expand a bounding box outward to the data grid so edge cells are included"""
+    return {
+        'north': math.ceil(bbox['north'] / grid) * grid,
+        'south': math.floor(bbox['south'] / grid) * grid,
+        'east': math.ceil(bbox['east'] / grid) * grid,
+        'west': math.floor(bbox['west'] / grid) * grid
+    }
+
+def plan_union_requests(regions, max_span_deg=3.0, max_waste=0.75, grid=0.25):
+    """
+    Merge region bounding boxes into a small set of covering requests
+
+    regions: {name: {'north', 'south', 'east', 'west'}}. Groups are merged
+    greedily (smallest union first) while the union stays within
+    max_span_deg in both directions and at most max_waste of its area is
+    outside its members. Single-region groups keep the region's name and
+    box, so their downloads are identical to a per-region request.
+    Returns a list of RegionGroup with grid-snapped union boxes.
+    """
+    names = list(regions)
+    boxes = np.array([[regions[n]['north'], regions[n]['south'], regions[n]['east'], regions[n]['west']]
+                      for n in names], dtype=float)
+    covered = (boxes[:, 0] - boxes[:, 1]) * (boxes[:, 2] - boxes[:, 3])
+    members = [[name] for name in names]
+
+    # Agglomerate: each step evaluates all pairs at once and merges the
+    # admissible pair with the smallest union
+    while len(boxes) > 1:
+        north = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+        south = np.minimum(boxes[:, None, 1], boxes[None, :, 1])
+        east = np.maximum(boxes[:, None, 2], boxes[None, :, 2])
+        west = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+        area = (north - south) * (east - west)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            waste = np.where(area > 0, 1.0 - np.minimum(1.0, (covered[:, None] + covered[None, :]) / area), 0.0)
+
+        admissible = ((north - south <= max_span_deg) & (east - west <= max_span_deg) &
+                      (waste <= max_waste) & np.triu(np.ones(area.shape, dtype=bool), k=1))
+        if not admissible.any():
+            break
+
+        i, j = np.unravel_index(np.argmin(np.where(admissible, area, np.inf)), area.shape)
+        boxes[i] = [north[i, j], south[i, j], east[i, j], west[i, j]]
+        covered[i] += covered[j]
+        members[i] += members[j]
+        boxes = np.delete(boxes, j, axis=0)
+        covered = np.delete(covered, j)
+        del members[j]
+
+    groups = [{'bbox': dict(zip(['north', 'south', 'east', 'west'], box.tolist())),
+               'members': {name: regions[name] for name in group}}
+              for box, group in zip(boxes, members)]
+
+    plan = []
+    for k, group in enumerate(groups):
+        members = group['members']
+        if len(members) == 1:
+            name, bbox = next(iter(members.items()))
+            plan.append(RegionGroup(name, dict(bbox), members))
+        else:
+            name = f"union{k:03d}_{len(members)}regions"
+            plan.append(RegionGroup(name, snap_bbox(group['bbox'], grid), members))
+    return plan
+
+def _axis_slice(coords, low, high):
+    """
+    Index slice of a sorted (ascending or descending) coordinate between
+    low and high; a region smaller than one cell gets its nearest cell
+    """
+    coords = np.asarray(coords)
+    if coords[0] > coords[-1]:
+        start = np.searchsorted(-coords, -high, side='left')
+        stop = np.searchsorted(-coords, -low, side='right')
+    else:
+        start = np.searchsorted(coords, low, side='left')
+        stop = np.searchsorted(coords, high, side='right')
+    if stop <= start:
+        start = int(np.argmin(np.abs(coords - (low + high) / 2)))
+        stop = start + 1
+    return slice(int(start), int(stop))
+
+def region_index_slices(group, latitudes, longitudes):
+    """
+    Precompute {region: (lat_slice, lon_slice)} for a downloaded union grid
+
+    Computed once per grid and reused for every variable, chunk and time step.
+    """
+    return {
+        name: (_axis_slice(latitudes, bbox['south'], bbox['north']),
+               _axis_slice(longitudes, bbox['west'], bbox['east']))
+        for name, bbox in group.members.items()
+    }
+
+def subset_regions(ds, slices, lat_dim='latitude', lon_dim='longitude'):
+    """Subset a union dataset into {region: dataset} with precomputed index slices"""
+    return {name: ds.isel({lat_dim: lat_slice, lon_dim: lon_slice})
+            for name, (lat_slice, lon_slice) in slices.items()}
@@ -0,0 +1,185 @@
+"""
+Region registry: bounding boxes and polygons for every region to download and process
+Loaded from TOML, YAML or GeoJSON and indexed by name, tag and location
+"""
+
+import json
+import math
+import os
+from dataclasses import dataclass, field
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python 3.10
+    import tomli as tomllib
+
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config', 'regions.toml')
+
+BBOX_KEYS = ('north', 'south', 'east', 'west')
+
+@dataclass(frozen=True)
+class Region:
+    """
+    One region: bounding box, optional polygon and tags
+
+    polygon holds every ring of the region's geometry, ((lon, lat), ...)
+    each: the outer boundaries of all parts and their holes. A point is
+    inside when it lies within an odd number of rings (even-odd rule).
+    """
+    name: str
+    bbox: dict
+    polygon: tuple = None
+    tags: tuple = field(default_factory=tuple)
+
+def polygon_bbox(rings):
+    """Bounding box of polygon rings of (lon, lat) points"""
+    lons, lats = zip(*(point for ring in rings for point in ring))
+    return {'north': max(lats), 'south': min(lats), 'east': max(lons), 'west': min(lons)}
+
+def _rings(rings):
+    """Rings as nested tuples of (lon, lat) points"""
+    return tuple(tuple(tuple(point[:2]) for point in ring) for ring in rings)
+
+def _region_from_entry(name, entry):
+    """
+    Region from a TOML/YAML entry: bbox keys and/or a polygon, plus tags
+
+    polygon is one ring of [lon, lat] points or a list of rings (parts
+    and holes, even-odd rule).
+    """
+    polygon = entry.get('polygon') or None
+    if polygon:
+        polygon = _rings(polygon if isinstance(polygon[0][0], (list, tuple)) else [polygon])
+    if all(key in entry for key in BBOX_KEYS):
+        bbox = {key: float(entry[key]) for key in BBOX_KEYS}
+    elif polygon:
+        bbox = polygon_bbox(polygon)
+    else:
+        raise ValueError(f"Region {name} needs {'/'.join(BBOX_KEYS)} or a polygon")
+    return Region(name.lower(), bbox, polygon, tuple(entry.get('tags', ())))
+
+def _load_toml(path):
+    with open(path, 'rb') as f:
+        entries = tomllib.load(f).get('regions', {})
+    return [_region_from_entry(name, entry) for name, entry in entries.items()]
+
+def _load_yaml(path):
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("YAML registries need PyYAML: pip install pyyaml")
+    with open(path) as f:
+        entries = (yaml.safe_load(f) or {}).get('regions', {})
+    return [_region_from_entry(name, entry) for name, entry in entries.items()]
+
+def _load_geojson(path):
+    """FeatureCollection of Polygon/MultiPolygon features with a 'name' property"""
+    with open(path) as f:
+        features = json.load(f)['features']
+
+    regions = []
+    for feature in features:
+        props = feature.get('properties', {})
+        geometry = feature['geometry']
+        # Every part and every hole is kept; the even-odd rule handles the holes
+        if geometry['type'] == 'Polygon':
+            rings = _rings(geometry['coordinates'])
+        elif geometry['type'] == 'MultiPolygon':
+            rings = _rings(ring for polygon in geometry['coordinates'] for ring in polygon)
+        else:
+            raise ValueError(f"Region {props['name']}: unsupported geometry {geometry['type']}, "
+                             f"use Polygon or MultiPolygon")
+        regions.append(Region(props['name'].lower(), polygon_bbox(rings),
+                              rings, tuple(props.get('tags', ()))))
+    return regions
+
+LOADERS = {
+    '.toml': _load_toml,
+    '.yaml': _load_yaml,
+    '.yml': _load_yaml,
+    '.geojson': _load_geojson,
+    '.json': _load_geojson
+}
+
+class RegionRegistry:
+    """
+    Regions indexed for cheap subset selection
+
+    Lookups by name and tag are dict lookups; bounding-box queries go
+    through a grid index of cell_deg x cell_deg cells, so only regions in
+    the touched cells are checked.
+    """
+
+    def __init__(self, regions, cell_deg=1.0):
+        self.regions = {}
+        self.cell_deg = cell_deg
+        self._tags = {}
+        self._cells = {}
+        for region in regions:
+            if region.name in self.regions:
+                raise ValueError(f"Duplicate region in registry: {region.name}")
+            self.regions[region.name] = region
+            for tag in region.tags:
+                self._tags.setdefault(tag, []).append(region.name)
+            for cell in self._bbox_cells(region.bbox):
+                self._cells.setdefault(cell, []).append(region.name)
+
+    def _bbox_cells(self, bbox):
+        rows = range(math.floor(bbox['south'] / self.cell_deg), math.floor(bbox['north'] / self.cell_deg) + 1)
+        cols = range(math.floor(bbox['west'] / self.cell_deg), math.floor(bbox['east'] / self.cell_deg) + 1)
+        return [(row, col) for row in rows for col in cols]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __iter__(self):
+        return iter(self.regions.values())
+
+    def __contains__(self, name):
+        return name.lower() in self.regions
+
+    def __getitem__(self, name):
+        try:
+            return self.regions[name.lower()]
+        except KeyError:
+            raise KeyError(f"Unknown region: {name}") from None
+
+    def with_tag(self, tag):
+        """Names of regions carrying a tag"""
+        return list(self._tags.get(tag, []))
+
+    def intersecting(self, bbox):
+        """Names of regions whose bounding box overlaps bbox"""
+        candidates = {name for cell in self._bbox_cells(bbox) for name in self._cells.get(cell, [])}
+        return [name for name in self.regions if name in candidates and
+                self.regions[name].bbox['south'] <= bbox['north'] and
+                self.regions[name].bbox['north'] >= bbox['south'] and
+                self.regions[name].bbox['west'] <= bbox['east'] and
+                self.regions[name].bbox['east'] >= bbox['west']]
+
+    def select(self, names=None, tags=None, bbox=None):
+        """
+        Regions matching all given filters, in registry order
+
+        names: region names; tags: regions with any of these tags;
+        bbox: regions overlapping the box. No filters selects everything.
+        """
+        selected = set(self.regions)
+        if names:
+            selected &= {self[name].name for name in names}
+        if tags:
+            selected &= {name for tag in tags for name in self.with_tag(tag)}
+        if bbox:
+            selected &= set(self.intersecting(bbox))
+        return [region for name, region in self.regions.items() if name in selected]
+
+    def bboxes(self, regions=None):
+        """{name: bbox} for the given regions (default: all)"""
+        return {region.name: region.bbox for region in (self if regions is None else regions)}
+
+def load_registry(path=REGISTRY_FILE):
+    """Load a registry file, format chosen by extension (.toml, .yaml/.yml, .geojson/.json)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in LOADERS:
+        raise ValueError(f"Unsupported registry format {extension}: use one of {sorted(LOADERS)}")
+    return RegionRegistry(LOADERS[extension](path))
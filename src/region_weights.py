@@ -0,0 +1,255 @@
+"""
+Area-weighted grid-to-region averaging
+A sparse (region x grid cell) weight matrix built from region boxes or
+polygons, cached on disk and applied to gridded cubes in one product
+"""
+
+import hashlib
+import inspect
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import xarray as xr
+from matplotlib.path import Path
+from scipy import sparse
+
+from storage import PROCESSED_DIR
+
+WEIGHTS_DIR = f'{PROCESSED_DIR}/region_weights'
+
+# Sample points per cell side when measuring polygon overlap
+POLYGON_SUBSAMPLES = 10
+
+# xr.dot names its contracted dimensions 'dim' since xarray 2023.12 ('dims' before)
+DOT_DIM = 'dim' if 'dim' in inspect.signature(xr.dot).parameters else 'dims'
+
+# Grid increments GRIB-derived NetCDF files carry on the data variables
+RESOLUTION_ATTRS = ('GRIB_jDirectionIncrementInDegrees', 'GRIB_iDirectionIncrementInDegrees')
+
+@dataclass
+class RegionWeights:
+    """Row-normalized sparse weights mapping a lat/lon grid to named regions"""
+    names: list
+    latitudes: np.ndarray
+    longitudes: np.ndarray
+    matrix: sparse.csr_matrix
+
+    def subset(self, names):
+        """Weights of the named regions only (rows of the same matrix)"""
+        rows = [self.names.index(name) for name in names]
+        return RegionWeights(list(names), self.latitudes, self.longitudes, self.matrix[rows])
+
+def grid_resolution(data, lat_dim='latitude', lon_dim='longitude'):
+    """
+    (latitude, longitude) grid increments in degrees: the coordinate
+    spacing, or the GRIB increments in the attributes for a single-cell
+    axis (a square grid takes the other axis' spacing if those are absent).
+    None for a single-cell grid without GRIB increments: it has no
+    spacing, and its one cell takes all the weight anyway.
+    """
+    spacing = [float(np.abs(np.diff(data[dim].values)).mean()) if data.sizes[dim] > 1 else None
+               for dim in (lat_dim, lon_dim)]
+    attrs = {**data.attrs, **next((da.attrs for da in data.data_vars.values()), {})} \
+        if isinstance(data, xr.Dataset) else data.attrs
+    for axis, attr in enumerate(RESOLUTION_ATTRS):
+        if spacing[axis] is None and attr in attrs:
+            spacing[axis] = float(attrs[attr])
+    if spacing[0] is None:
+        spacing[0] = spacing[1]
+    if spacing[1] is None:
+        spacing[1] = spacing[0]
+    return None if spacing[0] is None else tuple(spacing)
+
+def cell_edges(centers, resolution=None):
+    """
+    Cell edges from (regularly or irregularly spaced) cell centers; a
+    single cell needs the grid resolution
+    """
+    centers = np.asarray(centers, dtype=float)
+    if len(centers) == 1:
+        if resolution is None:
+            raise ValueError("Grid resolution required for a single-cell axis")
+        return np.array([centers[0] - resolution / 2, centers[0] + resolution / 2])
+    mid = (centers[:-1] + centers[1:]) / 2
+    return np.concatenate([[2 * centers[0] - mid[0]], mid, [2 * centers[-1] - mid[-1]]])
+
+def _interval_overlap(edges, low, high):
+    """Fraction of each cell (between consecutive edges) inside [low, high]"""
+    lower = np.minimum(edges[:-1], edges[1:])
+    upper = np.maximum(edges[:-1], edges[1:])
+    return np.clip(np.minimum(upper, high) - np.maximum(lower, low), 0, None) / (upper - lower)
+
+def _polygon_overlap(rings, lat_edges, lon_edges, lat_rows, lon_cols, n=POLYGON_SUBSAMPLES):
+    """
+    Fraction of each candidate cell inside the polygon rings (even-odd
+    rule, so separate parts add and holes subtract), from n x n sample
+    points per cell
+    """
+    offsets = (np.arange(n) + 0.5) / n
+    lat_points = lat_edges[lat_rows, None] + (lat_edges[lat_rows + 1] - lat_edges[lat_rows])[:, None] * offsets
+    lon_points = lon_edges[lon_cols, None] + (lon_edges[lon_cols + 1] - lon_edges[lon_cols])[:, None] * offsets
+
+    # (rows, n) x (cols, n) -> points ordered (row, col, i, j)
+    lat_grid = np.broadcast_to(lat_points[:, None, :, None], (len(lat_rows), len(lon_cols), n, n))
+    lon_grid = np.broadcast_to(lon_points[None, :, None, :], (len(lat_rows), len(lon_cols), n, n))
+    points = np.column_stack([lon_grid.ravel(), lat_grid.ravel()])
+    inside = np.zeros(len(points), dtype=bool)
+    for ring in rings:
+        inside ^= Path(ring).contains_points(points)
+    return inside.reshape(len(lat_rows), len(lon_cols), n * n).mean(axis=-1)
+
+def region_cell_weights(region, latitudes, longitudes, resolution=None):
+    """
+    Dense (lat, lon) weights of one region: overlap fraction x cos(latitude)
+    x cell size, normalized to sum to 1. Regions smaller than a cell that
+    catch no sample point fall back to the nearest cell. resolution:
+    (lat, lon) increments, needed for single-cell axes unless the grid is a
+    single cell.
+    """
+    if len(latitudes) == 1 and len(longitudes) == 1 and resolution is None:
+        return np.ones((1, 1))
+    lat_resolution, lon_resolution = resolution or (None, None)
+    lat_edges, lon_edges = cell_edges(latitudes, lat_resolution), cell_edges(longitudes, lon_resolution)
+    bbox = region.bbox
+    lat_overlap = _interval_overlap(lat_edges, bbox['south'], bbox['north'])
+    lon_overlap = _interval_overlap(lon_edges, bbox['west'], bbox['east'])
+    overlap = np.outer(lat_overlap, lon_overlap)
+
+    if region.polygon is not None:
+        rows, cols = np.flatnonzero(lat_overlap), np.flatnonzero(lon_overlap)
+        polygon_overlap = np.zeros_like(overlap)
+        if len(rows) and len(cols):
+            polygon_overlap[np.ix_(rows, cols)] = _polygon_overlap(
+                region.polygon, lat_edges, lon_edges, rows, cols)
+        overlap = polygon_overlap
+
+    if not overlap.any():
+        row = np.argmin(np.abs(np.asarray(latitudes) - (bbox['north'] + bbox['south']) / 2))
+        col = np.argmin(np.abs(np.asarray(longitudes) - (bbox['east'] + bbox['west']) / 2))
+        overlap[row, col] = 1.0
+
+    area = (np.abs(np.diff(lat_edges)) * np.cos(np.deg2rad(latitudes)))[:, None] * np.abs(np.diff(lon_edges))
+    weights = overlap * area
+    return weights / weights.sum()
+
+def build_region_weights(regions, latitudes, longitudes, resolution=None):
+    """Sparse weight matrix (one row per region) for a lat/lon grid"""
+    latitudes, longitudes = np.asarray(latitudes), np.asarray(longitudes)
+    rows = [sparse.csr_matrix(region_cell_weights(region, latitudes, longitudes, resolution).ravel())
+            for region in regions]
+    return RegionWeights([region.name for region in regions], latitudes, longitudes,
+                         sparse.vstack(rows, format='csr'))
+
+def weights_key(regions, latitudes, longitudes, resolution=None):
+    """Hash of the grid and region geometries a weight matrix was built from"""
+    payload = json.dumps({
+        'latitudes': np.round(np.asarray(latitudes, dtype=float), 6).tolist(),
+        'longitudes': np.round(np.asarray(longitudes, dtype=float), 6).tolist(),
+        'resolution': None if resolution is None else [round(float(r), 6) for r in resolution],
+        'regions': [[region.name, region.bbox, region.polygon] for region in regions],
+        'subsamples': POLYGON_SUBSAMPLES
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def load_region_weights(regions, latitudes, longitudes, cache_dir=WEIGHTS_DIR, resolution=None):
+    """Weights from the on-disk cache, built and saved on the first request for this grid"""
+    path = os.path.join(cache_dir, f"{weights_key(regions, latitudes, longitudes, resolution)}.npz")
+    if os.path.exists(path):
+        stored = np.load(path)
+        matrix = sparse.csr_matrix((stored['data'], stored['indices'], stored['indptr']),
+                                   shape=tuple(stored['shape']))
+        return RegionWeights(stored['names'].tolist(), stored['latitudes'], stored['longitudes'], matrix)
+
+    weights = build_region_weights(regions, latitudes, longitudes, resolution)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Unique per process: parallel pipeline workers may build the same weights
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(
+        tmp_path, names=np.array(weights.names), latitudes=weights.latitudes,
+        longitudes=weights.longitudes, data=weights.matrix.data, indices=weights.matrix.indices,
+        indptr=weights.matrix.indptr, shape=np.array(weights.matrix.shape)
+    )
+    os.replace(tmp_path, path)
+    return weights
+
+def grid_weights(data, regions, lat_dim='latitude', lon_dim='longitude', cache_dir=WEIGHTS_DIR):
+    """Weights of all regions for the grid of data, built in one batch (resolution from the grid)"""
+    return load_region_weights(regions, data[lat_dim].values, data[lon_dim].values, cache_dir,
+                               resolution=grid_resolution(data, lat_dim, lon_dim))
+
+def _apply_weights(values, matrix):
+    """(..., lat, lon) -> (..., region); missing cells are dropped and the weights renormalized"""
+    flat = values.reshape(-1, values.shape[-2] * values.shape[-1])
+    valid = ~np.isnan(flat)
+    totals = (matrix @ np.where(valid, flat, 0.0).T).T
+    coverage = (matrix @ valid.T.astype(float)).T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / coverage
+    return means.reshape(values.shape[:-2] + (matrix.shape[0],))
+
+def _weight_block(matrix, lat_index, lon_index, n_lon):
+    """Dense (region, lat, lon) weights of one block of grid cells"""
+    cells = (lat_index[:, None] * n_lon + lon_index[None, :]).ravel()
+    return matrix[:, cells].toarray().reshape(matrix.shape[0], len(lat_index), len(lon_index))
+
+def _chunked_weights(weights, lat_chunks, lon_chunks, lat_dim, lon_dim):
+    """
+    Weights as a (region, lat, lon) dask array in the data's spatial
+    chunks; each block is densified from the sparse matrix when computed
+    """
+    import dask
+    import dask.array as da
+
+    matrix = dask.delayed(weights.matrix)
+    lat_starts, lon_starts = np.cumsum((0,) + lat_chunks), np.cumsum((0,) + lon_chunks)
+    blocks = [[da.from_delayed(
+        dask.delayed(_weight_block)(matrix, np.arange(lat_start, lat_end), np.arange(lon_start, lon_end),
+                                    len(weights.longitudes)),
+        shape=(len(weights.names), lat_end - lat_start, lon_end - lon_start), dtype=np.float64)
+        for lon_start, lon_end in zip(lon_starts[:-1], lon_starts[1:])]
+        for lat_start, lat_end in zip(lat_starts[:-1], lat_starts[1:])]
+    return xr.DataArray(da.block(blocks), dims=('region', lat_dim, lon_dim))
+
+def _blockwise_mean(data, weights, lat_dim, lon_dim):
+    """
+    Regional means of a dask-backed DataArray: weighted sums and weights
+    of valid cells are contracted per spatial chunk and summed across
+    chunks, so no task needs more than one chunk of the grid
+    """
+    chunks = dict(zip(data.dims, data.chunks))
+    matrix = _chunked_weights(weights, chunks[lat_dim], chunks[lon_dim], lat_dim, lon_dim)
+    spatial = {DOT_DIM: [lat_dim, lon_dim]}
+    totals = xr.dot(data.fillna(0.0), matrix, **spatial)
+    coverage = xr.dot(data.notnull().astype(np.float64), matrix, **spatial)
+    return (totals / coverage).transpose(..., 'region')
+
+def regional_mean(data, weights, lat_dim='latitude', lon_dim='longitude'):
+    """
+    Area-weighted mean of every region in one sparse product
+
+    data: DataArray or Dataset on the weights' grid. Dask input stays lazy
+    and keeps its lat/lon chunks (reduced blockwise, see _blockwise_mean).
+    The lat/lon dimensions are replaced by a 'region' dimension.
+    """
+    lats, lons = data[lat_dim].values, data[lon_dim].values
+    if not (lats.shape == weights.latitudes.shape and lons.shape == weights.longitudes.shape and
+            np.allclose(lats, weights.latitudes) and np.allclose(lons, weights.longitudes)):
+        raise ValueError("Data grid does not match the grid the region weights were built for")
+
+    if data.chunks:
+        if isinstance(data, xr.Dataset):
+            means = data.map(_blockwise_mean, weights=weights, lat_dim=lat_dim, lon_dim=lon_dim)
+        else:
+            means = _blockwise_mean(data, weights, lat_dim, lon_dim)
+        return means.assign_coords(region=weights.names)
+    return xr.apply_ufunc(
+        _apply_weights, data,
+        input_core_dims=[[lat_dim, lon_dim]],
+        output_core_dims=[['region']],
+        kwargs={'matrix': weights.matrix},
+        dask='parallelized',
+        dask_gufunc_kwargs={'output_sizes': {'region': len(weights.names)}},
+        output_dtypes=[np.float64]
+    ).assign_coords(region=weights.names)
@@ -0,0 +1,86 @@
+"""
+Unattended batch runs over the region registry
+Select regions by name, tag or bounding box, then download, update or process them
+
+Usage:
+    python src/run_regions.py list [--tags vestland]
+    python src/run_regions.py download [--regions bergen oslo] [--workers 8]
+    python src/run_regions.py update [--end 2024-06-30]
+    python src/run_regions.py process [--within 62 58 12 4] [--lazy]
+    python src/run_regions.py climatology --registry regions.geojson
+"""
+
+import argparse
+import sys
+
+from region_registry import REGISTRY_FILE, load_registry
+
+def select_regions(args, registry):
+    """Regions matching the command-line filters"""
+    bbox = dict(zip(['north', 'south', 'east', 'west'], args.within)) if args.within else None
+    return registry.bboxes(registry.select(names=args.regions, tags=args.tags, bbox=bbox))
+
+def run_list(args, registry, regions):
+    for name, bbox in regions.items():
+        print(f"  {name:20s} N{bbox['north']:.2f} S{bbox['south']:.2f} E{bbox['east']:.2f} W{bbox['west']:.2f}")
+    return True
+
+def run_download(args, registry, regions):
+    from download_ecmwf import download_all
+    return download_all(regions, max_workers=args.workers, max_retries=args.retries)
+
+def run_update(args, registry, regions):
+    from incremental_download import update_all
+    return update_all(args.end, regions=regions)
+
+def run_process(args, registry, regions):
+    from process_forecasts import main as process_main
+    results = process_main(list(regions), lazy=args.lazy, n_workers=args.workers, registry=registry)
+    return all(df is not None for df in results.values())
+
+def run_climatology(args, registry, regions):
+    # The store is rebuilt as a whole, so it covers every region of the registry
+    from climatology import main as climatology_main
+    return climatology_main(registry=registry) is not None
+
+COMMANDS = {
+    'list': run_list,
+    'download': run_download,
+    'update': run_update,
+    'process': run_process,
+    'climatology': run_climatology
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Batch download and processing over the region registry")
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--registry', default=REGISTRY_FILE, help="registry file (.toml, .yaml, .geojson)")
+    parser.add_argument('--regions', nargs='+', help="region names")
+    parser.add_argument('--tags', nargs='+', help="regions with any of these tags")
+    parser.add_argument('--within', nargs=4, type=float, metavar=('NORTH', 'SOUTH', 'EAST', 'WEST'),
+                        help="regions overlapping this bounding box")
+    parser.add_argument('--workers', type=int, default=4, help="parallel CDS requests / processing workers")
+    parser.add_argument('--retries', type=int, default=3, help="retries per CDS request")
+    parser.add_argument('--end', help="update: fetch slots up to this date (default: today)")
+    parser.add_argument('--lazy', action='store_true', help="process: out-of-core dask mode for large cubes")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run one batch command; exit status 1 if anything failed"""
+    args = parse_args(argv)
+    try:
+        # Later steps look regions up in this registry, not in the default file
+        registry = load_registry(args.registry)
+        regions = select_regions(args, registry)
+    except KeyError as e:
+        print(f"ERROR: {e.args[0]}")
+        return 1
+    if not regions:
+        print("No regions match the selection")
+        return 1
+
+    print(f"{args.command}: {len(regions)} regions")
+    return 0 if COMMANDS[args.command](args, registry, regions) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
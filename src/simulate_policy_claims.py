@@ -0,0 +1,114 @@
+"""
+Simulate individual policy-level claim events from daily claim counts
+Each claim gets a policy ID, peril, date and severity (NOK)
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from generate_claims import CITY_PROFILES, city_seed_sequence, generate_city_claims
+
+# Peril codes stored in the 'peril' field
+PERILS = ['other', 'natural_peril']
+
+# One record per claim (17 bytes, no per-claim Python objects)
+CLAIM_EVENT_DTYPE = np.dtype([
+    ('policy_id', np.uint32),
+    ('date', 'datetime64[D]'),
+    ('peril', np.uint8),
+    ('severity_nok', np.float32)
+])
+
+# Severity distributions per peril (NOK)
+# Natural perils are heavy tailed (Pareto), other claims lognormal
+SEVERITY_PROFILES = {
+    'natural_peril': {'distribution': 'pareto', 'scale': 20000.0, 'shape': 2.5},
+    'other': {'distribution': 'lognormal', 'mu': 10.2, 'sigma': 1.0}
+}
+
+def draw_severities(peril, n, rng):
+    """Draw n claim severities (NOK) for one peril"""
+    params = SEVERITY_PROFILES[peril]
+    if params['distribution'] == 'pareto':
+        # numpy draws Lomax; shift by 1 for classical Pareto with minimum 'scale'
+        return (rng.pareto(params['shape'], size=n) + 1) * params['scale']
+    if params['distribution'] == 'lognormal':
+        return rng.lognormal(params['mu'], params['sigma'], size=n)
+    raise ValueError(f"Unknown severity distribution: {params['distribution']}")
+
+def simulate_policy_claims(daily, n_policies, rng=None, reference_policies=None):
+    """
+    Expand daily claim counts into individual claim events
+
+    daily: DataFrame with date, total_claims and natural_perils
+    (e.g. from generate_city_claims). If reference_policies is given, the
+    daily counts describe a book of that size and are rescaled to
+    n_policies by Poisson draws around count * n_policies / reference_policies.
+
+    Claims are spread uniformly over policy IDs 0..n_policies-1. All work
+    is done on arrays the size of the claim count, so memory does not
+    grow with n_policies. Returns a CLAIM_EVENT_DTYPE structured array
+    sorted by date.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    dates = daily['date'].values.astype('datetime64[D]')
+    natural = daily['natural_perils'].to_numpy(dtype=np.int64)
+    other = daily['total_claims'].to_numpy(dtype=np.int64) - natural
+
+    if reference_policies is not None:
+        scale = n_policies / reference_policies
+        natural = rng.poisson(natural * scale)
+        other = rng.poisson(other * scale)
+
+    n_natural = int(natural.sum())
+    n_other = int(other.sum())
+
+    claims = np.empty(n_natural + n_other, dtype=CLAIM_EVENT_DTYPE)
+    claims['date'][:n_natural] = np.repeat(dates, natural)
+    claims['date'][n_natural:] = np.repeat(dates, other)
+    claims['peril'][:n_natural] = PERILS.index('natural_peril')
+    claims['peril'][n_natural:] = PERILS.index('other')
+    claims['severity_nok'][:n_natural] = draw_severities('natural_peril', n_natural, rng)
+    claims['severity_nok'][n_natural:] = draw_severities('other', n_other, rng)
+    claims['policy_id'] = rng.integers(0, n_policies, size=len(claims), dtype=np.uint32)
+
+    return claims[np.argsort(claims['date'], kind='stable')]
+
+def summarize_policy_claims(claims):
+    """Per-peril claim counts and severity statistics"""
+    df = pd.DataFrame({
+        'peril': np.array(PERILS)[claims['peril']],
+        'severity_nok': claims['severity_nok']
+    })
+    return df.groupby('peril')['severity_nok'].agg(['count', 'sum', 'mean', 'median', 'max'])
+
+def main():
+    """Simulate a 5M-policy Bergen portfolio over 2014-2021"""
+    print("="*60)
+    print("SIMULATING POLICY-LEVEL CLAIM EVENTS")
+    print("="*60)
+
+    n_policies = 5_000_000
+    reference_policies = 20_000
+    rng = np.random.default_rng(city_seed_sequence('bergen'))
+
+    print("\nGenerating Bergen daily claims...")
+    daily = generate_city_claims(CITY_PROFILES['bergen'], rng=rng)
+
+    print(f"Expanding to {n_policies:,} policies (reference book: {reference_policies:,} policies)...")
+    start = time.perf_counter()
+    claims = simulate_policy_claims(daily, n_policies, rng, reference_policies)
+    elapsed = time.perf_counter() - start
+
+    print(f"  ✓ {len(claims):,} claims in {elapsed:.1f}s ({claims.nbytes / 1e6:.1f} MB)")
+    print(f"\n{summarize_policy_claims(claims).to_string()}")
+
+    output_file = '/Users/giulio/portfolio1-norway/data/synthetic/bergen_policy_claims_2014-2021.npy'
+    np.save(output_file, claims)
+    print(f"\n✓ Saved to: {output_file}")
+
+if __name__ == "__main__":
+    main()
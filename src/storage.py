@@ -0,0 +1,44 @@
+"""
+Columnar Parquet storage for claims and processed tables
+Typed, compressed datasets partitioned by city/year (hive layout)
+"""
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Dataset locations
+SYNTHETIC_DIR = '/Users/giulio/portfolio1-norway/data/synthetic'
+PROCESSED_DIR = '/Users/giulio/portfolio1-norway/data/processed'
+
+def write_dataset(df, path, partition_cols=('city',), compression='zstd'):
+    """
+    Write a DataFrame as a partitioned Parquet dataset
+
+    Column dtypes are stored in the Parquet schema, so readers get typed
+    columns back without parsing. Only the partitions present in df are
+    replaced; other partitions (e.g. other cities) are kept.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    ds.write_dataset(
+        table,
+        path,
+        format='parquet',
+        partitioning=list(partition_cols),
+        partitioning_flavor='hive',
+        existing_data_behavior='delete_matching',
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression)
+    )
+    return path
+
+def read_dataset(path, columns=None, filters=None):
+    """
+    Read a partitioned Parquet dataset into a DataFrame
+
+    columns: project only these columns (partition columns included)
+    filters: predicates pushed down to partitions and row groups, in
+    pandas/pyarrow form, e.g. [('city', '=', 'oslo'), ('year', '>=', 2016)]
+    """
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
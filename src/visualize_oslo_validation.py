@@ -3,14 +3,15 @@ Create Visualizations for Oslo Validation
 Real claims vs. real precipitation
 """
 
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 from scipy.stats import pearsonr
 
+from storage import read_dataset
+
 # Load merged data
-df = pd.read_csv('data/processed/oslo_merged_claims_precip_2014-2021.csv')
+df = read_dataset('data/processed/merged_claims_precip', filters=[('city', '=', 'oslo')])
 
 # Set style
 sns.set_style('whitegrid')
@@ -0,0 +1,107 @@
+"""
+DownloadScheduler against LocalCDSClient: retries, backoff, timeouts and
+resuming from the status file
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import cds_scheduler
+from cds_scheduler import DownloadScheduler, DownloadTask, LocalCDSClient
+
+DATASET = 'reanalysis-era5-single-levels-monthly-means'
+
+@pytest.fixture
+def fixture_dir(tmp_path):
+    path = tmp_path / 'fixtures'
+    path.mkdir()
+    (path / f'{DATASET}.nc').write_bytes(b'fixture')
+    return str(path)
+
+def make_task(tmp_path, month='01'):
+    return DownloadTask(name='era5_oslo', dataset=DATASET,
+                        request={'variable': 'total_precipitation', 'month': month},
+                        target=str(tmp_path / 'out' / 'era5_oslo.nc'))
+
+def make_scheduler(tmp_path, client, **kwargs):
+    kwargs.setdefault('backoff_base', 0.0)
+    return DownloadScheduler(str(tmp_path / 'status.json'), client_factory=lambda: client, **kwargs)
+
+def part_files(task):
+    return glob.glob(f"{task.target}.part*")
+
+def test_retries_until_success(tmp_path, fixture_dir):
+    client = LocalCDSClient(fixture_dir, failures=2)
+    task = make_task(tmp_path)
+
+    assert make_scheduler(tmp_path, client, max_retries=3).run([task]) == {'era5_oslo': True}
+    assert client.calls == 3
+    assert open(task.target, 'rb').read() == b'fixture'
+    assert not part_files(task)
+
+    status = json.load(open(tmp_path / 'status.json'))['era5_oslo']
+    assert status['status'] == 'done' and status['attempts'] == 3 and status['error'] is None
+
+def test_gives_up_after_max_retries(tmp_path, fixture_dir):
+    client = LocalCDSClient(fixture_dir, failures=10)
+    task = make_task(tmp_path)
+
+    assert make_scheduler(tmp_path, client, max_retries=2).run([task]) == {'era5_oslo': False}
+    assert client.calls == 3
+    assert not os.path.exists(task.target)
+    assert not part_files(task)
+
+    status = json.load(open(tmp_path / 'status.json'))['era5_oslo']
+    assert status['status'] == 'failed' and 'Simulated CDS failure' in status['error']
+
+def test_exponential_backoff_is_capped(tmp_path, fixture_dir, monkeypatch):
+    delays = []
+    monkeypatch.setattr(cds_scheduler.time, 'sleep', lambda seconds: seconds and delays.append(seconds))
+    client = LocalCDSClient(fixture_dir, failures=4)
+
+    scheduler = make_scheduler(tmp_path, client, max_retries=4, backoff_base=10.0, backoff_max=35.0)
+    assert scheduler.run_task(make_task(tmp_path))
+    assert delays == [10.0, 20.0, 35.0, 35.0]
+
+def test_timeout_abandons_attempt(tmp_path, fixture_dir):
+    client = LocalCDSClient(fixture_dir, delay=0.5)
+    task = make_task(tmp_path)
+
+    assert not make_scheduler(tmp_path, client, max_retries=0, timeout=0.05).run_task(task)
+    status = json.load(open(tmp_path / 'status.json'))['era5_oslo']
+    assert 'exceeded' in status['error']
+
+    # The abandoned request finishes later: its file is discarded, not renamed
+    time.sleep(1.0)
+    assert not os.path.exists(task.target)
+    assert not part_files(task)
+
+def test_resume_skips_completed_tasks(tmp_path, fixture_dir):
+    task = make_task(tmp_path)
+    assert make_scheduler(tmp_path, LocalCDSClient(fixture_dir)).run_task(task)
+
+    # A new run with the same status file does not contact CDS again
+    client = LocalCDSClient(fixture_dir, failures=10)
+    assert make_scheduler(tmp_path, client, max_retries=0).run_task(task)
+    assert client.calls == 0
+
+    # A changed request is downloaded again
+    client = LocalCDSClient(fixture_dir)
+    assert make_scheduler(tmp_path, client).run_task(make_task(tmp_path, month='02'))
+    assert client.calls == 1
+
+def test_resume_counts_previous_attempts(tmp_path, fixture_dir):
+    task = make_task(tmp_path)
+    assert not make_scheduler(tmp_path, LocalCDSClient(fixture_dir, failures=10), max_retries=1).run_task(task)
+
+    client = LocalCDSClient(fixture_dir)
+    assert make_scheduler(tmp_path, client, max_retries=1).run_task(task)
+    assert client.calls == 1
+    assert json.load(open(tmp_path / 'status.json'))['era5_oslo']['attempts'] == 3
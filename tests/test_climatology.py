@@ -0,0 +1,70 @@
+"""
+Climatology store built from hindcasts: one entry per lead, thresholds
+read from the memory-mapped array, std consistent with the in-sample
+fallback
+"""
+
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+xr = pytest.importorskip('xarray')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import process_forecasts
+from climatology import NO_LEAD, ClimatologyStore, build_climatology
+from region_registry import Region
+from region_weights import grid_weights
+
+@pytest.fixture
+def cube(tmp_path):
+    inits = pd.date_range('1993-01-01', '2016-10-01', freq='QS')
+    hindcasts = xr.DataArray(
+        np.random.default_rng(0).gamma(2.0, 30.0, (len(inits), 3, 5, 2, 2)),
+        dims=('forecast_reference_time', 'forecastMonth', 'number', 'latitude', 'longitude'),
+        coords={'forecast_reference_time': inits, 'forecastMonth': [1, 2, 3], 'number': range(5),
+                'latitude': [60.5, 60.0], 'longitude': [5.0, 5.5]}
+    )
+    regions = [Region('bergen', {'north': 60.5, 'south': 60.0, 'east': 5.5, 'west': 5.0})]
+    weights = grid_weights(hindcasts, regions, cache_dir=str(tmp_path / 'weights'))
+    return process_forecasts.build_forecast_cube(hindcasts, weights)
+
+@pytest.fixture
+def store(cube, tmp_path):
+    totals = xr.concat([process_forecasts.quarterly_forecast(cube).expand_dims(lead=[NO_LEAD]),
+                        process_forecasts.lead_forecast(cube)], dim='lead')
+    path = build_climatology(totals).save(str(tmp_path / 'climatology'))
+    return ClimatologyStore.open(path)
+
+def test_store_has_every_lead(store):
+    assert store.labels['lead'] == [NO_LEAD, 1, 2, 3]
+    assert isinstance(store.values, np.memmap)
+
+def test_thresholds_match_full_array(store, cube):
+    init = cube['init'][:6]
+    thresholds = store.thresholds(['bergen'], init, ['p80', 'p90'], lead=2)
+    expected = store.to_dataarray().sel(region=['bergen'], lead=2, statistic=['p80', 'p90'],
+                                        quarter=init.dt.quarter)
+    assert thresholds.dims == ('region', 'init', 'statistic')
+    np.testing.assert_allclose(thresholds.values, expected.values)
+
+def test_std_matches_in_sample_fallback():
+    years = np.repeat(np.arange(1993, 2017), 4)
+    quarters = np.tile([1, 2, 3, 4], 24)
+    values = np.random.default_rng(1).gamma(2.0, 50.0, len(years))
+    df = pd.DataFrame({'year': years, 'quarter': quarters, 'precip_mm': values})
+    totals = xr.DataArray(values[None], dims=('region', 'period'),
+                          coords={'region': ['oslo'], 'period': [f"{y} Q{q}" for y, q in zip(years, quarters)],
+                                  'year': ('period', years),
+                                  'quarter': ('period', quarters)})
+
+    stored = process_forecasts.calculate_precipitation_anomalies(
+        df, climatology=build_climatology(totals), region='oslo')
+    in_sample = process_forecasts.calculate_precipitation_anomalies(df)
+
+    np.testing.assert_allclose(stored.sort_values(['year', 'quarter'])['clim_std'],
+                               in_sample.sort_values(['year', 'quarter'])['clim_std'])
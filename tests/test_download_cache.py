@@ -0,0 +1,58 @@
+"""
+DownloadCache and CachedClient: request keys and cleanup of failed downloads
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from download_cache import CachedClient, DownloadCache, request_key
+
+DATASET = 'reanalysis-era5-single-levels-monthly-means'
+
+class FailingClient:
+    """Writes part of the target, then fails"""
+
+    def retrieve(self, dataset, request, target):
+        with open(target, 'wb') as f:
+            f.write(b'partial')
+        raise ConnectionError("connection reset")
+
+class FixtureClient:
+    def __init__(self):
+        self.calls = 0
+
+    def retrieve(self, dataset, request, target):
+        self.calls += 1
+        with open(target, 'wb') as f:
+            f.write(b'fixture')
+
+def test_request_key_normalizes_values():
+    assert request_key(DATASET, {'year': '2014', 'month': 1}) == \
+        request_key(DATASET, {'month': ['1'], 'year': ['2014']})
+    assert request_key(DATASET, {'area': [60, 5, 59, 10]}) != \
+        request_key(DATASET, {'area': [59, 5, 60, 10]})
+
+def test_failed_download_leaves_no_part_file(tmp_path):
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    client = CachedClient(FailingClient(), cache)
+
+    with pytest.raises(ConnectionError):
+        client.retrieve(DATASET, {'month': '01'}, str(tmp_path / 'out.nc'))
+
+    assert os.listdir(cache.cache_dir) == []
+    assert not (tmp_path / 'out.nc').exists()
+
+def test_equivalent_request_is_served_from_cache(tmp_path):
+    cache = DownloadCache(str(tmp_path / 'cache'))
+    fixture = FixtureClient()
+    client = CachedClient(fixture, cache)
+
+    client.retrieve(DATASET, {'month': '01'}, str(tmp_path / 'a.nc'))
+    client.retrieve(DATASET, {'month': ['01']}, str(tmp_path / 'b.nc'))
+
+    assert fixture.calls == 1
+    assert (tmp_path / 'b.nc').read_bytes() == b'fixture'
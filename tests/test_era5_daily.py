@@ -0,0 +1,61 @@
+"""
+DailyReducer: daily totals and rolling accumulations must not depend on
+how the hourly record is split into blocks
+"""
+
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+pytest.importorskip('xarray')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from era5_daily import ACCUMULATION_DAYS, DailyReducer
+
+REGIONS = ['oslo', 'bergen']
+
+@pytest.fixture
+def hourly():
+    times = pd.date_range('2014-01-01 01:00', '2014-03-01 00:00', freq='h')
+    values = np.random.default_rng(7).gamma(0.3, 1.5, size=(len(times), len(REGIONS)))
+    return times, values
+
+def reduce_in_blocks(times, values, block_hours):
+    reducer = DailyReducer(REGIONS)
+    for start in range(0, len(times), block_hours):
+        reducer.update(times[start:start + block_hours], values[start:start + block_hours])
+    return reducer.finish()
+
+def expected_daily(times, values):
+    # Hours ending at 00:00 belong to the previous day
+    days = (times - pd.Timedelta(hours=1)).normalize()
+    frames = []
+    for i, region in enumerate(REGIONS):
+        daily = pd.Series(values[:, i], index=days).groupby(level=0).sum()
+        frame = pd.DataFrame({'region': region, 'date': daily.index, 'precip_mm': daily.values})
+        for window in ACCUMULATION_DAYS:
+            frame[f'precip_{window}d_mm'] = daily.rolling(window).sum().values
+        frames.append(frame)
+    return pd.concat(frames).sort_values(['region', 'date'], kind='stable', ignore_index=True)
+
+@pytest.mark.parametrize('block_hours', [1, 13, 37, 24 * 31, 10_000])
+def test_block_size_does_not_change_result(hourly, block_hours):
+    times, values = hourly
+    daily = reduce_in_blocks(times, values, block_hours)
+    expected = expected_daily(times, values)
+
+    columns = ['precip_mm'] + [f'precip_{window}d_mm' for window in ACCUMULATION_DAYS]
+    assert daily['region'].tolist() == expected['region'].tolist()
+    assert (daily['date'].values == expected['date'].values).all()
+    np.testing.assert_allclose(daily[columns].to_numpy(), expected[columns].to_numpy())
+
+def test_hours_out_of_order_are_rejected(hourly):
+    times, values = hourly
+    reducer = DailyReducer(REGIONS)
+    reducer.update(times[48:72], values[48:72])
+    with pytest.raises(ValueError):
+        reducer.update(times[:24], values[:24])
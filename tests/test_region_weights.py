@@ -0,0 +1,34 @@
+"""
+Region weights on single-cell grids (no coordinate spacing, no GRIB
+increments)
+"""
+
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+xr = pytest.importorskip('xarray')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from region_registry import Region
+from region_weights import grid_resolution, grid_weights, regional_mean
+
+OSLO = Region('oslo', {'north': 60.0, 'south': 59.8, 'east': 10.9, 'west': 10.6})
+
+@pytest.fixture
+def single_cell():
+    return xr.DataArray(np.array([[[1.0]], [[3.0]]]), dims=('time', 'latitude', 'longitude'),
+                        coords={'latitude': [59.9], 'longitude': [10.75]})
+
+def test_single_cell_grid_has_no_resolution(single_cell):
+    assert grid_resolution(single_cell) is None
+
+def test_single_cell_takes_all_weight(single_cell, tmp_path):
+    weights = grid_weights(single_cell, [OSLO], cache_dir=str(tmp_path))
+    means = regional_mean(single_cell, weights)
+    np.testing.assert_allclose(means.sel(region='oslo').values, [1.0, 3.0])
+    np.testing.assert_allclose(regional_mean(single_cell.chunk({'time': 1}), weights).values,
+                               means.values)
@@ -0,0 +1,65 @@
+"""
+Batch runs over a registry other than config/regions.toml: the chosen
+registry is used by every step, not only to select regions
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import run_regions
+from region_registry import load_registry
+
+REGISTRY = """
+[regions.tromso]
+north = 69.8
+south = 69.6
+east = 19.1
+west = 18.8
+tags = ["nordland"]
+"""
+
+@pytest.fixture
+def registry_file(tmp_path):
+    path = tmp_path / 'regions.toml'
+    path.write_text(REGISTRY)
+    return str(path)
+
+def test_list_selects_from_custom_registry(registry_file, capsys):
+    assert run_regions.main(['list', '--registry', registry_file, '--tags', 'nordland']) == 0
+    assert 'tromso' in capsys.readouterr().out
+
+def test_process_uses_custom_registry(registry_file, monkeypatch):
+    pytest.importorskip('xarray')
+    import process_forecasts
+
+    seen = {}
+
+    def process_city_data(city, lazy=False, n_workers=None, registry=None):
+        seen[city] = registry
+        return process_forecasts.pd.DataFrame()
+    monkeypatch.setattr(process_forecasts, 'process_city_data', process_city_data)
+
+    assert run_regions.main(['process', '--registry', registry_file]) == 0
+    assert list(seen) == ['Tromso']
+    assert 'tromso' in seen['Tromso']
+
+def test_city_weights_of_custom_region(registry_file, tmp_path, monkeypatch):
+    np = pytest.importorskip('numpy')
+    xr = pytest.importorskip('xarray')
+    import process_forecasts
+    import region_weights
+
+    monkeypatch.setattr(process_forecasts, 'grid_weights',
+                        lambda data, regions: region_weights.grid_weights(data, regions,
+                                                                         cache_dir=str(tmp_path / 'weights')))
+    data = xr.DataArray(np.ones((3, 3)), dims=('latitude', 'longitude'),
+                        coords={'latitude': [69.9, 69.7, 69.5], 'longitude': [18.7, 18.95, 19.2]})
+
+    weights = process_forecasts.city_weights('Tromso', data, load_registry(registry_file))
+
+    assert weights.names == ['tromso']
+    assert weights.matrix.sum() == pytest.approx(1.0)